@@ -1,5 +1,7 @@
 import numpy as np
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import gmsh
 
 
@@ -10,14 +12,56 @@ def triangle_max_edge(x):
     return np.maximum(a, np.maximum(b, c))
 
 
+def tag_index(tags, query, dtype=np.int64):
+    """
+    Translate gmsh tags in query to positions in tags without building a
+    Python dict: a dense lookup array when the tags are compact (the usual
+    case for gmsh), a sorted search otherwise. A tag of query missing from
+    tags raises KeyError, as the dict did
+    """
+    tags = np.asarray(tags)
+    query = np.asarray(query)
+    n = tags.shape[0]
+    if query.size == 0:
+        return np.empty(query.shape, dtype=dtype)
+    if n == 0:
+        raise KeyError(int(query.flat[0]))
+    max_tag = int(tags.max())
+    if max_tag <= 2 * n + 1024:
+        # min/max reductions keep the checks free of query-sized temporaries
+        if query.min() < 0 or query.max() > max_tag:
+            bad = (query < 0) | (query > max_tag)
+            raise KeyError(int(query[bad].flat[0]))
+        lookup = np.full(max_tag + 1, -1, dtype=dtype)
+        lookup[tags] = np.arange(n, dtype=dtype)
+        result = lookup[query]
+        if result.min() < 0:
+            raise KeyError(int(query[result < 0].flat[0]))
+        return result
+    order = np.argsort(tags)
+    pos = np.minimum(np.searchsorted(tags, query, sorter=order), n - 1)
+    result = order[pos].astype(dtype, copy=False)
+    missing = tags[result] != query
+    if missing.any():
+        raise KeyError(int(query[missing].flat[0]))
+    return result
+
+
 class Mesh:
-    def __init__(self):
-        self.vtags, vxyz, _ = gmsh.model.mesh.getNodes()
-        self.vxyz = vxyz.reshape((-1, 3))
-        vmap = dict({j: i for i, j in enumerate(self.vtags)})
-        self.triangles_tags, evtags = gmsh.model.mesh.getElementsByType(2)
-        evid = np.array([vmap[j] for j in evtags])
-        self.triangles = evid.reshape((self.triangles_tags.shape[-1], -1))
+    __slots__ = ("vtags", "vxyz", "triangles_tags", "triangles")
+
+    def __init__(self, vtags=None, vxyz=None, triangles_tags=None, evtags=None,
+                 index_dtype=np.int64, coord_dtype=np.float64):
+        # read the current gmsh model unless the arrays are given
+        if vtags is None:
+            vtags, vxyz, _ = gmsh.model.mesh.getNodes()
+            triangles_tags, evtags = gmsh.model.mesh.getElementsByType(2)
+        self.vtags = vtags
+        # reshape is a view; astype only copies when narrowing to float32
+        self.vxyz = vxyz.reshape((-1, 3)).astype(coord_dtype, copy=False)
+        self.triangles_tags = triangles_tags
+        evid = tag_index(vtags, evtags, index_dtype)
+        self.triangles = evid.reshape((triangles_tags.shape[-1], -1))
 
 
 def my_function(xyz):
@@ -26,17 +70,37 @@ def my_function(xyz):
     return f
 
 
-def compute_interpolation_error(nodes, triangles, f):
+def compute_interpolation_error(nodes, triangles, f, block_size=1 << 16,
+                                num_threads=1):
+    # the triangles are walked in contiguous blocks with a preallocated output,
+    # so the quadrature points and temporaries only ever exist for one block
+    # per thread. gmsh.model.mesh.getJacobians returns full-length vectors even
+    # when split into tasks, so the quadrature points and Jacobian determinants
+    # of the (affine) 3-node triangles are computed here from the vertices
     uvw, weights = gmsh.model.mesh.getIntegrationPoints(2, "Gauss2")
-    jac, det, pt = gmsh.model.mesh.getJacobians(2, uvw)
     numcomp, sf, _ = gmsh.model.mesh.getBasisFunctions(2, uvw, "Lagrange")
     sf = sf.reshape((weights.shape[0], -1))
-    qx = pt.reshape((triangles.shape[0], -1, 3))
-    det = np.abs(det.reshape((triangles.shape[0], -1)))
+    num_elements = triangles.shape[0]
     f_vert = f(nodes)
-    f_fem = np.dot(f_vert[triangles], sf)
-    err_tri = np.sum((f_fem - f(qx))**2 * det * weights, 1)
-    return f_vert, np.sqrt(err_tri)
+    err_tri = np.empty(num_elements)
+
+    def block(begin):
+        end = min(begin + block_size, num_elements)
+        tri = triangles[begin:end]
+        x = nodes[tri]
+        qx = np.einsum("gi,eid->egd", sf, x)
+        det = np.linalg.norm(np.cross(x[:, 1] - x[:, 0], x[:, 2] - x[:, 0]), axis=1)
+        f_fem = np.dot(f_vert[tri], sf)
+        err_tri[begin:end] = np.sum((f_fem - f(qx))**2 * det[:, None] * weights, 1)
+
+    blocks = range(0, num_elements, block_size)
+    if num_threads > 1:
+        with ThreadPoolExecutor(num_threads) as pool:
+            list(pool.map(block, blocks))
+    else:
+        for begin in blocks:
+            block(begin)
+    return f_vert, np.sqrt(err_tri, out=err_tri)
 
 def compute_size_field(nodes, triangles, err, N):
     x = nodes[triangles]
@@ -52,87 +116,265 @@ def compute_size_field(nodes, triangles, err, N):
     return triangle_max_edge(x) / ri
 
 
-print("Usage: adapt_mesh [initial lc] [target #elements] [dump files]")
-
-lc = 0.02
-N = 10000
-dumpfiles = False
-gui = True
-
-argv = sys.argv
-if '-nopopup' in sys.argv:
-    gui = False
-    argv.remove('-nopopup')
-
-if len(argv) > 1: lc = float(sys.argv[1])
-if len(argv) > 2: N = int(sys.argv[2])
-if len(argv) > 3: dumpfiles = int(sys.argv[3])
-
-gmsh.initialize()
-
-# create a geometrical gmsh.model
-gmsh.model.add("square")
-square = gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
-gmsh.model.occ.synchronize()
-
-# create intial uniform mesh
-pnts = gmsh.model.getBoundary([(2, square)], True, True, True)
-gmsh.model.mesh.setSize(pnts, lc)
-#gmsh.option.setNumber('Mesh.Algorithm', 6) # Frontal
-gmsh.model.mesh.generate(2)
-if dumpfiles: gmsh.write("mesh.msh")
-mesh = Mesh()
-
-# compute and visualize the interpolation error
-f_nod, err_ele = compute_interpolation_error(mesh.vxyz, mesh.triangles,
-                                             my_function)
-f_view = gmsh.view.add("nodal function")
-gmsh.view.addModelData(f_view, 0, "square", "NodeData", mesh.vtags,
-                       f_nod[:, None])
-if dumpfiles: gmsh.view.write(f_view, "f.pos")
-err_view = gmsh.view.add("element-wise error")
-gmsh.view.addModelData(err_view, 0, "square", "ElementData",
-                       mesh.triangles_tags, err_ele[:, None])
-if dumpfiles: gmsh.view.write(err_view, "err.pos")
-
-# compute and visualize the remeshing size field
-sf_ele = compute_size_field(mesh.vxyz, mesh.triangles, err_ele, N)
-sf_view = gmsh.view.add("mesh size field")
-gmsh.view.addModelData(sf_view, 0, "square", "ElementData",
-                       mesh.triangles_tags, sf_ele[:, None])
-gmsh.plugin.setNumber("Smooth", "View", gmsh.view.getIndex(sf_view))
-gmsh.plugin.run("Smooth")
-if dumpfiles: gmsh.view.write(sf_view, "sf.pos")
-
-# create a new gmsh.model (to remesh the original gmsh.model in-place, the size field
-# should be created as a list-based view)
-gmsh.model.add("square2")
-gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
-gmsh.model.occ.synchronize()
-
-# mesh the new gmsh.model using the size field
-bg_field = gmsh.model.mesh.field.add("PostView")
-gmsh.model.mesh.field.setNumber(bg_field, "ViewTag", sf_view)
-gmsh.model.mesh.field.setAsBackgroundMesh(bg_field)
-#gmsh.option.setNumber('Mesh.Algorithm', 2) # Delaunay
-gmsh.model.mesh.generate(2)
-if dumpfiles: gmsh.write("mesh2.msh")
-mesh2 = Mesh()
-
-# compute and visualize the interpolation error on the adapted mesh
-f2_nod, err2_ele = compute_interpolation_error(mesh2.vxyz, mesh2.triangles,
-                                               my_function)
-f2_view = gmsh.view.add("nodal function on adapted mesh")
-gmsh.view.addModelData(f2_view, 0, "square2", "NodeData", mesh2.vtags,
-                       f2_nod[:, None])
-if dumpfiles: gmsh.view.write(f2_view, "f2.pos")
-err2_view = gmsh.view.add("element-wise error on adapated mesh")
-gmsh.view.addModelData(err2_view, 0, "square2", "ElementData",
-                       mesh2.triangles_tags, err2_ele[:, None])
-if dumpfiles: gmsh.view.write(err2_view, "err2.pos")
-
-# show everything in the gui
-if gui:
-    gmsh.fltk.run()
-
-gmsh.finalize()
+def p1_gradients(nodes, triangles, f_vert):
+    # constant gradient of the linear interpolant of f_vert on each triangle,
+    # for any trailing shape of f_vert; also returns the triangle areas
+    x = nodes[triangles][..., :2]
+    e1 = x[:, 1] - x[:, 0]
+    e2 = x[:, 2] - x[:, 0]
+    det = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    f = f_vert[triangles]
+    d1 = f[:, 1] - f[:, 0]
+    d2 = f[:, 2] - f[:, 0]
+    # solve [e1; e2] g = [d1; d2] for every triangle
+    gx = (e2[:, 1] * d1.T - e1[:, 1] * d2.T) / det
+    gy = (e1[:, 0] * d2.T - e2[:, 0] * d1.T) / det
+    return np.stack([gx.T, gy.T], axis=-1), np.abs(det) / 2
+
+
+def recover_nodal(num_nodes, triangles, area, values):
+    # area-weighted average of element values on the surrounding nodes
+    shape = values.shape[1:]
+    values = values.reshape(values.shape[0], -1)
+    tri = triangles.ravel()
+    weight = np.bincount(tri, np.repeat(area, 3), num_nodes)
+    out = np.empty((num_nodes, values.shape[1]))
+    for c in range(values.shape[1]):
+        out[:, c] = np.bincount(tri, np.repeat(area * values[:, c], 3), num_nodes)
+    return (out / weight[:, None]).reshape((num_nodes,) + shape)
+
+
+def compute_hessian(nodes, triangles, f_vert):
+    # double L2 recovery: nodal gradients from element gradients, then the
+    # symmetrized element gradients of those recovered back to the nodes
+    num_nodes = nodes.shape[0]
+    grad, area = p1_gradients(nodes, triangles, f_vert)
+    grad = recover_nodal(num_nodes, triangles, area, grad)
+    hess, _ = p1_gradients(nodes, triangles, grad)
+    hess = 0.5 * (hess + hess.transpose(0, 2, 1))
+    return recover_nodal(num_nodes, triangles, area, hess)
+
+
+def compute_metric(nodes, triangles, hess, N, p=2, hmin=1e-4, hmax=0.2):
+    """
+    Optimal L^p interpolation metric for the P1 interpolant on a mesh of
+    about N triangles: M = K / C * det|H|^(-1/(2p+2)) |H| with
+    C = int det|H|^(p/(2p+2)) and K = N sqrt(3) / 4 the complexity of N unit
+    equilateral triangles, eigenvalues clipped to [1/hmax^2, 1/hmin^2]
+    """
+    lam, vec = np.linalg.eigh(hess)
+    lam = np.maximum(np.abs(lam), 1e-12)
+    det = lam[:, 0] * lam[:, 1]
+    _, area = p1_gradients(nodes, triangles, np.zeros(nodes.shape[0]))
+    nodal_area = np.bincount(triangles.ravel(), np.repeat(area / 3, 3),
+                             nodes.shape[0])
+    complexity = np.sum(det**(p / (2. * p + 2.)) * nodal_area)
+    lam *= (N * np.sqrt(3.) / 4. / complexity * det**(-1. / (2. * p + 2.)))[:, None]
+    lam = np.clip(lam, 1. / hmax**2, 1. / hmin**2)
+    return np.einsum("nij,nj,nkj->nik", vec, lam, vec)
+
+
+def metric_view(nodes, triangles, metric, hmax=0.2, name="mesh metric field"):
+    # list-based tensor triangle (TT) view, 3x3 tensors with the out-of-plane
+    # direction set to the coarsest size
+    M = np.zeros((nodes.shape[0], 3, 3))
+    M[:, :2, :2] = metric
+    M[:, 2, 2] = 1. / hmax**2
+    x = nodes[triangles]
+    data = np.concatenate([x.transpose(0, 2, 1).reshape(-1, 9),
+                           M[triangles].reshape(-1, 27)], axis=1)
+    view = gmsh.view.add(name)
+    gmsh.view.addListData(view, "TT", triangles.shape[0], data.ravel())
+    return view
+
+
+def size_field_view(nodes, triangles, sf_ele, name="mesh size field"):
+    # list-based view with one scalar triangle (ST) per element: unlike a
+    # model-based view it does not reference the mesh, so the model it was
+    # computed on can be remeshed in place
+    x = nodes[triangles]
+    data = np.concatenate([x.transpose(0, 2, 1).reshape(-1, 9),
+                           np.repeat(sf_ele[:, None], 3, 1)], axis=1)
+    view = gmsh.view.add(name)
+    gmsh.view.addListData(view, "ST", triangles.shape[0], data.ravel())
+    return view
+
+
+def adapt(N, target_error=None, max_elements=None, max_iterations=10,
+          rtol=0.02, f=my_function, anisotropic=False):
+    """
+    Iterate estimate / size field / remesh on the current model until the
+    L2 error norm drops below target_error, the mesh exceeds max_elements,
+    the error stagnates (relative change below rtol) or max_iterations is
+    reached. The model must already hold an initial 2D mesh. With
+    anisotropic=True the remeshing is driven by a Hessian-based metric
+    tensor field (BAMG) instead of the isotropic size field. Returns one
+    record per iteration with element count, error norms and timings
+    """
+    history = []
+    bg_field = gmsh.model.mesh.field.add("PostView")
+    gmsh.model.mesh.field.setAsBackgroundMesh(bg_field)
+    gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 0)
+    if anisotropic:
+        gmsh.option.setNumber("Mesh.Algorithm", 7)
+    t_mesh = 0.
+    for it in range(max_iterations):
+        tic = time.perf_counter()
+        mesh = Mesh()
+        f_nod, err_ele = compute_interpolation_error(mesh.vxyz, mesh.triangles, f)
+        t_estimate = time.perf_counter() - tic
+
+        error = np.sqrt(np.sum(err_ele**2))
+        num_elements = mesh.triangles.shape[0]
+        history.append({"iteration": it, "elements": num_elements,
+                        "nodes": mesh.vtags.shape[0], "error": error,
+                        "max_error": err_ele.max(), "mesh_time": t_mesh,
+                        "estimate_time": t_estimate})
+
+        if target_error is not None and error <= target_error:
+            break
+        if max_elements is not None and num_elements >= max_elements:
+            break
+        if it > 0 and abs(history[-2]["error"] - error) <= rtol * error:
+            break
+        if it == max_iterations - 1:
+            break
+
+        tic = time.perf_counter()
+        if anisotropic:
+            hess = compute_hessian(mesh.vxyz, mesh.triangles, f_nod)
+            metric = compute_metric(mesh.vxyz, mesh.triangles, hess, N)
+            sf_view = metric_view(mesh.vxyz, mesh.triangles, metric)
+            del hess, metric
+        else:
+            sf_ele = compute_size_field(mesh.vxyz, mesh.triangles, err_ele, N)
+            sf_view = size_field_view(mesh.vxyz, mesh.triangles, sf_ele)
+            del sf_ele
+            gmsh.plugin.setNumber("Smooth", "View", gmsh.view.getIndex(sf_view))
+            gmsh.plugin.run("Smooth")
+        del mesh, f_nod, err_ele
+        gmsh.model.mesh.field.setNumber(bg_field, "ViewTag", sf_view)
+        history[-1]["size_field_time"] = time.perf_counter() - tic
+
+        # remesh in place and drop the size field of this iteration
+        tic = time.perf_counter()
+        gmsh.model.mesh.clear()
+        gmsh.model.mesh.generate(2)
+        gmsh.view.remove(sf_view)
+        t_mesh = time.perf_counter() - tic
+
+    gmsh.model.mesh.field.remove(bg_field)
+    return history
+
+
+def main():
+    print("Usage: adapt_mesh [initial lc] [target #elements] [dump files] [-iterate] [-aniso]")
+
+    lc = 0.02
+    N = 10000
+    dumpfiles = False
+    gui = True
+    iterate = False
+    anisotropic = False
+
+    argv = sys.argv
+    if '-nopopup' in sys.argv:
+        gui = False
+        argv.remove('-nopopup')
+    if '-iterate' in sys.argv:
+        iterate = True
+        argv.remove('-iterate')
+    if '-aniso' in sys.argv:
+        anisotropic = True
+        argv.remove('-aniso')
+
+    if len(argv) > 1: lc = float(sys.argv[1])
+    if len(argv) > 2: N = int(sys.argv[2])
+    if len(argv) > 3: dumpfiles = int(sys.argv[3])
+
+    gmsh.initialize()
+
+    # create a geometrical gmsh.model
+    gmsh.model.add("square")
+    square = gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
+    gmsh.model.occ.synchronize()
+
+    # create intial uniform mesh
+    pnts = gmsh.model.getBoundary([(2, square)], True, True, True)
+    gmsh.model.mesh.setSize(pnts, lc)
+    #gmsh.option.setNumber('Mesh.Algorithm', 6) # Frontal
+    gmsh.model.mesh.generate(2)
+    if dumpfiles: gmsh.write("mesh.msh")
+
+    if iterate:
+        # closed-loop adaptation of the square model in place
+        history = adapt(N, anisotropic=anisotropic)
+        print(f"{'iter':>4} {'elements':>9} {'error':>10} {'mesh [s]':>9} {'estimate [s]':>12}")
+        for h in history:
+            print(f"{h['iteration']:>4} {h['elements']:>9} {h['error']:>10.3e} "
+                  f"{h['mesh_time']:>9.3f} {h['estimate_time']:>12.3f}")
+        if dumpfiles: gmsh.write("mesh_adapted.msh")
+        if gui:
+            gmsh.fltk.run()
+        gmsh.finalize()
+        return
+
+    mesh = Mesh()
+
+    # compute and visualize the interpolation error
+    f_nod, err_ele = compute_interpolation_error(mesh.vxyz, mesh.triangles,
+                                                 my_function)
+    f_view = gmsh.view.add("nodal function")
+    gmsh.view.addModelData(f_view, 0, "square", "NodeData", mesh.vtags,
+                           f_nod[:, None])
+    if dumpfiles: gmsh.view.write(f_view, "f.pos")
+    err_view = gmsh.view.add("element-wise error")
+    gmsh.view.addModelData(err_view, 0, "square", "ElementData",
+                           mesh.triangles_tags, err_ele[:, None])
+    if dumpfiles: gmsh.view.write(err_view, "err.pos")
+
+    # compute and visualize the remeshing size field
+    sf_ele = compute_size_field(mesh.vxyz, mesh.triangles, err_ele, N)
+    sf_view = gmsh.view.add("mesh size field")
+    gmsh.view.addModelData(sf_view, 0, "square", "ElementData",
+                           mesh.triangles_tags, sf_ele[:, None])
+    gmsh.plugin.setNumber("Smooth", "View", gmsh.view.getIndex(sf_view))
+    gmsh.plugin.run("Smooth")
+    if dumpfiles: gmsh.view.write(sf_view, "sf.pos")
+
+    # create a new gmsh.model (to remesh the original gmsh.model in-place, the size field
+    # should be created as a list-based view)
+    gmsh.model.add("square2")
+    gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
+    gmsh.model.occ.synchronize()
+
+    # mesh the new gmsh.model using the size field
+    bg_field = gmsh.model.mesh.field.add("PostView")
+    gmsh.model.mesh.field.setNumber(bg_field, "ViewTag", sf_view)
+    gmsh.model.mesh.field.setAsBackgroundMesh(bg_field)
+    #gmsh.option.setNumber('Mesh.Algorithm', 2) # Delaunay
+    gmsh.model.mesh.generate(2)
+    if dumpfiles: gmsh.write("mesh2.msh")
+    mesh2 = Mesh()
+
+    # compute and visualize the interpolation error on the adapted mesh
+    f2_nod, err2_ele = compute_interpolation_error(mesh2.vxyz, mesh2.triangles,
+                                                   my_function)
+    f2_view = gmsh.view.add("nodal function on adapted mesh")
+    gmsh.view.addModelData(f2_view, 0, "square2", "NodeData", mesh2.vtags,
+                           f2_nod[:, None])
+    if dumpfiles: gmsh.view.write(f2_view, "f2.pos")
+    err2_view = gmsh.view.add("element-wise error on adapated mesh")
+    gmsh.view.addModelData(err2_view, 0, "square2", "ElementData",
+                           mesh2.triangles_tags, err2_ele[:, None])
+    if dumpfiles: gmsh.view.write(err2_view, "err2.pos")
+
+    # show everything in the gui
+    if gui:
+        gmsh.fltk.run()
+
+    gmsh.finalize()
+
+
+if __name__ == "__main__":
+    main()
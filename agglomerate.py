@@ -0,0 +1,281 @@
+# Offline agglomeration multigrid hierarchy for the triangular inlet mesh
+#
+#   python agglomerate.py inlet.msh inlet_mg [-levels 6] [-min-cells 100]
+#
+# Level 0 is the finite-volume graph of the mesh: cells (area, centroid),
+# interior faces (cell pair, normal scaled by the face length) and boundary
+# faces (cell, physical group, normal). Each coarser level is built by two
+# passes of pairwise matching, so cells are agglomerated roughly four to one:
+# every cell picks the neighbour it shares the longest face with, and
+# mutual picks are merged. Merges must keep the boundary groups apart: two
+# agglomerates only merge when the groups one touches contain the groups of
+# the other, so no coarse cell spans wall and inlet faces unless a fine cell
+# already did. Coarse faces are the sums of the fine faces they are made of.
+#
+# Every level is written as .npy arrays plus header.json, which the solver
+# can memory-map (see load):
+#   level<l>_cells.npy    (n, 3) area, centroid x, y
+#   level<l>_faces.npy    (m, 2) int32 cell pairs, first < second
+#   level<l>_normals.npy  (m, 2) normals pointing from first to second
+#   level<l>_bfaces.npy   (b, 2) int32 cell, physical group tag
+#   level<l>_bnormals.npy (b, 2) outward normals
+#   level<l>_parent.npy   (n_{l-1},) int32 coarse cell of every level l-1 cell
+
+import json
+import os
+import sys
+import numpy as np
+import gmsh
+from adaptive import tag_index
+
+MAX_LEVELS = 8
+MIN_CELLS = 100
+
+
+class Level:
+    """Finite-volume graph of one multigrid level"""
+
+    def __init__(self, volume, centroid, faces, normals, bfaces, bgroups, bnormals,
+                 mask, parent=None):
+        self.volume, self.centroid = volume, centroid
+        self.faces, self.normals = faces, normals
+        self.bfaces, self.bgroups, self.bnormals = bfaces, bgroups, bnormals
+        # bit k set when the cell has faces on the k-th boundary group
+        self.mask = mask
+        self.parent = parent
+
+    @property
+    def num_cells(self):
+        return self.volume.shape[0]
+
+
+def fine_level(xyz, triangles, lines, groups):
+    """
+    Level 0 from node coordinates (N, 2), triangles (n, 3) and boundary lines:
+    lines[k] is the (l, 2) node array of the physical group with tag groups[k]
+    """
+    x = xyz[triangles]
+    area = 0.5 * ((x[:, 1, 0] - x[:, 0, 0]) * (x[:, 2, 1] - x[:, 0, 1])
+                  - (x[:, 2, 0] - x[:, 0, 0]) * (x[:, 1, 1] - x[:, 0, 1]))
+    volume = np.abs(area)
+    centroid = x.mean(axis=1)
+    n = triangles.shape[0]
+
+    # the three edges of every cell, matched up through their sorted node pairs
+    edges = np.sort(triangles[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+    cells = np.repeat(np.arange(n), 3)
+    num_nodes = xyz.shape[0]
+    key = edges[:, 0] * num_nodes + edges[:, 1]
+    order = np.argsort(key, kind="stable")
+    key, edges, cells = key[order], edges[order], cells[order]
+    pair = np.flatnonzero(key[1:] == key[:-1])
+    single = np.ones(key.shape[0], dtype=bool)
+    single[pair] = single[pair + 1] = False
+
+    def normal(e, c):
+        # edge normal scaled by its length, pointing away from the centroid c
+        d = xyz[e[:, 1]] - xyz[e[:, 0]]
+        nrm = np.stack([d[:, 1], -d[:, 0]], axis=1)
+        mid = 0.5 * (xyz[e[:, 0]] + xyz[e[:, 1]])
+        flip = np.sum(nrm * (mid - c), axis=1) < 0
+        nrm[flip] *= -1
+        return nrm
+
+    faces = np.stack([cells[pair], cells[pair + 1]], axis=1)
+    normals = normal(edges[pair], centroid[faces[:, 0]])
+
+    bedges, bfaces = edges[single], cells[single]
+    bnormals = normal(bedges, centroid[bfaces])
+    bgroups = np.zeros(bfaces.shape[0], dtype=np.int64)
+    bkey = key[single]
+    for tag, line in zip(groups, lines):
+        line = np.sort(line, axis=1)
+        lkey = line[:, 0] * num_nodes + line[:, 1]
+        pos = np.clip(np.searchsorted(bkey, lkey), 0, bkey.shape[0] - 1)
+        pos = pos[bkey[pos] == lkey]
+        bgroups[pos] = tag
+
+    mask = np.zeros(n, dtype=np.int64)
+    for k, tag in enumerate(groups):
+        np.bitwise_or.at(mask, bfaces[bgroups == tag], 1 << k)
+    return Level(volume, centroid, faces, normals, bfaces, bgroups, bnormals, mask)
+
+
+def compatible(a, b):
+    # one agglomerate's boundary groups must contain the other's
+    u = a | b
+    return (u == a) | (u == b)
+
+
+def match(level, rounds=4):
+    """Pairwise aggregation: parent (n,) and the number of aggregates"""
+    n = level.num_cells
+    f0, f1 = level.faces[:, 0], level.faces[:, 1]
+    weight = np.hypot(level.normals[:, 0], level.normals[:, 1])
+    ok = compatible(level.mask[f0], level.mask[f1])
+    src = np.concatenate([f0[ok], f1[ok]])
+    dst = np.concatenate([f1[ok], f0[ok]])
+    w = np.concatenate([weight[ok], weight[ok]])
+
+    parent = np.full(n, -1, dtype=np.int64)
+    count = 0
+    for _ in range(rounds):
+        free = (parent[src] < 0) & (parent[dst] < 0)
+        s, d, ww = src[free], dst[free], w[free]
+        if s.shape[0] == 0:
+            break
+        # heaviest free neighbour of every free cell
+        order = np.lexsort((-ww, s))
+        s, d = s[order], d[order]
+        first = np.concatenate([[True], s[1:] != s[:-1]])
+        best = np.full(n, -1, dtype=np.int64)
+        best[s[first]] = d[first]
+        a = np.flatnonzero(best >= 0)
+        a = a[(best[best[a]] == a) & (a < best[a])]
+        parent[a] = parent[best[a]] = count + np.arange(a.shape[0])
+        count += a.shape[0]
+
+    # stragglers join the neighbouring pair they share the longest face with,
+    # if that adds no boundary group to it, else stay alone
+    alone = parent < 0
+    agg_mask = np.zeros(count, dtype=np.int64)
+    np.bitwise_or.at(agg_mask, parent[~alone], level.mask[~alone])
+    sel = alone[src] & ~alone[dst]
+    s, d, ww = src[sel], dst[sel], w[sel]
+    sel = (level.mask[s] | agg_mask[parent[d]]) == agg_mask[parent[d]]
+    s, d, ww = s[sel], d[sel], ww[sel]
+    order = np.lexsort((-ww, s))
+    s, d = s[order], d[order]
+    first = np.concatenate([[True], s[1:] != s[:-1]]) if s.shape[0] else np.zeros(0, bool)
+    parent[s[first]] = parent[d[first]]
+    rest = np.flatnonzero(parent < 0)
+    parent[rest] = count + np.arange(rest.shape[0])
+    return parent, count + rest.shape[0]
+
+
+def contract(level, parent, nc):
+    """Coarse level whose cells are the aggregates parent (n,) -> [0, nc)"""
+    volume = np.bincount(parent, level.volume, nc)
+    centroid = np.stack([np.bincount(parent, level.volume * level.centroid[:, k], nc)
+                         for k in range(2)], axis=1) / volume[:, None]
+
+    a, b = parent[level.faces[:, 0]], parent[level.faces[:, 1]]
+    keep = a != b
+    a, b, nrm = a[keep], b[keep], level.normals[keep]
+    flip = a > b
+    a, b = np.where(flip, b, a), np.where(flip, a, b)
+    nrm = np.where(flip[:, None], -nrm, nrm)
+    key, inverse = np.unique(a * nc + b, return_inverse=True)
+    faces = np.stack([key // nc, key % nc], axis=1)
+    normals = np.stack([np.bincount(inverse, nrm[:, k], key.shape[0]) for k in range(2)], axis=1)
+
+    bcell = parent[level.bfaces]
+    groups = np.unique(level.bgroups)
+    bkey, binverse = np.unique(bcell * groups.shape[0] + np.searchsorted(groups, level.bgroups),
+                               return_inverse=True)
+    bnormals = np.stack([np.bincount(binverse, level.bnormals[:, k], bkey.shape[0])
+                         for k in range(2)], axis=1)
+
+    mask = np.zeros(nc, dtype=np.int64)
+    np.bitwise_or.at(mask, parent, level.mask)
+    return Level(volume, centroid, faces, normals, bkey // groups.shape[0],
+                 groups[bkey % groups.shape[0]], bnormals, mask, parent)
+
+
+def coarsen(level, passes=2):
+    # `passes` rounds of pairwise aggregation, composed into one parent map
+    parent = np.arange(level.num_cells)
+    coarse = level
+    for _ in range(passes):
+        p, nc = match(coarse)
+        coarse = contract(coarse, p, nc)
+        parent = p[parent]
+    coarse.parent = parent
+    return coarse
+
+
+def hierarchy(fine, max_levels=MAX_LEVELS, min_cells=MIN_CELLS):
+    levels = [fine]
+    while len(levels) < max_levels and levels[-1].num_cells > min_cells:
+        coarse = coarsen(levels[-1])
+        if coarse.num_cells >= levels[-1].num_cells:
+            break
+        levels.append(coarse)
+    return levels
+
+
+def from_gmsh():
+    """
+    Level 0 and the 1D physical groups {tag: name} of the triangles of the
+    current gmsh model
+    """
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    _, tri = gmsh.model.mesh.getElementsByType(2)
+    triangles = tag_index(tags, tri).reshape(-1, 3)
+    xyz = coords.reshape(-1, 3)[:, :2]
+    groups, lines, names = [], [], {}
+    for dim, tag in gmsh.model.getPhysicalGroups(1):
+        nodes = []
+        for entity in gmsh.model.getEntitiesForPhysicalGroup(dim, tag):
+            types, _, enodes = gmsh.model.mesh.getElements(dim, entity)
+            nodes += [n for t, n in zip(types, enodes) if t == 1]
+        groups.append(tag)
+        lines.append(tag_index(tags, np.concatenate(nodes)).reshape(-1, 2))
+        names[tag] = gmsh.model.getPhysicalName(dim, tag)
+    return fine_level(xyz, triangles, lines, groups), names
+
+
+def save(levels, path, names=None):
+    os.makedirs(path, exist_ok=True)
+    header = {"format": "agglomeration 1", "groups": names or {}, "levels": []}
+    for l, level in enumerate(levels):
+        arrays = {
+            "cells": np.column_stack([level.volume, level.centroid]),
+            "faces": level.faces.astype(np.int32),
+            "normals": level.normals,
+            "bfaces": np.column_stack([level.bfaces, level.bgroups]).astype(np.int32),
+            "bnormals": level.bnormals,
+        }
+        if level.parent is not None:
+            arrays["parent"] = level.parent.astype(np.int32)
+        files = {}
+        for name, a in arrays.items():
+            files[name] = f"level{l}_{name}.npy"
+            np.save(os.path.join(path, files[name]), np.ascontiguousarray(a))
+        header["levels"].append({"cells": level.num_cells, "faces": level.faces.shape[0],
+                                 "bfaces": level.bfaces.shape[0], "files": files})
+    with open(os.path.join(path, "header.json"), "w") as f:
+        json.dump(header, f, indent=1)
+
+
+def load(path):
+    """header and one dict of read-only memory-mapped arrays per level"""
+    with open(os.path.join(path, "header.json")) as f:
+        header = json.load(f)
+    levels = [{name: np.load(os.path.join(path, file), mmap_mode="r")
+               for name, file in level["files"].items()} for level in header["levels"]]
+    return header, levels
+
+
+def main(argv):
+    max_levels = int(argv[argv.index("-levels") + 1]) if "-levels" in argv else MAX_LEVELS
+    min_cells = int(argv[argv.index("-min-cells") + 1]) if "-min-cells" in argv else MIN_CELLS
+    mesh, out = argv[1], argv[2]
+
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(mesh)
+    fine, names = from_gmsh()
+    gmsh.finalize()
+
+    levels = hierarchy(fine, max_levels, min_cells)
+    save(levels, out, names)
+    print(f"{'level':>5} {'cells':>10} {'faces':>10} {'bfaces':>8} {'ratio':>6}")
+    for l, level in enumerate(levels):
+        ratio = levels[l - 1].num_cells / level.num_cells if l else 1.
+        print(f"{l:>5} {level.num_cells:>10} {level.faces.shape[0]:>10} "
+              f"{level.bfaces.shape[0]:>8} {ratio:>6.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
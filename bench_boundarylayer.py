@@ -0,0 +1,50 @@
+# Meshing time and layer quality of flatplate.py with gmsh's BoundaryLayer
+# field against the layer extruded by boundarylayer.py
+#
+#   python bench_boundarylayer.py               # thickness 0.01 (field default) and 0.05
+#   python bench_boundarylayer.py 0.02 0.1
+#
+# Both runs use the same Size / Ratio / Thickness; the quality columns are
+# taken over the quads only, which are the layer cells in both meshes (the
+# core is triangles, the fans at the plate corners are left out). Every run
+# is a fresh interpreter.
+
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import quality
+from run import generate, summary
+
+PARAMS = {"lc": 0.02, "bl_size": 0.002, "bl_ratio": 1.2}
+
+
+def measure(params, output):
+    tic = time.perf_counter()
+    generate("flatplate", params, output)
+    wall = time.perf_counter() - tic
+    xyz, blocks, groups = quality.load(output)
+    quads = [b for b in blocks if b.type == 3]
+    report = quality.analyze(xyz, quads, groups)
+    return {"cells": sum(b.nodes.shape[0] for b in blocks), "quads": report["cells"],
+            **quality.fields(report), "time": wall}
+
+
+def main(argv):
+    values = [float(a) for a in argv[1:]] or [0.01, 0.05]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for thickness in values:
+            for layer, extrude in (("field", False), ("extrude", True)):
+                params = {**PARAMS, "bl_thickness": thickness, "extrude": extrude}
+                output = os.path.join(tmp, f"flatplate-{layer}.msh")
+                with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                    r = pool.submit(measure, params, output).result()
+                rows.append({"thickness": thickness, "layer": layer, **r})
+    print(", ".join(f"{k}={v:g}" for k, v in PARAMS.items()))
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,65 @@
+# Benchmark the blocked interpolation error estimator of adaptive.py against
+# the original one-shot version
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+import gmsh
+from adaptive import Mesh, my_function, compute_interpolation_error
+
+
+def compute_interpolation_error_full(nodes, triangles, f):
+    # the original estimator: every array is built for all triangles at once
+    uvw, weights = gmsh.model.mesh.getIntegrationPoints(2, "Gauss2")
+    jac, det, pt = gmsh.model.mesh.getJacobians(2, uvw)
+    numcomp, sf, _ = gmsh.model.mesh.getBasisFunctions(2, uvw, "Lagrange")
+    sf = sf.reshape((weights.shape[0], -1))
+    qx = pt.reshape((triangles.shape[0], -1, 3))
+    det = np.abs(det.reshape((triangles.shape[0], -1)))
+    f_vert = f(nodes)
+    f_fem = np.dot(f_vert[triangles], sf)
+    err_tri = np.sum((f_fem - f(qx))**2 * det * weights, 1)
+    return f_vert, np.sqrt(err_tri)
+
+
+def measure(fn):
+    tracemalloc.start()
+    tic = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - tic
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak / 2**20
+
+
+def main(sizes=(0.01, 0.003, 0.001), block_size=1 << 16, num_threads=4):
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    print(f"{'triangles':>10} {'method':>12} {'time [s]':>9} {'peak [MB]':>10} {'max diff':>10}")
+    for lc in sizes:
+        gmsh.model.add(f"square_{lc}")
+        square = gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
+        gmsh.model.occ.synchronize()
+        pnts = gmsh.model.getBoundary([(2, square)], True, True, True)
+        gmsh.model.mesh.setSize(pnts, lc)
+        gmsh.model.mesh.generate(2)
+        mesh = Mesh()
+        n = mesh.triangles.shape[0]
+
+        (_, ref), t, mem = measure(
+            lambda: compute_interpolation_error_full(mesh.vxyz, mesh.triangles, my_function))
+        print(f"{n:>10} {'full':>12} {t:>9.3f} {mem:>10.1f} {'-':>10}")
+        for threads in (1, num_threads):
+            (_, err), t, mem = measure(
+                lambda: compute_interpolation_error(mesh.vxyz, mesh.triangles, my_function,
+                                                    block_size, threads))
+            diff = np.max(np.abs(err - ref))
+            print(f"{n:>10} {f'blocked x{threads}':>12} {t:>9.3f} {mem:>10.1f} {diff:>10.2e}")
+        gmsh.model.remove()
+    gmsh.finalize()
+
+
+if __name__ == "__main__":
+    sizes = [float(a) for a in sys.argv[1:]]
+    main(sizes or (0.01, 0.003, 0.001))
@@ -0,0 +1,114 @@
+# Benchmark the batched FFD engine against the original per-node loop of dunno.py
+
+from math import comb
+import sys
+import time
+import numpy as np
+from ffd import cart2cyl, cyl2cart, calcSTU, deform, FFDOperator
+
+
+def deform_loop(coords, P0, dr, dphi, dz, Pr, Pphi, Pz):
+    # reference: the original per-node, per-control-point loop
+    l, m, n = Pr.shape
+    s, t, u = calcSTU(coords, P0, dr, dphi, dz)
+    Xdef = np.zeros((len(s), 3))
+    for point in range(len(s)):
+        for i in range(l):
+            for j in range(m):
+                for k in range(n):
+                    Xdef[point] += comb(l-1,i)*np.power(1-s[point], l-1-i)*np.power(s[point],i) * \
+                                   comb(m-1,j)*np.power(1-t[point], m-1-j)*np.power(t[point],j) * \
+                                   comb(n-1,k)*np.power(1-u[point], n-1-k)*np.power(u[point],k) * \
+                                   np.asarray([Pr[i,j,k], Pphi[i,j,k], Pz[i,j,k]])
+    out = Xdef.copy()
+    out[:, 0], out[:, 1], out[:, 2] = cyl2cart(Xdef[:, 0], Xdef[:, 1], Xdef[:, 2])
+    return out.flatten()
+
+
+def cylinder_nodes(num_nodes, R=0.1, L_total=0.4, seed=0):
+    rng = np.random.default_rng(seed)
+    rho = R * np.sqrt(rng.random(num_nodes))
+    phi = 2 * np.pi * rng.random(num_nodes) - np.pi
+    z = L_total * rng.random(num_nodes)
+    x, y, z = cyl2cart(rho, phi, z)
+    return np.column_stack([x, y, z]).flatten()
+
+
+def lattice(coords, l=2, m=4, n=5):
+    rhos, phis, zetas = cart2cyl(coords[0::3], coords[1::3], coords[2::3])
+    dr = max(rhos) - min(rhos)
+    dphi = 2 * np.pi
+    dz = max(zetas) - min(zetas)
+    i, j, k = np.meshgrid(np.arange(l), np.arange(m), np.arange(n), indexing="ij")
+    Pr = min(rhos) + dr * i / (l - 1)
+    Pphi = min(phis) + dphi * j / (m - 1)
+    Pz = min(zetas) + dz * k / (n - 1)
+    P0 = np.array([Pr[0, 0, 0], Pphi[0, 0, 0], Pz[0, 0, 0]])
+    Pr[1, :, 2] += 0.02
+    Pr[1, :, 4] -= 0.02
+    Pz[1, :, 0] += 0.05
+    return P0, dr, dphi, dz, Pr, Pphi, Pz
+
+
+def main(sizes=(1000, 10000, 100000, 1000000), max_loop=10000):
+    # the loop is only timed up to max_loop nodes, beyond that it is
+    # extrapolated linearly (marked with *)
+    print(f"{'nodes':>10} {'loop [s]':>11} {'batched [s]':>12} {'speedup':>8} {'max diff':>10}")
+    loop_rate = None
+    for num_nodes in sizes:
+        coords = cylinder_nodes(num_nodes)
+        args = lattice(coords)
+
+        tic = time.perf_counter()
+        new = deform(coords, *args)
+        t_batched = time.perf_counter() - tic
+
+        if num_nodes <= max_loop or loop_rate is None:
+            tic = time.perf_counter()
+            ref = deform_loop(coords, *args)
+            t_loop = time.perf_counter() - tic
+            loop_rate = t_loop / num_nodes
+            diff = f"{np.max(np.abs(new - ref)):.2e}"
+            mark = " "
+        else:
+            t_loop = loop_rate * num_nodes
+            diff = "-"
+            mark = "*"
+
+        print(f"{num_nodes:>10} {t_loop:>10.3f}{mark} {t_batched:>12.4f} "
+              f"{t_loop / t_batched:>8.0f} {diff:>10}")
+
+
+def main_operator(sizes=(10000, 100000, 1000000), batch=100, seed=1):
+    # cost of a design loop: rebuild per lattice vs one operator and batched products
+    rng = np.random.default_rng(seed)
+    print(f"{'nodes':>10} {'build [s]':>10} {'apply/lattice [s]':>18} "
+          f"{'deform/lattice [s]':>19} {'max diff':>10}")
+    for num_nodes in sizes:
+        coords = cylinder_nodes(num_nodes)
+        P0, dr, dphi, dz, Pr, Pphi, Pz = lattice(coords)
+        Prs = Pr + 0.01 * rng.standard_normal((batch,) + Pr.shape)
+        Pphis = np.broadcast_to(Pphi, Prs.shape)
+        Pzs = np.broadcast_to(Pz, Prs.shape)
+
+        tic = time.perf_counter()
+        op = FFDOperator.build(coords, P0, dr, dphi, dz, Pr.shape)
+        t_build = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        out = op.apply(Prs, Pphis, Pzs)
+        t_apply = (time.perf_counter() - tic) / batch
+
+        tic = time.perf_counter()
+        ref = deform(coords, P0, dr, dphi, dz, Prs[-1], Pphi, Pz)
+        t_deform = time.perf_counter() - tic
+
+        print(f"{num_nodes:>10} {t_build:>10.3f} {t_apply:>18.4f} {t_deform:>19.4f} "
+              f"{np.max(np.abs(out[-1] - ref)):>10.2e}")
+
+
+if __name__ == "__main__":
+    sizes = [int(float(a)) for a in sys.argv[1:]]
+    main(sizes or (1000, 10000, 100000, 1000000))
+    print()
+    main_operator(sizes or (10000, 100000, 1000000))
@@ -0,0 +1,65 @@
+# Cell counts of the three inlet variants at the same first-cell height
+#
+#   python bench_hybrid.py            # first cell 0.05, inlet.py's default
+#   python bench_hybrid.py 0.02
+#
+# Each variant is set up to reach the requested wall spacing its own way:
+#   inlet             isotropic triangles of lc_wall = 2 h / sqrt(3) at the wall
+#   inlet-structured  ny_wall rows growing by its wall progression from h
+#                     across the lower blocks (the streamwise count is fixed)
+#   inlet-hybrid      a quad layer starting at h, coarse triangles outside
+# The wall spacing actually obtained is measured on the written mesh, so the
+# counts can be compared at the spacing each one really has.
+
+import os
+import sys
+import tempfile
+import time
+from math import ceil, log, sqrt
+from concurrent.futures import ProcessPoolExecutor
+import quality
+from pipeline import load_script
+from run import generate, summary
+
+
+def setups(h):
+    structured = load_script("inlet-structured")
+    g = structured.layout()
+    r = g["wall_progression"]
+    # nodes of a geometric progression from h that spans the split line
+    rows = ceil(log(1 + g["y_split"] * (r - 1) / h) / log(r)) + 1
+    return [("inlet", {"lc_wall": 2 * h / sqrt(3)}),
+            ("inlet-structured", {"ny_wall": rows}),
+            ("inlet-hybrid", {"first_height": h})]
+
+
+def measure(script, params, output):
+    tic = time.perf_counter()
+    stats = generate(script, params, output)
+    wall = time.perf_counter() - tic
+    report = quality.analyze(*quality.load(output))
+    h = report["walls"]["wall"]
+    return {"script": script,
+            "params": ",".join(f"{k}={v:.4g}" for k, v in params.items()),
+            "cells": report["cells"], "nodes": stats["nodes"],
+            "wall_h_min": f"{h['min']:.3g}", "wall_h_mean": f"{h['mean']:.3g}",
+            "time": wall}
+
+
+def main(h=0.05):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for script, params in setups(h):
+            output = os.path.join(tmp, f"{script}.msh")
+            # a fresh interpreter per variant, as in bench_suite.py
+            with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                rows.append(pool.submit(measure, script, params, output).result())
+    hybrid = rows[-1]["cells"]
+    for r in rows:
+        r["vs hybrid"] = f"{r['cells'] / hybrid:.1f}x"
+    print(f"first-cell height {h:g}")
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    main(*(float(a) for a in sys.argv[1:]))
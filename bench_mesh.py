@@ -0,0 +1,57 @@
+# Benchmark the array-only tag translation of adaptive.Mesh against the
+# original dict + list comprehension
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+from adaptive import Mesh
+
+
+def synthetic_mesh(num_triangles, seed=0):
+    # a triangulated grid has about half as many nodes as triangles; the node
+    # tags are shuffled like the per-entity ordering gmsh returns
+    rng = np.random.default_rng(seed)
+    num_nodes = num_triangles // 2 + 1
+    vtags = rng.permutation(num_nodes).astype(np.uint64) + 1
+    vxyz = rng.random(3 * num_nodes)
+    triangles_tags = np.arange(1, num_triangles + 1, dtype=np.uint64)
+    evtags = rng.integers(1, num_nodes + 1, 3 * num_triangles).astype(np.uint64)
+    return vtags, vxyz, triangles_tags, evtags
+
+
+def dict_triangles(vtags, evtags, num_triangles):
+    # the original Mesh.__init__
+    vmap = dict({j: i for i, j in enumerate(vtags)})
+    evid = np.array([vmap[j] for j in evtags])
+    return evid.reshape((num_triangles, -1))
+
+
+def measure(fn):
+    tracemalloc.start()
+    tic = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - tic
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak / 2**20
+
+
+def main(sizes=(100000, 1000000, 10000000)):
+    print(f"{'triangles':>10} {'method':>14} {'time [s]':>9} {'peak [MB]':>10}")
+    for num_triangles in sizes:
+        vtags, vxyz, triangles_tags, evtags = synthetic_mesh(num_triangles)
+        ref, t, mem = measure(lambda: dict_triangles(vtags, evtags, num_triangles))
+        print(f"{num_triangles:>10} {'dict':>14} {t:>9.3f} {mem:>10.1f}")
+        for index_dtype, coord_dtype in ((np.int64, np.float64), (np.int32, np.float32)):
+            mesh, t, mem = measure(lambda: Mesh(vtags, vxyz, triangles_tags, evtags,
+                                                index_dtype, coord_dtype))
+            assert np.array_equal(mesh.triangles, ref)
+            label = f"array {np.dtype(index_dtype).name}"
+            print(f"{num_triangles:>10} {label:>14} {t:>9.3f} {mem:>10.1f}")
+        del ref, mesh
+
+
+if __name__ == "__main__":
+    sizes = [int(float(a)) for a in sys.argv[1:]]
+    main(sizes or (100000, 1000000, 10000000))
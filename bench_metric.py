@@ -0,0 +1,41 @@
+# Compare isotropic and anisotropic (Hessian metric) adaptation of the square
+# demo of adaptive.py: element count against interpolation error
+
+import sys
+import time
+import gmsh
+from adaptive import adapt
+
+
+def run(N, anisotropic, lc=0.02, max_iterations=6):
+    gmsh.model.add("square")
+    square = gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
+    gmsh.model.occ.synchronize()
+    pnts = gmsh.model.getBoundary([(2, square)], True, True, True)
+    gmsh.model.mesh.setSize(pnts, lc)
+    gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 1)
+    gmsh.option.setNumber("Mesh.Algorithm", 6)
+    gmsh.model.mesh.generate(2)
+    tic = time.perf_counter()
+    history = adapt(N, max_iterations=max_iterations, anisotropic=anisotropic)
+    elapsed = time.perf_counter() - tic
+    gmsh.model.remove()
+    return history[-1], len(history), elapsed
+
+
+def main(targets=(2000, 5000, 10000, 20000)):
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    print(f"{'N':>7} {'method':>12} {'iters':>5} {'elements':>9} {'error':>10} {'time [s]':>9}")
+    for N in targets:
+        for anisotropic in (False, True):
+            last, iters, elapsed = run(N, anisotropic)
+            label = "anisotropic" if anisotropic else "isotropic"
+            print(f"{N:>7} {label:>12} {iters:>5} {last['elements']:>9} "
+                  f"{last['error']:>10.3e} {elapsed:>9.2f}")
+    gmsh.finalize()
+
+
+if __name__ == "__main__":
+    targets = [int(float(a)) for a in sys.argv[1:]]
+    main(targets or (2000, 5000, 10000, 20000))
@@ -0,0 +1,68 @@
+# Ramp-angle sweep of inlet-structured.py: remeshing every variant with gmsh
+# against morphing one baseline grid (morph.py)
+#
+#   python bench_morph.py                # ramp angles 8..12 x 20..24, 2 gmsh runs
+#   python bench_morph.py 5 3            # 5 x 5 variants, 3 gmsh runs
+#
+# gmsh runs the script per variant (fresh interpreter each, as in
+# bench_suite.py); its node counts follow the layout, the morphed grids keep
+# the baseline's. Every morphed grid is checked against the transfinite grid
+# of its layout at the baseline counts, and its smallest scaled Jacobian is
+# reported.
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import quality
+from morph import Morph, fixed_layout
+from pipeline import load_script
+from run import summary
+from transfinite import inlet_grid
+
+SCRIPT = "inlet-structured"
+
+
+def remesh(params):
+    tic = time.perf_counter()
+    stats = load_script(SCRIPT).main(gui=False, **params)
+    return stats["elements"], time.perf_counter() - tic
+
+
+def main(n=5, gmsh_runs=2):
+    module = load_script(SCRIPT)
+    g0 = module.layout()
+    variants = [{"ramp_angle_one": a, "ramp_angle_two": b}
+                for a in np.linspace(8., 12., n) for b in np.linspace(20., 24., n)]
+
+    tic = time.perf_counter()
+    morph = Morph(inlet_grid(g0))
+    setup = time.perf_counter() - tic
+    rows, out = [], None
+    for v in variants:
+        g = fixed_layout(module, g0, **v)
+        tic = time.perf_counter()
+        grid = morph.grid(g, out)
+        t = time.perf_counter() - tic
+        out = grid.xyz
+        tic = time.perf_counter()
+        ref = inlet_grid(g)
+        t_tfi = time.perf_counter() - tic
+        report = quality.analyze(*quality.from_grid(grid))
+        rows.append({**v, "morph": t, "transfinite": t_tfi,
+                     "max_diff": f"{np.abs(grid.xyz - ref.xyz).max():.1e}",
+                     "jac_min": report["jacobian"]["min"]})
+    print(summary(rows))
+
+    remeshed = []
+    for v in variants[:gmsh_runs]:
+        with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+            remeshed.append(pool.submit(remesh, v).result()[1])
+    t_gmsh, t_morph = np.mean(remeshed), np.mean([r["morph"] for r in rows])
+    print(f"{len(variants)} variants, {grid.num_cells()} cells; baseline setup {setup:.2f} s")
+    print(f"gmsh remesh {t_gmsh:.2f} s per variant ({gmsh_runs} runs), "
+          f"morph {t_morph:.3f} s per variant, {t_gmsh / t_morph:.0f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,61 @@
+# Scaling of the per-block parallel meshing of the structured inlet: gmsh
+# meshing the nine transfinite surfaces on `threads` threads, and the NumPy
+# generator interpolating the block interiors in `workers` processes. Both
+# must reproduce the single-threaded mesh exactly.
+#
+#   python bench_parallel.py                # 1, 2, 4, 8, 16 and all cores
+#   python bench_parallel.py 1 4 16
+#
+# The parallel speedup of either path is unmeasured so far: this has only
+# run on a single-core box, where it confirms identical output and nothing
+# else. Rows above the available core count are oversubscribed and marked.
+
+import os
+import sys
+import time
+import numpy as np
+import gmsh
+import pipeline
+from pipeline import load_script
+from transfinite import inlet_grid
+
+
+def gmsh_run(module, params, threads):
+    out = {}
+
+    def keep(gui=True, output=None):
+        out["time"] = time.perf_counter() - tic
+        _, out["xyz"], _ = gmsh.model.mesh.getNodes()
+        return pipeline.finish(gui, output)
+
+    module.finish = keep
+    tic = time.perf_counter()
+    module.main(gui=False, threads=threads, **params)
+    return out["time"], out["xyz"]
+
+
+def main(script="inlet-structured-two", params=None, counts=None):
+    params = params or {"scale_factor": 3}
+    counts = counts or sorted({1, 2, 4, 8, 16, os.cpu_count()})
+    module = load_script(script)
+    g = module.layout(**params)
+    print(f"{script} {params}, {os.cpu_count()} cores available")
+    print(f"{'cores':>5} {'gmsh [s]':>9} {'speedup':>8} {'numpy [s]':>10} {'speedup':>8} {'same':>5}")
+    ref = None
+    for n in counts:
+        t_gmsh, xyz = gmsh_run(module, params, n)
+        tic = time.perf_counter()
+        grid = inlet_grid(g, workers=n)
+        t_numpy = time.perf_counter() - tic
+        if ref is None:
+            ref, base = (xyz, grid.xyz.copy()), (t_gmsh, t_numpy)
+        same = np.array_equal(ref[0], xyz) and np.array_equal(ref[1], grid.xyz)
+        print(f"{n:>5} {t_gmsh:>9.2f} {base[0] / t_gmsh:>8.2f} "
+              f"{t_numpy:>10.2f} {base[1] / t_numpy:>8.2f} {str(same):>5}"
+              + ("  oversubscribed" if n > os.cpu_count() else ""))
+        del grid
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]]
+    main(counts=counts or None)
@@ -0,0 +1,95 @@
+# Metis partitioning of the mixed-element meshes, checked part by part
+#
+#   python bench_partition.py                  # inlet-hybrid and flatplate, 2, 4 and 16 parts
+#   python bench_partition.py inlet-hybrid 64
+#
+# Each mesh is generated once and split by partition_file into every part
+# count. The part files are then checked against the mesh itself: every
+# cell is owned by exactly one part, the local cells (triangles padded with
+# -1 among the quads) hold the global nodes of their global cells, the
+# owned and first-layer ghost cells have all their face neighbours in the
+# part, and the owned boundary faces add up to the boundary lines. The exit
+# status is 1 when any check fails, as in bench_suite.py.
+
+import json
+import os
+import sys
+import tempfile
+import time
+import gmsh
+import numpy as np
+import partition
+from renumber import cell_graph
+from run import generate, summary
+
+CASES = {"inlet-hybrid": {}, "flatplate": {"lc": 0.05}}
+PARTS = (2, 4, 16)
+
+
+def reference(path):
+    # global cell blocks, coordinates and number of boundary lines of a mesh file
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(path)
+    cells, xyz, groups = partition.from_gmsh()
+    gmsh.finalize()
+    return cells, xyz, sum(len(lines) for _, lines in groups.values())
+
+
+def check(outdir, cells, xyz, num_lines):
+    # names of the failed checks of the parts in outdir
+    with open(os.path.join(outdir, "header.json")) as f:
+        header = json.load(f)
+    graph = cell_graph(cells)
+    cells = partition.padded(cells)
+    owned = np.zeros(cells.shape[0], dtype=np.int64)
+    failed = set()
+    bfaces = 0
+    for part, counts in enumerate(header["counts"]):
+        p = partition.load(outdir, part)
+        n0, n1 = np.cumsum(counts["cells"])[:2]
+        owned[p["cell_global"][:n0]] += 1
+        local = p["cells"]
+        if not np.array_equal(np.where(local >= 0, p["node_global"][local], -1),
+                              cells[p["cell_global"]]):
+            failed.add("cells")
+        if not np.array_equal(p["nodes"], xyz[p["node_global"]]):
+            failed.add("nodes")
+        inside = np.zeros(cells.shape[0], dtype=bool)
+        inside[p["cell_global"]] = True
+        if not inside[graph[p["cell_global"][:n1]].indices].all():
+            failed.add("ghosts")
+        bfaces += int((p["bfaces"][:, 0] < n0).sum())
+    if (owned != 1).any():
+        failed.add("owned")
+    if bfaces != num_lines:
+        failed.add("bfaces")
+    return sorted(failed)
+
+
+def main(scripts=None, parts=PARTS):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for script in scripts or CASES:
+            path = os.path.join(tmp, f"{script}.msh")
+            generate(script, CASES.get(script, {}), path)
+            cells, xyz, num_lines = reference(path)
+            for k in parts:
+                outdir = os.path.join(tmp, f"{script}_{k}")
+                tic = time.perf_counter()
+                counts = partition.partition_file(path, outdir, k)
+                elapsed = time.perf_counter() - tic
+                owned = np.array([c["cells"][0] for c in counts])
+                failed = check(outdir, cells, xyz, num_lines)
+                rows.append({"script": script, "parts": k,
+                             "cells": "+".join(str(c.shape[0]) for c in cells),
+                             "time": elapsed, "imbalance": owned.max() / owned.mean(),
+                             "status": ", ".join(failed) or "ok"})
+    print(summary(rows))
+    return all(r["status"] == "ok" for r in rows)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    ok = main(args[:1] or None, tuple(int(a) for a in args[1:]) or PARTS)
+    sys.exit(0 if ok else 1)
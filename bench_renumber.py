@@ -0,0 +1,63 @@
+# Cell and node bandwidth of every renumbering method on the structured
+# inlets, checked against gmsh's own numbering
+#
+#   python bench_renumber.py                       # inlet-structured-two, scale_factor 1
+#   python bench_renumber.py inlet-structured total_divisions=1024
+#
+# The mesh is generated once and every method renumbers a fresh copy of it;
+# the bandwidths after are measured on the renumbered gmsh model itself.
+# A method regresses when its max or mean bandwidth of either graph is
+# larger than the input's; the exit status is 1 when any does, as in
+# bench_suite.py.
+
+import os
+import sys
+import tempfile
+import time
+import gmsh
+import numpy as np
+import renumber
+from run import generate, parse_value, summary
+
+
+def measure():
+    # bandwidths of the numbering the current gmsh model now holds
+    tags, xyz, blocks = renumber.from_gmsh()
+    cells = [b.nodes for b in blocks]
+    return {"node": renumber.bandwidth(renumber.node_graph(xyz.shape[0], cells), np.argsort(tags)),
+            "cell": renumber.bandwidth(renumber.cell_graph(cells))}
+
+
+def main(script="inlet-structured-two", **params):
+    params = params or {"scale_factor": 1}
+    rows, failed = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mesh.msh")
+        generate(script, params, path)
+        for method in renumber.METHODS:
+            gmsh.initialize()
+            gmsh.option.setNumber("General.Terminal", 0)
+            gmsh.open(path)
+            tic = time.perf_counter()
+            report = renumber.renumber(method)
+            elapsed = time.perf_counter() - tic
+            written = measure()
+            gmsh.finalize()
+            row = {"method": method, "time": elapsed}
+            for name in ("node", "cell"):
+                (b0, m0), (b1, m1) = report[f"{name}_bandwidth"], written[name]
+                row[f"{name}_bw"] = f"{b0}->{b1}"
+                row[f"{name}_mean"] = f"{m0:.1f}->{m1:.1f}"
+                if renumber.worse((b1, m1), (b0, m0)):
+                    failed.append(f"{method} {name}")
+            rows.append(row)
+    print(summary(rows))
+    if failed:
+        print("wider than the input: " + ", ".join(failed))
+    return not failed
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    params = {k: parse_value(v) for k, _, v in (a.partition("=") for a in args[1:])}
+    sys.exit(0 if main(*args[:1], **params) else 1)
@@ -0,0 +1,50 @@
+# Meshing time of inlet.py with its live Distance -> Threshold chain against
+# the same field compiled onto a background grid (sizefield.py)
+#
+#   python bench_sizefield.py                 # lc_wall 0.2 and 0.1, grid 0.25
+#   python bench_sizefield.py 0.05 -grid 0.5
+#
+# The grid runs once with an empty cache (sampling and writing included) and
+# once reading the cached grid. Every run is a fresh interpreter.
+
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import sizefield
+from pipeline import load_script
+from run import summary
+
+
+def measure(params, cache_dir):
+    sizefield.SIZE_CACHE_DIR = cache_dir
+    tic = time.perf_counter()
+    stats = load_script("inlet").main(gui=False, **params)
+    return {**stats, "time": time.perf_counter() - tic}
+
+
+def main(argv):
+    args, grid = argv[1:], 0.25
+    if "-grid" in args:
+        i = args.index("-grid")
+        grid = float(args[i + 1])
+        del args[i:i + 2]
+    values = [float(a) for a in args] or [0.2, 0.1]
+    rows = []
+    for lc_wall in values:
+        with tempfile.TemporaryDirectory() as tmp:
+            for field, params in (("live", {}), ("grid, cold", {"size_grid": grid}),
+                                  ("grid, cached", {"size_grid": grid})):
+                with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                    r = pool.submit(measure, {"lc_wall": lc_wall, **params}, tmp).result()
+                rows.append({"lc_wall": lc_wall, "field": field, "elements": r["elements"],
+                             "time": r["time"]})
+        live = rows[-3]["time"]
+        for r in rows[-3:]:
+            r["speedup"] = f"{live / r['time']:.2f}x"
+    print(f"grid spacing {grid:g}")
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,76 @@
+# Smoothing of the inlet-structured-two blocks: gmsh's Mesh.Smoothing against
+# the elliptic smoother of smooth.py, iteration by iteration
+#
+#   python bench_smooth.py                 # scale_factor 1, 10 iterations
+#   python bench_smooth.py 5 10 0.9        # scale_factor 5, 10 iterations, only cells below 0.9
+#
+# gmsh meshes the layout once per smoothing count (fresh interpreter each);
+# its smoothing time is the difference to the run without smoothing. The
+# smoother starts from the transfinite grid of the same layout (what gmsh
+# meshes before smoothing) and is timed per iteration, over every block or,
+# with a threshold, only around the cells whose scaled Jacobian is below it.
+# The wall columns are the first-cell heights on the walls, which the
+# smoother keeps and gmsh's smoothing does not.
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import quality
+import pipeline
+from pipeline import load_script
+from run import summary
+from smooth import Smoother
+from transfinite import inlet_grid
+
+SCRIPT = "inlet-structured-two"
+GMSH_STEPS = (1, 2, 5, 10)
+
+
+def row(report):
+    wall = report["walls"]["wall"]
+    return {"skew_max": report["skewness"]["max"], "skew_mean": f"{report['skewness']['mean']:.5f}",
+            "jac_min": report["jacobian"]["min"], "wall_h_min": f"{wall['min']:.4g}",
+            "wall_h_mean": f"{wall['mean']:.4g}"}
+
+
+def gmsh_run(scale_factor, smoothing):
+    module = load_script(SCRIPT)
+    out = {}
+
+    def keep(gui=True, output=None):
+        out["mesh"] = quality.from_gmsh()
+        return pipeline.finish(gui, output)
+
+    module.finish = keep
+    tic = time.perf_counter()
+    module.main(gui=False, scale_factor=scale_factor, smoothing=smoothing)
+    return time.perf_counter() - tic, row(quality.analyze(*out["mesh"]))
+
+
+def main(scale_factor=1, iterations=10, below=None):
+    rows = []
+    runs = {}
+    for k in (0,) + GMSH_STEPS:
+        with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+            runs[k] = pool.submit(gmsh_run, scale_factor, k).result()
+    for k in (0,) + GMSH_STEPS:
+        rows.append({"method": "gmsh", "iterations": k, "time": runs[k][0] - runs[0][0], **runs[k][1]})
+
+    g = load_script(SCRIPT).layout(scale_factor=scale_factor, smoothing=0)
+    grid = inlet_grid(g)
+    tic = time.perf_counter()
+    smoother = Smoother(grid, below=below)
+    total = time.perf_counter() - tic
+    method = "elliptic" if below is None else f"elliptic <{below:g}"
+    for k in range(1, iterations + 1):
+        total += smoother.run(1)
+        rows.append({"method": method, "iterations": k, "time": total,
+                     **row(quality.analyze(*quality.from_grid(grid)))})
+    print(f"scale_factor {scale_factor}, {grid.num_cells()} cells, "
+          f"the smoother moves {smoother.moving()} of {grid.xyz.shape[0]} nodes")
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*(int(a) for a in args[:2]), *(float(a) for a in args[2:3]))
@@ -0,0 +1,184 @@
+# Throughput benchmark and regression check for the mesh generators
+#
+#   python bench_suite.py                      # run every ladder, compare to the baseline
+#   python bench_suite.py inlet -s             # run one ladder and store it as the baseline
+#   python bench_suite.py --tolerance 0.25
+#
+# Every rung of a resolution ladder runs headlessly in a fresh process and
+# records wall time, elements per second, peak RSS and output size. Results
+# are compared with the stored baseline (same script and parameter value):
+# a rung regresses when its throughput drops, or its peak RSS or output size
+# grows, by more than the tolerance. A different element count means the
+# mesh itself changed and is flagged as well. The exit status is 1 when
+# anything regressed, so the suite can gate CI.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import gmsh
+from run import generate, summary
+
+BASELINE = "bench_baseline.json"
+TOLERANCE = 0.15
+
+# script -> (parameter, values from coarse to fine, fixed parameters)
+LADDERS = {
+    "inlet-structured-two": ("scale_factor", [1, 2, 3, 5], {}),
+    "inlet-structured": ("total_divisions", [256, 512, 1024, 2048], {}),
+    "inlet": ("lc_wall", [0.2, 0.15, 0.1, 0.07, 0.05], {}),
+    "flatplate": ("lc", [0.04, 0.02, 0.01], {}),
+    "test": ("lc", [0.2, 0.1, 0.07], {}),
+    "adaptive": ("N", [1000, 10000, 100000], {"max_iterations": 3}),
+}
+
+
+def adaptive_case(output, N, lc=0.02, **kwargs):
+    # adaptive.py is driven from the command line, so set up its square here
+    import adaptive
+    from pipeline import finish
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.model.add("square")
+    square = gmsh.model.occ.addRectangle(0, 0, 0, 1, 1)
+    gmsh.model.occ.synchronize()
+    gmsh.model.mesh.setSize(gmsh.model.getBoundary([(2, square)], True, True, True), lc)
+    gmsh.model.mesh.generate(2)
+    adaptive.adapt(N, **kwargs)
+    return finish(False, output)
+
+
+def measure(script, params, output):
+    tic = time.perf_counter()
+    if script == "adaptive":
+        stats = adaptive_case(output, **params)
+    else:
+        stats = generate(script, params, output)
+    wall = time.perf_counter() - tic
+    return {"wall": wall, "nodes": stats["nodes"], "elements": stats["elements"],
+            "elements_per_s": stats["elements"] / wall,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+            "bytes": os.path.getsize(output)}
+
+
+def run_ladder(script, repeat=1, values=None):
+    # best of `repeat` runs per rung, each in a fresh interpreter
+    name, ladder, fixed = LADDERS[script]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for value in values or ladder:
+            params = {**fixed, name: value}
+            output = os.path.join(tmp, f"{script}.msh")
+            runs = []
+            try:
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                        runs.append(pool.submit(measure, script, params, output).result())
+            except Exception as e:
+                # a rung that stops meshing is a regression, not a crash of the suite
+                results.append({"script": script, "param": name, "value": value,
+                                "error": str(e).strip().splitlines()[-1]})
+                continue
+            best = min(runs, key=lambda r: r["wall"])
+            best["peak_rss_mb"] = min(r["peak_rss_mb"] for r in runs)
+            results.append({"script": script, "param": name, "value": value, **best})
+    return results
+
+
+def key(r):
+    return f"{r['script']} {r['param']}={r['value']}"
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Annotate each result with its change against the baseline and a status:
+    ok, new (no baseline), failed (the generator raised) or the failed checks
+    among speed, memory, size and elements (a different element count)
+    """
+    for r in results:
+        ref = baseline.get(key(r))
+        if "error" in r:
+            r["status"] = "failed"
+            continue
+        if ref is None:
+            r["status"] = "new"
+            continue
+        r["speed"] = r["elements_per_s"] / ref["elements_per_s"] - 1
+        r["memory"] = r["peak_rss_mb"] / ref["peak_rss_mb"] - 1
+        r["size"] = r["bytes"] / ref["bytes"] - 1
+        regressed = [k for k, worse in (("speed", -r["speed"]), ("memory", r["memory"]),
+                                        ("size", r["size"])) if worse > tolerance]
+        if r["elements"] != ref["elements"]:
+            regressed.append("elements")
+        r["status"] = ",".join(regressed) or "ok"
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(path, results):
+    # merge into the stored baseline so ladders can be refreshed one at a time
+    baseline = load_baseline(path)
+    baseline.update({key(r): {k: r[k] for k in ("wall", "nodes", "elements",
+                                                "elements_per_s", "peak_rss_mb", "bytes")}
+                     for r in results})
+    host = {"machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "python": platform.python_version(),
+            "gmsh": gmsh.__version__}
+    with open(path, "w") as f:
+        json.dump({"host": host, "results": baseline}, f, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesh generation throughput and regression suite")
+    parser.add_argument("scripts", nargs="*",
+                        help=f"ladders to run, from {', '.join(LADDERS)} (default: all)")
+    parser.add_argument("-b", "--baseline", default=BASELINE)
+    parser.add_argument("-s", "--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("-t", "--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="runs per rung, the fastest one counts")
+    args = parser.parse_args(argv)
+    unknown = set(args.scripts) - set(LADDERS)
+    if unknown:
+        parser.error(f"no ladder for {', '.join(sorted(unknown))}")
+
+    results = []
+    for script in args.scripts or LADDERS:
+        results += run_ladder(script, args.repeat)
+    baseline = load_baseline(args.baseline)
+    compare(results, baseline, args.tolerance)
+
+    rows = [{"case": key(r), "elements": r["elements"], "wall": r["wall"],
+             "elem/s": f"{r['elements_per_s']:.4g}", "peak MB": r["peak_rss_mb"],
+             "MB": r["bytes"] / 2**20,
+             **{k: f"{r[k]:+.1%}" for k in ("speed", "memory", "size") if k in r},
+             "status": r["status"]} if "error" not in r else
+            {"case": key(r), "status": r["status"]} for r in results]
+    print(summary(rows))
+    for r in results:
+        if "error" in r:
+            print(f"{key(r)}: {r['error']}")
+
+    if args.save:
+        save_baseline(args.baseline, [r for r in results if "error" not in r])
+    regressed = [r for r in results if r["status"] not in ("ok", "new")]
+    if regressed and not args.save:
+        print(f"{len(regressed)} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
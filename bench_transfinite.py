@@ -0,0 +1,70 @@
+# Cross-check the NumPy transfinite generator against gmsh for
+# inlet-structured.py and inlet-structured-two.py, and time it over
+# scale_factor
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+import gmsh
+import pipeline
+from pipeline import load_script
+from transfinite import inlet_grid
+
+
+def gmsh_grid(module, params):
+    # run the script's main headlessly and keep its nodes and quads
+    out = {}
+
+    def keep(gui=True, output=None):
+        tags, coords, _ = gmsh.model.mesh.getNodes()
+        _, quads = gmsh.model.mesh.getElementsByType(3)
+        out["tags"], out["xyz"], out["quads"] = tags, coords.reshape(-1, 3), quads
+        return pipeline.finish(gui, output)
+
+    module.finish = keep
+    tic = time.perf_counter()
+    module.main(gui=False, **params)
+    out["time"] = time.perf_counter() - tic
+    return out
+
+
+def cross_check(module, params):
+    grid = inlet_grid(module.layout(**params))
+    ref = gmsh_grid(module, params)
+    same_tags = ref["tags"].shape[0] == grid.xyz.shape[0]
+    diff = np.max(np.abs(ref["xyz"] - grid.xyz[ref["tags"].astype(np.int64) - 1]))
+    quads = ref["quads"].astype(np.int64).reshape(-1, 4) - 1
+    same_quads = np.array_equal(quads, grid.all_quads())
+    return same_tags, diff, same_quads, ref["time"]
+
+
+def main(scale_factors=(1, 2, 3, 5), check=(1,)):
+    # inlet-structured.py does not smooth; gmsh smooths the transfinite
+    # blocks of inlet-structured-two.py when Mesh.Smoothing > 1, so the
+    # node-for-node comparison runs without smoothing
+    cases = [("inlet-structured", {})]
+    cases += [("inlet-structured-two", {"scale_factor": sf, "smoothing": 0}) for sf in check]
+    for script, params in cases:
+        same_tags, diff, same_quads, t = cross_check(load_script(script), params)
+        print(f"{script} {params}: node count match {same_tags}, max node distance "
+              f"{diff:.2e}, identical quads {same_quads}, gmsh {t:.2f} s")
+
+    module = load_script("inlet-structured-two")
+
+    print(f"{'scale':>5} {'cells':>10} {'time [s]':>9} {'peak [MB]':>10}")
+    for sf in scale_factors:
+        g = module.layout(scale_factor=sf)
+        tracemalloc.start()
+        tic = time.perf_counter()
+        grid = inlet_grid(g)
+        elapsed = time.perf_counter() - tic
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{sf:>5} {grid.num_cells():>10} {elapsed:>9.2f} {peak / 2**20:>10.1f}")
+        del grid
+
+
+if __name__ == "__main__":
+    scale_factors = [int(a) for a in sys.argv[1:]]
+    main(scale_factors or (1, 2, 3, 5))
@@ -0,0 +1,121 @@
+# Compare writing the structured inlet with gmsh.write against the streaming
+# writers in meshfile.py, and reading it back with gmsh.open against the
+# memory-mapped loaders. Every case runs in a fresh process so that the
+# reported peak RSS belongs to that case alone. For the reads, the mesh column
+# is the time to open and the write column the time to open and sum every
+# node coordinate and quad. First, a mesh written by run.py (flatplate) is
+# opened with the memory-mapped loader, which only reads binary MSH 4.1.
+
+import os
+import sys
+import time
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import gmsh
+import pipeline
+from pipeline import load_script
+from run import generate
+from transfinite import inlet_grid
+import meshfile
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def run_gmsh(sf, path):
+    module = load_script("inlet-structured-two")
+    out = {}
+
+    def write(gui=True, output=None):
+        out["mesh"] = time.perf_counter() - tic
+        t = time.perf_counter()
+        stats = pipeline.finish(gui, output)
+        out["write"] = time.perf_counter() - t
+        return stats
+
+    module.finish = write
+    tic = time.perf_counter()
+    module.main(gui=False, output=path, scale_factor=sf, smoothing=0)
+    return out["mesh"], out["write"], peak_mb()
+
+
+def run_numpy(sf, path, raw=False):
+    module = load_script("inlet-structured-two")
+    tic = time.perf_counter()
+    grid = inlet_grid(module.layout(scale_factor=sf))
+    mesh = time.perf_counter() - tic
+    tic = time.perf_counter()
+    (meshfile.write_raw if raw else meshfile.write_msh)(grid, path)
+    return mesh, time.perf_counter() - tic, peak_mb()
+
+
+def open_gmsh(path):
+    tic = time.perf_counter()
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(path)
+    _, xyz, _ = gmsh.model.mesh.getNodes()
+    _, quads = gmsh.model.mesh.getElementsByType(3)
+    total = xyz.sum() + quads.sum()
+    gmsh.finalize()
+    return time.perf_counter() - tic, total, peak_mb()
+
+
+def open_mapped(path):
+    tic = time.perf_counter()
+    mesh = meshfile.load(path)
+    t_open = time.perf_counter() - tic
+    if isinstance(mesh, meshfile.RawMesh):
+        total = mesh.nodes.sum() + mesh.quads.sum()
+    else:
+        total = (sum(b.xyz.sum() for b in mesh.node_blocks)
+                 + sum(b.nodes.sum() for b in mesh.element_blocks if b.type == 3))
+    return t_open, time.perf_counter() - tic, total, peak_mb()
+
+
+def open_runner_output(path):
+    # run.py writes through pipeline.finish; its .msh has to map
+    stats = generate("flatplate", {}, path)
+    return stats["nodes"], meshfile.load(path).num_nodes()
+
+
+def size_mb(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20
+    return os.path.getsize(path) / 2**20
+
+
+def main(scale_factors=(1, 2, 3)):
+    with tempfile.TemporaryDirectory() as tmp:
+        with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+            written, mapped = pool.submit(open_runner_output, os.path.join(tmp, "flatplate.msh")).result()
+        if written != mapped:
+            sys.exit(f"run.py flatplate: {written} nodes written, {mapped} mapped")
+        print(f"run.py flatplate: {mapped} nodes mapped back")
+        print(f"{'scale':>5} {'writer':>10} {'mesh [s]':>9} {'write [s]':>10} "
+              f"{'peak [MB]':>10} {'file [MB]':>10}")
+        for sf in scale_factors:
+            cases = [("gmsh", run_gmsh, os.path.join(tmp, f"gmsh_{sf}.msh"), {}),
+                     ("msh 4.1", run_numpy, os.path.join(tmp, f"numpy_{sf}.msh"), {}),
+                     ("raw", run_numpy, os.path.join(tmp, f"raw_{sf}"), {"raw": True})]
+            for name, fn, path, kw in cases:
+                with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                    mesh, write, peak = pool.submit(fn, sf, path, **kw).result()
+                print(f"{sf:>5} {name:>10} {mesh:>9.2f} {write:>10.2f} "
+                      f"{peak:>10.1f} {size_mb(path):>10.1f}")
+
+            # reading back: open only, then open and touch every node and quad
+            with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                t, _, peak = pool.submit(open_gmsh, cases[0][2]).result()
+            print(f"{sf:>5} {'gmsh.open':>10} {'':>9} {t:>10.2f} {peak:>10.1f}")
+            for name, _, path, _ in cases[1:]:
+                with ProcessPoolExecutor(1, max_tasks_per_child=1) as pool:
+                    t_open, t, _, peak = pool.submit(open_mapped, path).result()
+                print(f"{sf:>5} {'map ' + name:>10} {t_open:>9.4f} {t:>10.2f} {peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    scale_factors = [int(a) for a in sys.argv[1:]]
+    main(scale_factors or (1, 2, 3))
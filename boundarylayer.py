@@ -0,0 +1,431 @@
+# Boundary layer quads extruded from the wall mesh, in place of gmsh's
+# BoundaryLayer field
+#
+#   core = boundarylayer.extrude(surface, walls, size=1e-3, ratio=1.2, thickness=0.05).core
+#   gmsh.model.mesh.setRecombine(2, core)     # options go to the new core surface
+#   gmsh.model.mesh.generate(2)
+#
+# The walls are meshed first (generate(1)) and walked around the domain with
+# the fluid on the left, so an embedded wall (a fracture) is passed twice,
+# once per side, and joins the walls it touches in one chain. From every
+# wall node a ray of layers grows along the node normal, with heights
+# size * ratio^k up to thickness:
+#   convex corners sharper than FAN_ANGLE get a fan of rays, FAN_STEP apart,
+#   whose first layer is a triangle
+#   concave corners take the bisector, and the rays of the nodes within
+#   BLEND * thickness (and short of any fan) turn towards it gradually so
+#   the layers do not cross
+#   where a chain meets a boundary that is not a wall, the end ray slides
+#   along that boundary and its neighbours blend in the same way
+# Rays are stretched by 1 / cos of their tilt from the wall normal (at most
+# MAX_STRETCH) so the layers keep their height.
+#
+# The layer goes into the model before the core is meshed: the layer's
+# outer front becomes a chain of straight one-segment lines, the core is
+# rebuilt as a plane surface bounded by the front and the rest of the
+# boundary (cut where the layer ends on it), and the layer cells are stored
+# in a discrete surface that generate(2) leaves alone. Where the layer ends
+# on a cut curve, a line meshed with the layer heights closes it. Physical
+# groups of the surface and of the cut curves are carried over. Unlike the
+# field this works next to embedded curves, and the layer of an embedded
+# wall is simply part of the walk.
+
+import math
+from collections import namedtuple
+import numpy as np
+import gmsh
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from adaptive import tag_index
+
+FAN_ANGLE = 30.
+FAN_STEP = 30.
+BLEND = 1.6
+MAX_STRETCH = 2.
+# concave turns below this many degrees are left to the bisector alone
+MIN_BLEND = 5.
+
+Layer = namedtuple("Layer", "core layer heights cells")
+
+
+def heights(size, ratio, thickness):
+    # cumulative layer heights, geometric from size, as many as fit in thickness
+    if ratio == 1:
+        n = math.floor(thickness / size + 1e-9)
+    else:
+        n = math.floor(math.log(1 + thickness * (ratio - 1) / size) / math.log(ratio) + 1e-9)
+    return size * np.cumsum(ratio ** np.arange(max(n, 1)))
+
+
+def endpoints(curve):
+    # start and end point of a curve (getBoundary lists them in tag order)
+    a, b = [t for _, t in gmsh.model.getBoundary([(1, curve)], oriented=False)]
+    lo, _ = gmsh.model.getParametrizationBounds(1, curve)
+    start = gmsh.model.getValue(1, curve, lo)
+    da, db = (np.linalg.norm(gmsh.model.getValue(0, t, []) - start) for t in (a, b))
+    return (a, b) if da <= db else (b, a)
+
+
+def curve_nodes(curve):
+    # node tags of a meshed curve, from its start point to its end point
+    _, _, nodes = gmsh.model.mesh.getElements(1, curve)
+    seg = nodes[0].reshape(-1, 2)
+    if not np.array_equal(seg[1:, 0], seg[:-1, 1]):
+        raise ValueError(f"curve {curve}: mesh is not a single ordered chain")
+    chain = np.concatenate([seg[:, 0], seg[-1:, 1]])
+    start = gmsh.model.mesh.getNodes(0, endpoints(curve)[0])[0][0]
+    return chain if chain[0] == start else chain[::-1]
+
+
+def boundary(surface, walls):
+    """
+    Half-edges (u, v) of the surface boundary with the fluid on their left,
+    as indices into the returned node tags and coordinates, with their
+    curve, their sense along it and a wall flag; embedded walls give a
+    half-edge per side
+    """
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    xy = coords.reshape(-1, 3)[:, :2]
+    u, v, curve, sense = [], [], [], []
+    for _, c in gmsh.model.getBoundary([(2, surface)], combined=False, oriented=True):
+        n = tag_index(tags, curve_nodes(abs(c)))
+        n = n if c > 0 else n[::-1]
+        u.append(n[:-1]), v.append(n[1:])
+        curve.append(np.full(n.shape[0] - 1, abs(c))), sense.append(np.full(n.shape[0] - 1, np.sign(c)))
+    u, v, curve, sense = map(np.concatenate, (u, v, curve, sense))
+
+    # every loop turns so the fluid is on its left: the exterior one (largest
+    # area) counter-clockwise, the holes clockwise
+    num, loop = connected_components(coo_matrix((np.ones(u.shape[0]), (u, v)),
+                                                shape=(xy.shape[0],) * 2), directed=False)
+    loop = loop[u]
+    cross = xy[u, 0] * xy[v, 1] - xy[v, 0] * xy[u, 1]
+    area = np.bincount(loop, cross, num)
+    flip = np.sign(area) != np.where(np.arange(num) == np.argmax(np.abs(area)), 1, -1)
+    f = flip[loop]
+    u[f], v[f], sense[f] = v[f], u[f], -sense[f]
+
+    for dim, c in gmsh.model.mesh.getEmbedded(2, surface):
+        if dim == 1 and c in walls:
+            n = tag_index(tags, curve_nodes(c))
+            u = np.concatenate([u, n[:-1], n[:0:-1]])
+            v = np.concatenate([v, n[1:], n[-2::-1]])
+            curve = np.concatenate([curve, np.full(2 * (n.shape[0] - 1), c)])
+            sense = np.concatenate([sense, np.ones(n.shape[0] - 1, int), -np.ones(n.shape[0] - 1, int)])
+    return tags, xy, u, v, curve, sense, np.isin(curve, walls)
+
+
+def successors(xy, u, v):
+    # the half-edge after each one around the fluid: at its end, the first
+    # outgoing edge clockwise from the way back (the way back itself last)
+    order = np.argsort(u, kind="stable")
+    lo = np.searchsorted(u[order], v, "left")
+    count = np.searchsorted(u[order], v, "right") - lo
+    h = np.repeat(np.arange(u.shape[0]), count)
+    g = order[np.repeat(lo - np.cumsum(count) + count, count) + np.arange(h.shape[0])]
+    back = np.arctan2(*(xy[u[h]] - xy[v[h]]).T[::-1])
+    out = np.arctan2(*(xy[v[g]] - xy[u[g]]).T[::-1])
+    cw = np.mod(back - out, 2 * np.pi)
+    cw[cw == 0] = 2 * np.pi
+    first = np.lexsort((cw, h))
+    keep = np.ones(first.shape[0], dtype=bool)
+    keep[1:] = h[first[1:]] != h[first[:-1]]
+    nxt = np.empty(u.shape[0], dtype=np.int64)
+    nxt[h[first[keep]]] = g[first[keep]]
+    return nxt
+
+
+def cycles(nxt):
+    seen = np.zeros(nxt.shape[0], dtype=bool)
+    out = []
+    for h in range(nxt.shape[0]):
+        if seen[h]:
+            continue
+        cycle = [h]
+        seen[h] = True
+        g = nxt[h]
+        while g != h:
+            cycle.append(g)
+            seen[g] = True
+            g = nxt[g]
+        out.append(np.array(cycle))
+    return out
+
+
+def wrap(a):
+    return np.mod(a + np.pi, 2 * np.pi) - np.pi
+
+
+def rays(xy, u, v, edges, before=None, after=None, thickness=1.,
+         fan_angle=FAN_ANGLE, fan_step=FAN_STEP, blend=BLEND):
+    """
+    Base node, direction angle and stretch of the rays of one chain of wall
+    half-edges; before/after are the non-wall half-edges the chain starts
+    and ends on, None for a closed chain
+    """
+    t = xy[v[edges]] - xy[u[edges]]
+    length = np.hypot(*t.T)
+    tau = np.arctan2(t[:, 1], t[:, 0])
+    closed = before is None
+    # turn at every node between two wall edges, -pi where an embedded wall ends
+    prev = np.roll(edges, 1)
+    turn = wrap(tau - np.roll(tau, 1))
+    turn[(u[edges] == v[prev]) & (v[edges] == u[prev])] = -np.pi
+    # wall normal angle of every edge, unwrapped along the chain
+    alpha = tau[0] + np.pi / 2 + np.concatenate([[0.], np.cumsum(turn[1:])])
+    a_in = np.concatenate([[alpha[0] - turn[0]], alpha[:-1]])
+    s = np.concatenate([[0.], np.cumsum(length)])
+
+    if closed:
+        base, a_in, a_out, s = u[edges], a_in, alpha, s[:-1]
+        theta = a_in + turn / 2
+    else:
+        base = np.concatenate([u[edges], v[edges[-1:]]])
+        a_in = np.concatenate([[alpha[0]], alpha])
+        a_out = np.concatenate([alpha, [alpha[-1]]])
+        turn = np.concatenate([[0.], turn[1:], [0.]])
+        theta = a_in + turn / 2
+        # the end rays slide along the neighbouring boundary
+        theta[0] = alpha[0] + wrap(np.arctan2(*(xy[u[before]] - xy[v[before]])[::-1]) - alpha[0])
+        theta[-1] = alpha[-1] + wrap(np.arctan2(*(xy[v[after]] - xy[u[after]])[::-1]) - alpha[-1])
+        if np.abs(theta[[0, -1]] - alpha[[0, -1]]).max() >= np.pi / 2 - 1e-6:
+            raise ValueError("boundary layer ends on a boundary that does not leave the wall")
+
+    fan = turn < -math.radians(fan_angle)
+    # blend the rays around concave corners and chain ends
+    reach = blend * thickness
+    total = s[-1] + (length[-1] if closed else 0.)
+    anchors = [(c, turn[c] / 2) for c in np.flatnonzero(turn > math.radians(MIN_BLEND))]
+    if not closed:
+        anchors += [(0, theta[0] - alpha[0]), (len(base) - 1, theta[-1] - alpha[-1])]
+    free = ~fan
+    if not closed:
+        free[[0, -1]] = False
+    shift = np.zeros_like(theta)
+    for c, delta in anchors:
+        d = s - s[c]
+        if closed:
+            d = np.mod(d + total / 2, total) - total / 2
+        # a fan keeps its own rays, the blending dies out before it
+        ahead, behind = d[fan & (d > 0)], -d[fan & (d < 0)]
+        side = np.where(d > 0, min([reach, *ahead]), min([reach, *behind]))
+        w = np.clip(1 - np.abs(d) / side, 0, None)
+        w[c] = 0
+        # a concave corner pulls both sides towards its bisector, a chain end
+        # only turns its own neighbours towards the sliding direction
+        sign = np.where(d < 0, 1., -1.) if c not in (0, len(base) - 1) or closed else 1.
+        shift += sign * delta * w
+    theta[free] += shift[free]
+
+    dev = np.minimum(np.abs(theta - a_in), np.abs(theta - a_out))
+    stretch = 1 / np.maximum(np.cos(dev), 1 / MAX_STRETCH)
+
+    # expand the fans
+    count = np.where(fan, np.ceil(-turn / math.radians(fan_step)).astype(int) + 1, 1)
+    node = np.repeat(np.arange(len(base)), count)
+    k = np.arange(node.shape[0]) - np.repeat(np.cumsum(count) - count, count)
+    angle = np.where(fan[node], a_in[node] + turn[node] * k / np.maximum(count[node] - 1, 1),
+                     theta[node])
+    return base[node], angle, np.where(fan[node], 1., stretch[node])
+
+
+def cells(ids, closed, fan_base):
+    """
+    Quads (and first-layer triangles inside fans) between consecutive rays;
+    ids is (rays, layers + 1) with the wall node in column 0
+    """
+    a = np.arange(ids.shape[0] - (0 if closed else 1))
+    b = (a + 1) % ids.shape[0]
+    A, B = ids[a], ids[b]
+    quads = np.stack([A[:, :-1], B[:, :-1], B[:, 1:], A[:, 1:]], axis=-1)
+    same = fan_base[a] == fan_base[b]
+    tris = quads[same, 0][:, [0, 2, 3]]
+    keep = np.ones(quads.shape[:2], dtype=bool)
+    keep[same, 0] = False
+    return quads[keep], tris
+
+
+def area(xy, cells):
+    p = xy[cells]
+    return 0.5 * (p[..., 0] * np.roll(p[..., 1], -1, axis=1)
+                  - np.roll(p[..., 0], -1, axis=1) * p[..., 1]).sum(axis=1)
+
+
+def extrude(surface, walls, size, ratio=1.2, thickness=None, fan_angle=FAN_ANGLE,
+            fan_step=FAN_STEP, blend=BLEND):
+    """
+    Grow a boundary layer of quads off the wall curves of a built-in kernel
+    plane surface (walls may be embedded in it) and rebuild the rest of the
+    surface as the core to be meshed. Call after synchronize(), before
+    generate(); returns the core and layer surface tags, the layer heights
+    and the number of layer cells
+    """
+    H = heights(size, ratio, thickness if thickness is not None else 10 * size)
+    n = H.shape[0]
+    gmsh.model.mesh.generate(1)
+    tags, xy, u, v, curve, sense, wall = boundary(surface, walls)
+    nxt = successors(xy, u, v)
+
+    embedded = [(d, t) for d, t in gmsh.model.mesh.getEmbedded(2, surface)
+                if not (d == 1 and t in walls)]
+    ends = {}
+    for c in set(curve[~wall].tolist()):
+        ends[c] = endpoints(c)
+
+    # layer nodes and cells, ids past the mesh nodes number the new nodes
+    points, quads, tris, loops = [], [], [], []
+    # the rays at the layer ends, by their top node
+    sides = {}
+    num = xy.shape[0]
+    for cycle in cycles(nxt):
+        w = wall[cycle]
+        loop_area = area(xy, u[cycle][None])[0]
+        if not w.any():
+            loops.append((loop_area, [("curve", cycle)]))
+            continue
+        if not w.all():
+            # start at the beginning of a chain
+            start = np.flatnonzero(w & ~np.roll(w, 1))[0]
+            cycle, w = np.roll(cycle, -start), np.roll(w, -start)
+        pieces = []
+        breaks = np.flatnonzero(np.diff(w.astype(int))) + 1
+        for run in np.split(np.arange(cycle.shape[0]), breaks):
+            if not w[run[0]]:
+                pieces.append(("curve", cycle[run]))
+                continue
+            closed = w.all()
+            before = None if closed else cycle[run[0] - 1]
+            after = None if closed else cycle[(run[-1] + 1) % cycle.shape[0]]
+            base, angle, stretch = rays(xy, u, v, cycle[run], before, after, H[-1],
+                                        fan_angle, fan_step, blend)
+            d = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+            p = xy[base][:, None] + (H * stretch[:, None])[..., None] * d[:, None]
+            ids = np.empty((base.shape[0], n + 1), dtype=np.int64)
+            ids[:, 0] = base
+            ids[:, 1:] = num + np.arange(base.shape[0] * n).reshape(-1, n)
+            num += base.shape[0] * n
+            points.append(p.reshape(-1, 2))
+            q, t = cells(ids, closed, base)
+            quads.append(q), tris.append(t)
+            if not closed:
+                sides[ids[0, -1]], sides[ids[-1, -1]] = ids[0], ids[-1]
+            pieces.append(("front", ids[:, -1], closed))
+        loops.append((loop_area, pieces))
+
+    xy_all = np.concatenate([xy] + points)
+    quads = np.concatenate(quads) if quads else np.empty((0, 4), dtype=np.int64)
+    tris = np.concatenate(tris) if tris else np.empty((0, 3), dtype=np.int64)
+    folded = np.concatenate([quads[area(xy_all, quads) <= 0][:, 0], tris[area(xy_all, tris) <= 0][:, 0]])
+    if folded.size:
+        x, y = xy_all[folded[0]]
+        raise ValueError(f"boundary layer folds over in {folded.size} cells, first near ({x:.4g}, {y:.4g})")
+
+    # geometry of the core: the front as one-segment lines, and the cut
+    # boundary curves from the end of the layer to their far end
+    # removing entities drops them from their physical groups, keep a copy
+    groups = [(dim, tag, gmsh.model.getPhysicalName(dim, tag),
+               list(gmsh.model.getEntitiesForPhysicalGroup(dim, tag)))
+              for dim, tag in gmsh.model.getPhysicalGroups()]
+    gmsh.model.geo.remove([(2, surface)])
+    front_point = {}
+
+    def point(i):
+        if i not in front_point:
+            front_point[i] = gmsh.model.geo.addPoint(*xy_all[i], 0)
+        return front_point[i]
+
+    front_lines, replaced, side_points = [], {}, []
+    loop_tags = []
+    for loop_area, pieces in sorted(loops, key=lambda l: -l[0]):
+        signed = []
+        for k, piece in enumerate(pieces):
+            if piece[0] == "front":
+                _, top, closed = piece
+                idx = np.arange(top.shape[0] if closed else top.shape[0] - 1)
+                for i in idx:
+                    line = gmsh.model.geo.addLine(point(top[i]), point(top[(i + 1) % top.shape[0]]))
+                    front_lines.append(line)
+                    signed.append(line)
+                continue
+            hs = piece[1]
+            runs = np.split(hs, np.flatnonzero(np.diff(curve[hs]) | np.diff(sense[hs])) + 1)
+            start_top = pieces[k - 1][1][-1] if k > 0 else None
+            end_top = pieces[(k + 1) % len(pieces)][1][0] if len(pieces) > 1 else None
+            for j, r in enumerate(runs):
+                c, sgn = int(curve[r[0]]), int(sense[r[0]])
+                a, b = ends[c] if sgn > 0 else ends[c][::-1]
+                cut_a = j == 0 and start_top is not None
+                cut_b = j == len(runs) - 1 and end_top is not None
+                if not (cut_a or cut_b):
+                    signed.append(sgn * c)
+                    continue
+                if gmsh.model.getType(1, c) != "Line":
+                    raise ValueError(f"boundary layer ends on curve {c}, which is not a straight line")
+                line = gmsh.model.geo.addLine(point(start_top) if cut_a else a,
+                                              point(end_top) if cut_b else b)
+                replaced.setdefault(c, []).append(line)
+                if cut_a:
+                    side_points.append((a, start_top, c))
+                if cut_b:
+                    side_points.append((b, end_top, c))
+                signed.append(line)
+        loop_tags.append(gmsh.model.geo.addCurveLoop(signed))
+    core = gmsh.model.geo.addPlaneSurface(loop_tags)
+    # where the layer ends on a cut curve, a line from the wall to the front
+    # that gmsh meshes with the layer heights
+    side_lines = [(gmsh.model.geo.addLine(a, point(top)), top, c) for a, top, c in side_points]
+    gmsh.model.geo.remove([(1, c) for c in replaced])
+    gmsh.model.geo.synchronize()
+    for line in front_lines:
+        gmsh.model.mesh.setTransfiniteCurve(line, 2)
+    for line, _, _ in side_lines:
+        gmsh.model.mesh.setTransfiniteCurve(line, H.shape[0] + 1, "Progression", ratio)
+    for d, t in embedded:
+        gmsh.model.mesh.embed(d, [t], 2, core)
+
+    # remesh the curves, then match the wall and front nodes by position and
+    # take the nodes of the side lines in order
+    gmsh.model.mesh.generate(1)
+    new_tags, coords, _ = gmsh.model.mesh.getNodes()
+    at = {tuple(p): t for p, t in zip(coords.reshape(-1, 3)[:, :2].tolist(), new_tags.tolist())}
+    known = np.unique(np.concatenate([quads.ravel(), tris.ravel()]))
+    known = known[(known < xy.shape[0]) | np.isin(known, list(front_point))]
+    tag_of = np.zeros(xy_all.shape[0], dtype=np.uint64)
+    try:
+        tag_of[known] = [at[tuple(p)] for p in xy_all[known].tolist()]
+    except KeyError:
+        raise ValueError("the wall mesh changed when the curves were remeshed")
+    on_side = []
+    for line, top, _ in side_lines:
+        mid = sides[top][1:-1]
+        tags, coords, t = gmsh.model.mesh.getNodes(1, line)
+        order = np.argsort(t)
+        tag_of[mid] = tags[order]
+        xy_all[mid] = coords.reshape(-1, 3)[order, :2]
+        on_side.append(mid)
+    fresh = np.setdiff1d(np.arange(xy.shape[0], xy_all.shape[0]), np.concatenate([known] + on_side))
+    tag_of[fresh] = gmsh.model.mesh.getMaxNodeTag() + 1 + np.arange(fresh.shape[0])
+
+    layer = gmsh.model.addDiscreteEntity(2)
+    gmsh.model.mesh.addNodes(2, layer, tag_of[fresh], np.column_stack(
+        [xy_all[fresh], np.zeros(fresh.shape[0])]).ravel())
+    gmsh.model.mesh.addElementsByType(layer, 3, [], tag_of[quads].ravel())
+    if tris.size:
+        gmsh.model.mesh.addElementsByType(layer, 2, [], tag_of[tris].ravel())
+
+    # physical groups follow the surface and the cut curves
+    side_curves = {}
+    for line, _, c in side_lines:
+        side_curves.setdefault(c, []).append(line)
+    for dim, tag, name, entities in groups:
+        if dim == 2 and surface in entities:
+            entities = [e for e in entities if e != surface] + [core, layer]
+        elif dim == 1 and any(c in replaced for c in entities):
+            entities = [e for c in entities for e in
+                        (replaced[c] + side_curves.get(c, []) if c in replaced else [c])]
+        else:
+            continue
+        gmsh.model.removePhysicalGroups([(dim, tag)])
+        gmsh.model.addPhysicalGroup(dim, entities, tag)
+        gmsh.model.setPhysicalName(dim, tag, name)
+    return Layer(core, layer, H, quads.shape[0] + tris.shape[0])
@@ -0,0 +1,134 @@
+# Content-addressed cache of generated meshes
+#
+# A mesh is identified by the full parameter set it was generated from: the
+# source of the script and of every module of this directory it imports
+# (transfinite.py, sizefield.py, pipeline.py, ...), its module-level
+# constants, the call parameters, the derived layout (segment counts,
+# progression and bump coefficients) when the script has one, the gmsh
+# version and the output format. Entries live in CACHE_DIR
+# as <key>.<format> plus <key>.json and are evicted least recently used first
+# once the total size exceeds the budget.
+
+import ast
+import hashlib
+import json
+import os
+import tempfile
+import gmsh
+from pipeline import HERE, load_script
+
+CACHE_DIR = os.environ.get("MESH_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "meshes"))
+MAX_BYTES = int(float(os.environ.get("MESH_CACHE_MAX_BYTES", 20e9)))
+
+# parameters that change how a mesh is generated but not the mesh itself
+RUNTIME_PARAMS = ("threads",)
+
+
+def sources(path):
+    """
+    sha256 of the file at path and of every module of this directory it
+    imports, directly or not (imports inside functions included), by file name
+    """
+    out, todo = {}, [os.path.abspath(path)]
+    while todo:
+        path = todo.pop()
+        name = os.path.basename(path)
+        if name in out:
+            continue
+        with open(path, "rb") as f:
+            text = f.read()
+        out[name] = hashlib.sha256(text).hexdigest()
+        for node in ast.walk(ast.parse(text)):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for n in names:
+                local = os.path.join(HERE, n.split(".")[0] + ".py")
+                if os.path.exists(local):
+                    todo.append(local)
+    return dict(sorted(out.items()))
+
+
+def parameter_set(script, params, fmt="msh", module=None):
+    module = module or load_script(script)
+    constants = {k: v for k, v in vars(module).items()
+                 if not k.startswith("_") and isinstance(v, (bool, int, float, str))}
+    params = {k: v for k, v in params.items() if k not in RUNTIME_PARAMS}
+    pset = {"script": script, "sources": sources(module.__file__), "constants": constants,
+            "params": params, "gmsh": gmsh.__version__, "format": fmt}
+    if hasattr(module, "layout"):
+        pset["layout"] = module.layout(**params)
+    return pset
+
+
+def cache_key(pset):
+    text = json.dumps(pset, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def entries(cache_dir=CACHE_DIR):
+    # (last use, size, path) of every cached mesh, oldest first
+    out = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".json") or ".tmp." in name:
+            continue
+        path = os.path.join(cache_dir, name)
+        st = os.stat(path)
+        out.append((st.st_mtime, st.st_size, path))
+    return sorted(out)
+
+
+def evict(max_bytes=MAX_BYTES, cache_dir=CACHE_DIR, keep=()):
+    items = entries(cache_dir)
+    total = sum(size for _, size, _ in items)
+    for _, size, path in items:
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        for p in (path, os.path.splitext(path)[0] + ".json"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        total -= size
+    return total
+
+
+def fetch(script, params, fmt="msh", cache_dir=CACHE_DIR, max_bytes=MAX_BYTES,
+          refresh=False):
+    """
+    Path of the cached mesh for script(**params), generating it on a miss.
+    With refresh=True the mesh is always regenerated and its entry replaced.
+    Returns (path, stats, hit)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    module = load_script(script)
+    pset = parameter_set(script, params, fmt, module)
+    key = cache_key(pset)
+    path = os.path.join(cache_dir, f"{key}.{fmt}")
+    meta = os.path.join(cache_dir, f"{key}.json")
+
+    if not refresh and os.path.exists(path) and os.path.exists(meta):
+        os.utime(path)
+        with open(meta) as f:
+            return path, json.load(f)["stats"], True
+
+    # write to a temporary name so concurrent workers never see partial files
+    fd, tmp = tempfile.mkstemp(suffix=f".tmp.{fmt}", dir=cache_dir)
+    os.close(fd)
+    try:
+        stats = module.main(gui=False, output=tmp, **params)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    with open(meta, "w") as f:
+        json.dump({"parameters": pset, "stats": stats}, f, indent=1, default=str)
+    evict(max_bytes, cache_dir, keep=(path,))
+    return path, stats, False
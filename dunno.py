@@ -2,25 +2,28 @@
 
 # Contributed by Ekrem Ekici
 
-from math import pi, cos, sin, comb
+from math import pi, cos, sin
 import gmsh
 import os
 import sys
+import time
+import resource
 import numpy as np
-
-def cart2cyl(x, y, z):
-    # cartesian to cylindrical
-    rho = np.sqrt(x**2 + y**2)
-    phi = np.arctan2(y, x)
-    zeta = z
-    return rho, phi, zeta
-
-def cyl2cart(rho, phi, zeta):
-    # cylindrical to Cartesian
-    x = rho * np.cos(phi)
-    y = rho * np.sin(phi)
-    z = zeta
-    return x, y, z
+from ffd import cart2cyl, FFDOperator, rebuild_model, relocate_in_place, relocate_nodes
+
+# '-rebuild' copies the deformed mesh into a new discrete model entity by entity,
+# '-inplace' moves the nodes of the original model. The default is in place
+# on the gmsh versions listed in ffd.SET_NODE_TESTED (0.38 s against 0.76 s
+# for the rebuild at 152k nodes) and the rebuild on any other, where moving
+# the nodes through the public API is the slower of the two (1.81 s)
+rebuild = '-rebuild' in sys.argv or ('-inplace' not in sys.argv and not relocate_in_place())
+
+def rss_mb():
+    # current and peak resident set size
+    with open("/proc/self/statm") as f:
+        current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return current, peak
 
 gmsh.initialize()
 gmsh.option.setNumber("General.Terminal", 0)
@@ -39,13 +42,6 @@ gmsh.option.setNumber("Mesh.SaveAll", 0)
 
 gmsh.model.mesh.generate(3)
 
-# get mesh data
-mesh_data = {}
-for e in gmsh.model.getEntities():
-    mesh_data[e] = (gmsh.model.getBoundary([e]),
-            gmsh.model.mesh.getNodes(e[0], e[1]),
-            gmsh.model.mesh.getElements(e[0], e[1]))
-
 gmsh.write("cylinder.msh")
 
 ### Introducing FFD
@@ -83,65 +79,24 @@ for i in range(m):
     Pr[1, i, 4] -= 0.02
     Pz[1, i, 0] += 0.05 # change the z of the 1st points in the z direction
 
-# parametrize mesh nodes
-def calcSTU(coords, P0, dr, dphi, dz):
-    """
-    Calc STU coordinates
-    """
-    xs = coords[0::3]
-    ys = coords[1::3]
-    zs = coords[2::3]
-
-    rhos, phis, zetas = cart2cyl(xs, ys, zs)
-
-    s = (rhos - P0[0])/dr
-    t = (phis - P0[1])/dphi
-    u = (zetas - P0[2])/dz
-
-    return s,t,u
-
-gmsh.model.add('deformed_model')
-
-# deform the mesh using control points
-for e in mesh_data:
-    if len(mesh_data[e][1][1])==3:
-        old_coord = mesh_data[e][1][1]
-
-        s,t,u = calcSTU(old_coord,P0, dr, dphi, dz)
-        Xdef = np.zeros(3)
-        for i in range(l):
-            for j in range(m):
-                for k in range(n):
-                    Xdef += comb(l-1,i)*np.power(1-s, l-1-i)*np.power(s,i) * \
-                            comb(m-1,j)*np.power(1-t, m-1-j)*np.power(t,j) * \
-                            comb(n-1,k)*np.power(1-u, n-1-k)*np.power(u,k) * \
-                            np.asarray([Pr[i,j,k], Pphi[i,j,k], Pz[i,j,k]])
-        Xdef_3d_cart = Xdef.copy()
-        Xdef_3d_cart[0], Xdef_3d_cart[1],Xdef_3d_cart[2] = cyl2cart(Xdef[0], Xdef[1], Xdef[2])
-        new_coord = Xdef_3d_cart.flatten()
-
-    else:
-        old_coords = mesh_data[e][1][1]
-        s,t,u = calcSTU(old_coords,P0, dr, dphi, dz)
-        Xdef = np.zeros((int(len(old_coords)/3),3))
-        for point, param_s in enumerate(s):
-            for i in range(l):
-                for j in range(m):
-                    for k in range(n):
-                        Xdef[point] +=  comb(l-1,i)*np.power(1-s[point], l-1-i)*np.power(s[point],i) * \
-                                        comb(m-1,j)*np.power(1-t[point], m-1-j)*np.power(t[point],j) * \
-                                        comb(n-1,k)*np.power(1-u[point], n-1-k)*np.power(u[point],k) * \
-                                        np.asarray([Pr[i,j,k], Pphi[i,j,k], Pz[i,j,k]])
-
-
-        Xdef_3d_cart = Xdef.copy()
-        Xdef_3d_cart[:,0], Xdef_3d_cart[:,1],Xdef_3d_cart[:,2] = cyl2cart(Xdef[:,0], Xdef[:,1], Xdef[:,2])
-
-        new_coord = Xdef_3d_cart.flatten()
-
-    gmsh.model.addDiscreteEntity(e[0], e[1], [b[1] for b in mesh_data[e][0]])
-    gmsh.model.mesh.addNodes(e[0], e[1], mesh_data[e][1][0], new_coord)
-    gmsh.model.mesh.addElements(e[0], e[1], mesh_data[e][2][0], mesh_data[e][2][1], mesh_data[e][2][2])
+# the FFD weights only depend on the baseline nodes: build them once (or load
+# them from disk) and reuse them for every new set of control points
+all_nodes, all_coords, _ = gmsh.model.mesh.getNodes()
+ffd_op = FFDOperator.cached("cylinder_ffd.npz", all_coords, P0, dr, dphi, dz, (l, m, n))
+new_coords = ffd_op.apply(Pr, Pphi, Pz).reshape(-1, 3)
+
+tic = time.perf_counter()
+rss0, _ = rss_mb()
+
+if rebuild:
+    rebuild_model(all_nodes, new_coords)
+else:
+    # only the coordinates change, so move the nodes of the original model
+    relocate_nodes(all_nodes, new_coords)
+
+rss1, peak = rss_mb()
+print(f"{'rebuild' if rebuild else 'in-place'}: {len(all_nodes)} nodes updated in "
+      f"{time.perf_counter() - tic:.3f} s, RSS +{rss1 - rss0:.1f} MB (peak {peak:.1f} MB)")
 
 if '-nopopup' not in sys.argv:
     gmsh.fltk.run()
@@ -0,0 +1,253 @@
+# Batched free form deformation in cylindrical coordinates
+#
+# The lattice is given as three (l, m, n) arrays Pr, Pphi, Pz. Nodes are mapped
+# to (s, t, u) with calcSTU, the per-axis Bernstein bases are evaluated once per
+# chunk of nodes and contracted against the lattice in a single tensor product.
+
+from math import comb
+import hashlib
+import warnings
+import numpy as np
+
+CHUNK_SIZE = 1 << 16
+# gmsh API versions whose C setNode signature relocate_nodes calls directly;
+# on any other version the public gmsh.model.mesh.setNode it falls back to is
+# slower than rebuild_model, which dunno.py then uses by default
+SET_NODE_TESTED = ("4.15",)
+
+
+def cart2cyl(x, y, z):
+    # cartesian to cylindrical
+    rho = np.sqrt(x**2 + y**2)
+    phi = np.arctan2(y, x)
+    zeta = z
+    return rho, phi, zeta
+
+
+def cyl2cart(rho, phi, zeta):
+    # cylindrical to Cartesian
+    x = rho * np.cos(phi)
+    y = rho * np.sin(phi)
+    z = zeta
+    return x, y, z
+
+
+def calcSTU(coords, P0, dr, dphi, dz):
+    """
+    Calc STU coordinates
+    """
+    xs = coords[0::3]
+    ys = coords[1::3]
+    zs = coords[2::3]
+
+    rhos, phis, zetas = cart2cyl(xs, ys, zs)
+
+    s = (rhos - P0[0])/dr
+    t = (phis - P0[1])/dphi
+    u = (zetas - P0[2])/dz
+
+    return s, t, u
+
+
+def bernstein(n, x):
+    """
+    Bernstein basis of degree n - 1 at the points x, shape (len(x), n)
+    """
+    k = np.arange(n)
+    c = np.array([comb(n - 1, i) for i in range(n)], dtype=float)
+    x = np.asarray(x, dtype=float)[:, None]
+    return c * np.power(1 - x, n - 1 - k) * np.power(x, k)
+
+
+def lattice(Pr, Pphi, Pz):
+    # stack the control point arrays into a single (l, m, n, 3) lattice
+    return np.stack([Pr, Pphi, Pz], axis=-1)
+
+
+def deform_stu(s, t, u, P, chunk_size=CHUNK_SIZE):
+    """
+    Evaluate the trivariate Bernstein volume P (l, m, n, 3) at (s, t, u),
+    returning cylindrical coordinates of shape (len(s), 3)
+    """
+    l, m, n, _ = P.shape
+    s = np.atleast_1d(s)
+    t = np.atleast_1d(t)
+    u = np.atleast_1d(u)
+    out = np.empty((s.shape[0], 3))
+    for a in range(0, s.shape[0], chunk_size):
+        b = min(a + chunk_size, s.shape[0])
+        Bs = bernstein(l, s[a:b])
+        Bt = bernstein(m, t[a:b])
+        Bu = bernstein(n, u[a:b])
+        # contract the z axis first so the temporaries stay (chunk, l, m, 3)
+        Q = np.einsum("ck,ijkd->cijd", Bu, P)
+        Q = np.einsum("cj,cijd->cid", Bt, Q)
+        out[a:b] = np.einsum("ci,cid->cd", Bs, Q)
+    return out
+
+
+def deform(coords, P0, dr, dphi, dz, Pr, Pphi, Pz, chunk_size=CHUNK_SIZE):
+    """
+    Deform flat cartesian node coordinates [x0, y0, z0, x1, ...] and return
+    them in the same layout
+    """
+    s, t, u = calcSTU(np.asarray(coords, dtype=float), P0, dr, dphi, dz)
+    Xdef = deform_stu(s, t, u, lattice(Pr, Pphi, Pz), chunk_size)
+    out = np.empty_like(Xdef)
+    out[:, 0], out[:, 1], out[:, 2] = cyl2cart(Xdef[:, 0], Xdef[:, 1], Xdef[:, 2])
+    return out.flatten()
+
+
+class FFDOperator:
+    """
+    Linear map from a control lattice to deformed node positions
+
+    The Bernstein weights only depend on the baseline nodes, so they are
+    evaluated once into a dense (num_nodes, l*m*n) matrix W. Every new lattice
+    then costs one product W @ P followed by the cylindrical to cartesian
+    conversion. The Bernstein basis has global support, so W has no zeros
+    worth storing sparsely.
+    """
+
+    def __init__(self, W, shape, key=""):
+        self.W = W
+        self.shape = tuple(shape)
+        self.key = key
+
+    @classmethod
+    def build(cls, coords, P0, dr, dphi, dz, shape, chunk_size=CHUNK_SIZE,
+              dtype=np.float64):
+        l, m, n = shape
+        s, t, u = calcSTU(np.asarray(coords, dtype=float), P0, dr, dphi, dz)
+        W = np.empty((s.shape[0], l * m * n), dtype=dtype)
+        for a in range(0, s.shape[0], chunk_size):
+            b = min(a + chunk_size, s.shape[0])
+            Bs = bernstein(l, s[a:b])
+            Bt = bernstein(m, t[a:b])
+            Bu = bernstein(n, u[a:b])
+            W[a:b] = np.einsum("ci,cj,ck->cijk", Bs, Bt, Bu).reshape(b - a, -1)
+        return cls(W, shape, fingerprint(coords, P0, dr, dphi, dz, shape))
+
+    def save(self, path):
+        np.savez(path, W=self.W, shape=np.array(self.shape), key=self.key)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["W"], data["shape"], str(data["key"]))
+
+    @classmethod
+    def cached(cls, path, coords, P0, dr, dphi, dz, shape, **kwargs):
+        # reuse the weights stored in path if they were built from the same
+        # nodes and parameterization, otherwise rebuild and overwrite
+        key = fingerprint(coords, P0, dr, dphi, dz, shape)
+        try:
+            op = cls.load(path)
+            if op.key == key:
+                return op
+        except (OSError, KeyError, ValueError):
+            pass
+        op = cls.build(coords, P0, dr, dphi, dz, shape, **kwargs)
+        op.save(path)
+        return op
+
+    def apply(self, Pr, Pphi, Pz):
+        """
+        Deform the baseline nodes with one lattice (l, m, n) or a batch of
+        lattices (B, l, m, n). Returns flat cartesian coordinates of shape
+        (3 * num_nodes,) or (B, 3 * num_nodes)
+        """
+        P = np.stack([Pr, Pphi, Pz], axis=-1)
+        batched = P.ndim == 5
+        P = P.reshape((-1,) + self.shape + (3,))
+        B = P.shape[0]
+
+        # one product for the whole batch: (N, lmn) @ (lmn, 3B)
+        rhs = P.reshape(B, -1, 3).transpose(1, 0, 2).reshape(self.W.shape[1], -1)
+        Xdef = (self.W @ rhs).reshape(-1, B, 3).transpose(1, 0, 2)
+
+        out = np.empty_like(Xdef)
+        out[..., 0], out[..., 1], out[..., 2] = cyl2cart(
+            Xdef[..., 0], Xdef[..., 1], Xdef[..., 2])
+        out = out.reshape(B, -1)
+        return out if batched else out[0]
+
+
+def fingerprint(coords, P0, dr, dphi, dz, shape):
+    # identifies the baseline nodes and parameterization an operator was built for
+    h = hashlib.sha1(np.ascontiguousarray(coords, dtype=float).tobytes())
+    h.update(np.array([*P0, dr, dphi, dz, *shape], dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def relocate_in_place():
+    # whether relocate_nodes has its fast path on the installed gmsh, i.e.
+    # whether moving the nodes in place beats rebuild_model
+    import gmsh
+    return gmsh.GMSH_API_VERSION.rpartition(".")[0] in SET_NODE_TESTED
+
+
+def relocate_nodes(tags, coords):
+    """
+    Move existing nodes of the current gmsh model to new flat cartesian
+    coordinates, leaving entities and elements untouched
+    """
+    import gmsh
+
+    gmsh.model.mesh.rebuildNodeCache()
+    xyz = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 3)
+    tags = np.asarray(tags)
+    if relocate_in_place():
+        set_node_direct(gmsh, tags, xyz)
+        return
+    warnings.warn(f"gmsh {gmsh.GMSH_API_VERSION} is not in SET_NODE_TESTED: moving the "
+                  "nodes one public setNode call at a time, slower than rebuild_model")
+    # public path, entity by entity
+    order = np.argsort(tags)
+    sorted_tags = tags[order]
+    for dim, entity in gmsh.model.getEntities():
+        node_tags = gmsh.model.mesh.getNodes(dim, entity, includeBoundary=False,
+                                             returnParametricCoord=False)[0]
+        rows = order[np.searchsorted(sorted_tags, node_tags)]
+        for tag, row in zip(node_tags.tolist(), rows.tolist()):
+            gmsh.model.mesh.setNode(tag, xyz[row], [])
+
+
+def set_node_direct(gmsh, tags, xyz):
+    # gmshModelMeshSetNode of gmsh's C API (gmshc.h), the function
+    # gmsh.model.mesh.setNode wraps; the wrapper builds fresh ctypes buffers
+    # for every node, pointing the C function straight into xyz avoids that
+    # (0.38 s against 1.81 s for 152k nodes on gmsh 4.15, rebuild_model 0.76 s)
+    from ctypes import byref, c_int, c_size_t, c_void_p
+    set_node = gmsh.lib.gmshModelMeshSetNode
+    ierr = c_int()
+    base = xyz.ctypes.data
+    for i, tag in enumerate(tags.tolist()):
+        set_node(c_size_t(tag), c_void_p(base + 24 * i), c_size_t(3), None,
+                 c_size_t(0), byref(ierr))
+        if ierr.value != 0:
+            raise Exception(gmsh.logger.getLastError())
+
+
+def rebuild_model(tags, coords, name="deformed_model"):
+    """
+    Copy the current gmsh model into a new discrete model entity by entity,
+    with its nodes at new flat cartesian coordinates
+    """
+    import gmsh
+
+    xyz = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    tags = np.asarray(tags)
+    mesh_data = {}
+    for e in gmsh.model.getEntities():
+        mesh_data[e] = (gmsh.model.getBoundary([e]),
+                        gmsh.model.mesh.getNodes(e[0], e[1]),
+                        gmsh.model.mesh.getElements(e[0], e[1]))
+
+    gmsh.model.add(name)
+    order = np.argsort(tags)
+    for e, (boundary, nodes, elements) in mesh_data.items():
+        idx = order[np.searchsorted(tags, nodes[0], sorter=order)]
+        gmsh.model.addDiscreteEntity(e[0], e[1], [b[1] for b in boundary])
+        gmsh.model.mesh.addNodes(e[0], e[1], nodes[0], xyz[idx].flatten())
+        gmsh.model.mesh.addElements(e[0], e[1], *elements)
@@ -1,10 +1,13 @@
+import sys
 import gmsh
+import boundarylayer
+from pipeline import finish
 
-def main():
+def main(lc=0.01, bl_size=0.005, bl_ratio=1.1, bl_thickness=0.01, extrude=False,
+         gui=True, output=None):
     gmsh.initialize()
     gmsh.model.add("flatplate")
 
-    lc = 0.01
     l_domain = 2.0
     h_domain = 1.0
     l_plate = 1.0
@@ -35,12 +38,16 @@ def main():
     cl_domain = gmsh.model.geo.addCurveLoop([l1, l2, l3, l4])
     cl_plate = gmsh.model.geo.addCurveLoop([l5, l6, l7, l8])
 
-    _s1 = gmsh.model.geo.addPlaneSurface([cl_domain, cl_plate])
+    s1 = gmsh.model.geo.addPlaneSurface([cl_domain, cl_plate])
 
     gmsh.model.geo.synchronize()
 
     walls = [l5, l6, l7, l8]
 
+    gmsh.model.setPhysicalName(2, gmsh.model.addPhysicalGroup(2, [s1]), "fluid")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, [l1, l2, l3, l4]), "farfield")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, walls), "wall")
+
     dist = gmsh.model.mesh.field.add("Distance")
     gmsh.model.mesh.field.setNumbers(dist, "CurvesList", walls)
 
@@ -52,22 +59,25 @@ def main():
     # gmsh.model.mesh.field.setNumber(thresh, "DistMax", 0.5)
     # gmsh.model.mesh.field.setAsBackgroundMesh(thresh)
 
-    bl = gmsh.model.mesh.field.add("BoundaryLayer")
-    gmsh.model.mesh.field.setNumbers(bl, "CurvesList", walls)
-    gmsh.model.mesh.field.setNumber(bl, "Size", 0.005)
-    # gmsh.model.mesh.field.setNumber(bl, "Ratio", 1.1)
-    # gmsh.model.mesh.field.setNumber(bl, "Thickness", 0.1)
-    gmsh.model.mesh.field.setNumber(bl, "Quads", 1)
-    # gmsh.model.mesh.field.setNumbers(bl, "FanPointsList", [p5, p6, p7, p8])
-    # gmsh.model.mesh.field.setNumbers(bl, "FanPointsSizesList", [4, 4, 4, 4])
-
-    gmsh.model.mesh.field.setAsBoundaryLayer(bl)
+    if extrude:
+        # the same layer from boundarylayer.py, with fans at the plate corners
+        s1 = boundarylayer.extrude(s1, walls, bl_size, bl_ratio, bl_thickness).core
+    else:
+        bl = gmsh.model.mesh.field.add("BoundaryLayer")
+        gmsh.model.mesh.field.setNumbers(bl, "CurvesList", walls)
+        gmsh.model.mesh.field.setNumber(bl, "Size", bl_size)
+        gmsh.model.mesh.field.setNumber(bl, "Ratio", bl_ratio)
+        gmsh.model.mesh.field.setNumber(bl, "Thickness", bl_thickness)
+        gmsh.model.mesh.field.setNumber(bl, "Quads", 1)
+        # gmsh.model.mesh.field.setNumbers(bl, "FanPointsList", [p5, p6, p7, p8])
+        # gmsh.model.mesh.field.setNumbers(bl, "FanPointsSizesList", [4, 4, 4, 4])
+
+        gmsh.model.mesh.field.setAsBoundaryLayer(bl)
 
     gmsh.option.setNumber("Mesh.Algorithm", 6)
 
     gmsh.model.mesh.generate(2)
-    gmsh.fltk.run()
-    gmsh.finalize()
+    return finish(gui, output)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(gui="-nopopup" not in sys.argv)
\ No newline at end of file
@@ -0,0 +1,117 @@
+import sys
+import gmsh
+from math import radians, tan
+from pipeline import finish
+from inlet import (DOMAIN_LENGTH, DOMAIN_HEIGHT, INTAKE_LENGTH, INTAKE_HEIGHT,
+                   THROAT_HEIGHT, RAMP_LENGTH, RAMP_HEIGHT, RAMP_ANGLE_ONE,
+                   RAMP_ANGLE_TWO, COWL_ANGLE, COWL_HEIGHT, kink)
+
+# Same geometry as inlet.py, but the walls get a layer of structured quads
+# (gmsh's BoundaryLayer field) and only the rest of the domain is filled with
+# triangles, which grow from lc_wall at the edge of the layer to lc_far.
+# The layer starts at first_height and grows by ratio up to thickness, so the
+# wall spacing no longer dictates the triangle size.
+
+
+def main(
+    first_height=0.01,
+    ratio=1.2,
+    thickness=1.0,
+    lc_wall=0.5,
+    lc_far=2.0,
+    ramp_angle_one=RAMP_ANGLE_ONE,
+    ramp_angle_two=RAMP_ANGLE_TWO,
+    cowl_angle=COWL_ANGLE,
+    throat_height=THROAT_HEIGHT,
+    gui=True,
+    output=None,
+):
+    kink_length, kink_height = kink(ramp_angle_one, ramp_angle_two)
+    x_ramp_start = DOMAIN_LENGTH - INTAKE_LENGTH
+
+    gmsh.initialize()
+    gmsh.model.add("inlet-hybrid")
+
+    # domain bounds
+    p1 = gmsh.model.geo.addPoint(0, 0, 0, lc_wall)
+    p3 = gmsh.model.geo.addPoint(DOMAIN_LENGTH, DOMAIN_HEIGHT, 0, lc_far)
+    p4 = gmsh.model.geo.addPoint(0, DOMAIN_HEIGHT, 0, lc_far)
+
+    # ramp points
+    p5 = gmsh.model.geo.addPoint(x_ramp_start, 0, 0, lc_wall)
+    p6 = gmsh.model.geo.addPoint(x_ramp_start + kink_length, kink_height, 0, lc_wall)
+    p7 = gmsh.model.geo.addPoint(x_ramp_start + RAMP_LENGTH, RAMP_HEIGHT, 0, lc_wall)
+    p8 = gmsh.model.geo.addPoint(DOMAIN_LENGTH, RAMP_HEIGHT, 0, lc_wall)
+
+    # cowl points
+    p9 = gmsh.model.geo.addPoint(
+        x_ramp_start + RAMP_LENGTH, RAMP_HEIGHT + throat_height, 0, lc_wall
+    )
+    p10 = gmsh.model.geo.addPoint(DOMAIN_LENGTH, RAMP_HEIGHT + throat_height, 0, lc_wall)
+    p11 = gmsh.model.geo.addPoint(DOMAIN_LENGTH, INTAKE_HEIGHT, 0, lc_wall)
+    p12 = gmsh.model.geo.addPoint(
+        x_ramp_start + RAMP_LENGTH + COWL_HEIGHT / tan(radians(cowl_angle)),
+        INTAKE_HEIGHT,
+        0,
+        lc_wall,
+    )
+
+    # lines
+    l1 = gmsh.model.geo.addLine(p1, p5)
+    l2 = gmsh.model.geo.addLine(p5, p6)
+    l3 = gmsh.model.geo.addLine(p6, p7)
+    l4 = gmsh.model.geo.addLine(p7, p8)
+    l5 = gmsh.model.geo.addLine(p8, p10)
+    l6 = gmsh.model.geo.addLine(p10, p9)
+    l7 = gmsh.model.geo.addLine(p9, p12)
+    l8 = gmsh.model.geo.addLine(p12, p11)
+    l9 = gmsh.model.geo.addLine(p11, p3)
+    l10 = gmsh.model.geo.addLine(p3, p4)
+    l11 = gmsh.model.geo.addLine(p4, p1)
+
+    cl1 = gmsh.model.geo.addCurveLoop([l1, l2, l3, l4, l5, l6, l7, l8, l9, l10, l11])
+    sf1 = gmsh.model.geo.addPlaneSurface([cl1])
+    walls = [l1, l2, l3, l4, l6, l7, l8]
+
+    gmsh.model.geo.synchronize()
+
+    # triangle size: lc_wall from the walls out to the edge of the layer,
+    # then growing to lc_far
+    distance = gmsh.model.mesh.field.add("Distance")
+    gmsh.model.mesh.field.setNumbers(distance, "CurvesList", walls)
+
+    threshold = gmsh.model.mesh.field.add("Threshold")
+    gmsh.model.mesh.field.setNumber(threshold, "InField", distance)
+    gmsh.model.mesh.field.setNumber(threshold, "SizeMin", lc_wall)
+    gmsh.model.mesh.field.setNumber(threshold, "DistMin", thickness)
+    gmsh.model.mesh.field.setNumber(threshold, "SizeMax", lc_far)
+    gmsh.model.mesh.field.setNumber(threshold, "DistMax", 80.0)
+    gmsh.model.mesh.field.setAsBackgroundMesh(threshold)
+
+    # structured layer on the walls; it ends where the walls meet the inlet
+    # and the outlet, and fans around the sharp cowl lip
+    bl = gmsh.model.mesh.field.add("BoundaryLayer")
+    gmsh.model.mesh.field.setNumbers(bl, "CurvesList", walls)
+    gmsh.model.mesh.field.setNumber(bl, "Size", first_height)
+    gmsh.model.mesh.field.setNumber(bl, "Ratio", ratio)
+    gmsh.model.mesh.field.setNumber(bl, "Thickness", thickness)
+    gmsh.model.mesh.field.setNumber(bl, "Quads", 1)
+    gmsh.model.mesh.field.setNumbers(bl, "PointsList", [p1, p8, p10, p11])
+    gmsh.model.mesh.field.setNumbers(bl, "FanPointsList", [p9])
+    gmsh.model.mesh.field.setAsBoundaryLayer(bl)
+
+    gmsh.option.setNumber("Mesh.Algorithm", 6)
+
+    # physical groups, as in inlet.py
+    gmsh.model.setPhysicalName(2, gmsh.model.addPhysicalGroup(2, [sf1]), "fluid")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, [l11]), "inlet")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, [l5, l9]), "outlet")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, [l10]), "top")
+    gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, walls), "wall")
+
+    gmsh.model.mesh.generate(2)
+    return finish(gui, output)
+
+
+if __name__ == "__main__":
+    main(gui="-nopopup" not in sys.argv)
@@ -1,5 +1,12 @@
+import os
+import sys
 import gmsh
+import numpy as np
 from math import radians, tan
+from pipeline import finish
+from transfinite import inlet_grid
+from meshfile import write_msh
+from smooth import Smoother
 
 l0 = 150.0
 
@@ -12,38 +19,92 @@ ramp_height = 21.0
 ramp_angle_one, ramp_angle_two = 10.0, 22.0
 cowl_angle, cowl_height = 30.0, 8.0
 
-kink_length = (ramp_height - tan(radians(ramp_angle_two)) * ramp_length) / (
-    tan(radians(ramp_angle_one)) - tan(radians(ramp_angle_two))
-)
-kink_height = tan(radians(ramp_angle_one)) * kink_length
-y_split = ramp_height + throat_height
+scale_factor: int = 5
 
-x_start = 0.0
-x_ramp_start = domain_length - intake_length
-x_kink = x_ramp_start + kink_length
-x_throat_start = x_ramp_start + ramp_length
-x_cowl_tip = x_throat_start + (cowl_height / tan(radians(cowl_angle)))
-x_end = domain_length
+# clustering and smoothing
+bottom_progression = 1.005
+throat_bump = 0.05
+top_progression = 1.02
+smoothing = 10
 
-scale_factor: int = 5
-total_nx = 1024 * scale_factor
-total_ny = 500 * scale_factor
-ny_bottom = 380 * scale_factor
-ny_top = 120 * scale_factor
 
-nx_1 = int(round(((x_ramp_start - x_start) / domain_length) * total_nx))
-nx_2 = int(round(((x_kink - x_ramp_start) / domain_length) * total_nx))
-nx_3 = int(round(((x_throat_start - x_kink) / domain_length) * total_nx))
-nx_cowl = int(round(((x_cowl_tip - x_throat_start) / domain_length) * total_nx))
-nx_wake = int(round(((x_end - x_cowl_tip) / domain_length) * total_nx))
+def layout(
+    scale_factor=scale_factor,
+    ramp_angle_one=ramp_angle_one,
+    ramp_angle_two=ramp_angle_two,
+    cowl_angle=cowl_angle,
+    throat_height=throat_height,
+    smoothing=smoothing,
+    nested_levels=1,
+):
+    """
+    Derived block coordinates and node counts for one parameter set. With
+    nested_levels > 1 every segment count is rounded to a multiple of
+    2**(nested_levels - 1), so the grid can be halved nested_levels - 1 times
+    by dropping every other node (see family)
+    """
+    kink_length = (ramp_height - tan(radians(ramp_angle_two)) * ramp_length) / (
+        tan(radians(ramp_angle_one)) - tan(radians(ramp_angle_two))
+    )
+    kink_height = tan(radians(ramp_angle_one)) * kink_length
+    y_split = ramp_height + throat_height
+
+    x_start = 0.0
+    x_ramp_start = domain_length - intake_length
+    x_kink = x_ramp_start + kink_length
+    x_throat_start = x_ramp_start + ramp_length
+    x_cowl_tip = x_throat_start + (cowl_height / tan(radians(cowl_angle)))
+    x_end = domain_length
+
+    total_nx = 1024 * scale_factor
+    ny_bottom = 380 * scale_factor
+    ny_top = 120 * scale_factor
+
+    nx_1 = int(round(((x_ramp_start - x_start) / domain_length) * total_nx))
+    nx_2 = int(round(((x_kink - x_ramp_start) / domain_length) * total_nx))
+    nx_3 = int(round(((x_throat_start - x_kink) / domain_length) * total_nx))
+    nx_cowl = int(round(((x_cowl_tip - x_throat_start) / domain_length) * total_nx))
+    nx_wake = int(round(((x_end - x_cowl_tip) / domain_length) * total_nx))
+
+    current_sum = nx_1 + nx_2 + nx_3 + nx_cowl + nx_wake
+    diff = total_nx - current_sum
+    nx_wake += diff
+    nx_throat = nx_cowl + nx_wake
+
+    if nested_levels > 1:
+        m = 2 ** (nested_levels - 1)
+
+        def nest(n):
+            return m * max(1, int(round((n - 1) / m))) + 1
+
+        nx_1, nx_2, nx_3, nx_cowl, nx_wake = map(nest, (nx_1, nx_2, nx_3, nx_cowl, nx_wake))
+        ny_bottom, ny_top = nest(ny_bottom), nest(ny_top)
+        # the throat spans the cowl and wake segments
+        nx_throat = nx_cowl + nx_wake - 1
 
-current_sum = nx_1 + nx_2 + nx_3 + nx_cowl + nx_wake
-diff = total_nx - current_sum
-nx_wake += diff
-nx_throat = nx_cowl + nx_wake
+    return {
+        "x_start": x_start, "x_ramp_start": x_ramp_start, "x_kink": x_kink,
+        "x_throat_start": x_throat_start, "x_cowl_tip": x_cowl_tip, "x_end": x_end,
+        "kink_height": kink_height, "y_split": y_split,
+        "ramp_height": ramp_height, "intake_height": intake_height,
+        "domain_height": domain_height,
+        "nx_1": nx_1, "nx_2": nx_2, "nx_3": nx_3, "nx_cowl": nx_cowl,
+        "nx_wake": nx_wake, "nx_throat": nx_throat,
+        "ny_bottom": ny_bottom, "ny_top": ny_top,
+        "bottom_progression": bottom_progression, "throat_bump": throat_bump,
+        "top_progression": top_progression, "smoothing": smoothing,
+    }
 
 
-def main():
+def mesh(g, threads=1):
+    """Build and mesh the inlet for a layout dict, leaving gmsh initialized"""
+    x_start, x_ramp_start, x_kink = g["x_start"], g["x_ramp_start"], g["x_kink"]
+    x_throat_start, x_cowl_tip, x_end = g["x_throat_start"], g["x_cowl_tip"], g["x_end"]
+    kink_height, y_split = g["kink_height"], g["y_split"]
+    nx_1, nx_2, nx_3 = g["nx_1"], g["nx_2"], g["nx_3"]
+    nx_cowl, nx_wake, nx_throat = g["nx_cowl"], g["nx_wake"], g["nx_throat"]
+    ny_bottom, ny_top = g["ny_bottom"], g["ny_top"]
+
     gmsh.initialize()
     gmsh.model.add("inlet-structured-paper-exact")
     lc = 1.0 
@@ -142,11 +203,11 @@ def main():
 
     # settings
     for line in [l_inlet_bot, l_v1_bot, l_v2_bot]:
-        gmsh.model.mesh.setTransfiniteCurve(line, ny_bottom, "Progression", 1.005)
+        gmsh.model.mesh.setTransfiniteCurve(line, ny_bottom, "Progression", g["bottom_progression"])
     for line in [l_throat_inlet, l_out_int]:
-        gmsh.model.mesh.setTransfiniteCurve(line, ny_bottom, "Bump", 0.05)
+        gmsh.model.mesh.setTransfiniteCurve(line, ny_bottom, "Bump", g["throat_bump"])
     for line in [l_inlet_top, l_v1_top, l_v2_top, l_v3, l_v4, l_out_ext]:
-        gmsh.model.mesh.setTransfiniteCurve(line, ny_top, "Progression", 1.02)
+        gmsh.model.mesh.setTransfiniteCurve(line, ny_top, "Progression", g["top_progression"])
 
     # transfinite surfaces
     gmsh.model.mesh.setTransfiniteSurface(s1_b, cornerTags=[p1, p5, p18, p17])
@@ -182,10 +243,61 @@ def main():
     gmsh.model.setPhysicalName(1, wall, "wall")
 
     gmsh.option.setNumber("Mesh.RecombineAll", 1)
-    gmsh.option.setNumber("Mesh.Smoothing", 10)
+    gmsh.option.setNumber("Mesh.Smoothing", g["smoothing"])
+    # the curves are meshed once up front; the surfaces only share those nodes,
+    # so gmsh can mesh them on separate threads without changing the result
+    # (the speedup is unmeasured so far, see bench_parallel.py)
+    gmsh.option.setNumber("General.NumThreads", threads)
+    gmsh.option.setNumber("Mesh.MaxNumThreads2D", threads)
+    gmsh.model.mesh.generate(1)
     gmsh.model.mesh.generate(2)
-    gmsh.fltk.run()
-    gmsh.finalize()
+
+
+def main(gui=True, output=None, threads=1, **params):
+    mesh(layout(**params), threads)
+    return finish(gui, output)
+
+
+def family(levels=3, outdir=None, source="gmsh", threads=1, **params):
+    """
+    Nested grid-convergence family. Only the finest grid is meshed, with the
+    counts of layout(nested_levels=levels); level l keeps every other node of
+    level l - 1 in every block. Returns [(grid, node_map, cell_map)] from
+    fine to coarse, the maps of level l pointing into level l - 1 (see
+    StructuredGrid.coarsen; None for the finest). With outdir, every level is
+    written as binary MSH 4.1 (level<l>.msh) with its maps as .npy.
+    source="numpy" interpolates the finest grid with transfinite.py instead
+    of meshing it with gmsh, and runs g["smoothing"] sweeps of smooth.py in
+    place of Mesh.Smoothing
+    """
+    g = layout(nested_levels=levels, **params)
+    grid = inlet_grid(g)
+    if source == "gmsh":
+        mesh(g, threads)
+        tags, xyz, _ = gmsh.model.mesh.getNodes()
+        gmsh.finalize()
+        grid.xyz[tags.astype(np.int64) - 1] = xyz.reshape(-1, 3)
+    elif g["smoothing"]:
+        Smoother(grid).run(g["smoothing"])
+
+    grids = [(grid, None, None)]
+    for _ in range(levels - 1):
+        grids.append(grids[-1][0].coarsen(2))
+
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+        for level, (grid, node_map, cell_map) in enumerate(grids):
+            write_msh(grid, os.path.join(outdir, f"level{level}.msh"))
+            if node_map is not None:
+                np.save(os.path.join(outdir, f"level{level}_nodes.npy"), node_map)
+                np.save(os.path.join(outdir, f"level{level}_cells.npy"), cell_map)
+    return grids
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "-nested" in sys.argv:
+        # python inlet-structured-two.py -nested 3
+        levels = int(sys.argv[sys.argv.index("-nested") + 1])
+        family(levels, os.path.join("meshes", "nested"))
+    else:
+        main(gui="-nopopup" not in sys.argv)
\ No newline at end of file
@@ -1,5 +1,7 @@
+import sys
 import gmsh
 from math import radians, tan
+from pipeline import finish
 
 # --- Constants ---
 L0 = 150.0
@@ -12,32 +14,8 @@ RAMP_HEIGHT = 21.0
 RAMP_ANGLE_ONE, RAMP_ANGLE_TWO = 10.0, 22.0
 COWL_ANGLE, COWL_HEIGHT = 30.0, 8.0
 
-# Derived Geometrics
-KINK_LENGTH = (RAMP_HEIGHT - tan(radians(RAMP_ANGLE_TWO)) * RAMP_LENGTH) / (
-    tan(radians(RAMP_ANGLE_ONE)) - tan(radians(RAMP_ANGLE_TWO))
-)
-KINK_HEIGHT = tan(radians(RAMP_ANGLE_ONE)) * KINK_LENGTH
-Y_SPLIT = RAMP_HEIGHT + THROAT_HEIGHT  # The logical split line (y approx 36.0)
-
-# X-Coordinates
-x_start = 0.0
-x_ramp_start = DOMAIN_LENGTH - INTAKE_LENGTH
-x_kink = x_ramp_start + KINK_LENGTH
-x_throat_start = x_ramp_start + RAMP_LENGTH
-x_cowl_tip = x_throat_start + (COWL_HEIGHT / tan(radians(COWL_ANGLE)))
-x_end = DOMAIN_LENGTH
-
 # --- Grid Resolution ---
 total_divisions = 1024
-total_length = DOMAIN_LENGTH
-
-# Streamwise Counts
-NX_1 = int(round(((x_ramp_start - x_start) / total_length) * total_divisions))
-NX_2 = int(round(((x_kink - x_ramp_start) / total_length) * total_divisions))
-NX_3 = int(round(((x_throat_start - x_kink) / total_length) * total_divisions))
-NX_COWL = int(round(((x_cowl_tip - x_throat_start) / total_length) * total_divisions))
-NX_WAKE = int(round(((x_end - x_cowl_tip) / total_length) * total_divisions))
-NX_THROAT = NX_COWL + NX_WAKE
 
 # --- VERTICAL CLUSTERING UPDATE ---
 # Total = 500
@@ -45,7 +23,69 @@ NX_THROAT = NX_COWL + NX_WAKE
 NY_WALL = 400 
 NY_FAR = 100
 
-def main():
+# Clustering coefficients
+WALL_PROGRESSION = 1.05
+FAR_PROGRESSION = 1.02
+THROAT_BUMP = 0.05
+COWL_PROGRESSION = 1.01
+
+
+def layout(
+    ramp_angle_one=RAMP_ANGLE_ONE,
+    ramp_angle_two=RAMP_ANGLE_TWO,
+    cowl_angle=COWL_ANGLE,
+    throat_height=THROAT_HEIGHT,
+    total_divisions=total_divisions,
+    ny_wall=NY_WALL,
+    ny_far=NY_FAR,
+):
+    """Derived block coordinates and node counts for one parameter set"""
+    # Derived Geometrics
+    kink_length = (RAMP_HEIGHT - tan(radians(ramp_angle_two)) * RAMP_LENGTH) / (
+        tan(radians(ramp_angle_one)) - tan(radians(ramp_angle_two))
+    )
+    kink_height = tan(radians(ramp_angle_one)) * kink_length
+    y_split = RAMP_HEIGHT + throat_height  # The logical split line (y approx 36.0)
+
+    # X-Coordinates
+    x_start = 0.0
+    x_ramp_start = DOMAIN_LENGTH - INTAKE_LENGTH
+    x_kink = x_ramp_start + kink_length
+    x_throat_start = x_ramp_start + RAMP_LENGTH
+    x_cowl_tip = x_throat_start + (COWL_HEIGHT / tan(radians(cowl_angle)))
+    x_end = DOMAIN_LENGTH
+    total_length = DOMAIN_LENGTH
+
+    # Streamwise Counts
+    nx_1 = int(round(((x_ramp_start - x_start) / total_length) * total_divisions))
+    nx_2 = int(round(((x_kink - x_ramp_start) / total_length) * total_divisions))
+    nx_3 = int(round(((x_throat_start - x_kink) / total_length) * total_divisions))
+    nx_cowl = int(round(((x_cowl_tip - x_throat_start) / total_length) * total_divisions))
+    nx_wake = int(round(((x_end - x_cowl_tip) / total_length) * total_divisions))
+
+    return {
+        "x_start": x_start, "x_ramp_start": x_ramp_start, "x_kink": x_kink,
+        "x_throat_start": x_throat_start, "x_cowl_tip": x_cowl_tip, "x_end": x_end,
+        "kink_height": kink_height, "y_split": y_split,
+        "ramp_height": RAMP_HEIGHT, "intake_height": INTAKE_HEIGHT,
+        "domain_height": DOMAIN_HEIGHT,
+        "nx_1": nx_1, "nx_2": nx_2, "nx_3": nx_3, "nx_cowl": nx_cowl,
+        "nx_wake": nx_wake, "nx_throat": nx_cowl + nx_wake,
+        "ny_wall": ny_wall, "ny_far": ny_far,
+        "wall_progression": WALL_PROGRESSION, "far_progression": FAR_PROGRESSION,
+        "throat_bump": THROAT_BUMP, "cowl_progression": COWL_PROGRESSION,
+    }
+
+
+def main(gui=True, output=None, threads=1, **params):
+    g = layout(**params)
+    x_start, x_ramp_start, x_kink = g["x_start"], g["x_ramp_start"], g["x_kink"]
+    x_throat_start, x_cowl_tip, x_end = g["x_throat_start"], g["x_cowl_tip"], g["x_end"]
+    KINK_HEIGHT, Y_SPLIT = g["kink_height"], g["y_split"]
+    NX_1, NX_2, NX_3 = g["nx_1"], g["nx_2"], g["nx_3"]
+    NX_COWL, NX_WAKE, NX_THROAT = g["nx_cowl"], g["nx_wake"], g["nx_throat"]
+    NY_WALL, NY_FAR = g["ny_wall"], g["ny_far"]
+
     gmsh.initialize()
     gmsh.model.add("inlet-structured-highres")
     lc = 1.0 
@@ -156,21 +196,21 @@ def main():
     # 1. Ramp Boundary Layer (Stronger Clustering)
     # Increased Progression to 1.05 to pack cells harder at the wall (p1, p5, p6)
     for l in [l_inlet_bot, l_v1_bot, l_v2_bot]:
-        gmsh.model.mesh.setTransfiniteCurve(l, NY_WALL, "Progression", 1.05)
+        gmsh.model.mesh.setTransfiniteCurve(l, NY_WALL, "Progression", g["wall_progression"])
     
     # 2. Freestream (Coarser)
     for l in [l_inlet_top, l_v1_top, l_v2_top, l_v3]:
-        gmsh.model.mesh.setTransfiniteCurve(l, NY_FAR, "Progression", 1.02)
+        gmsh.model.mesh.setTransfiniteCurve(l, NY_FAR, "Progression", g["far_progression"])
 
     # 3. Throat (Double Clustering)
     # "Bump" packs cells at BOTH ends (Top and Bottom walls)
     # 400 Cells here ensures excellent resolution for both boundary layers
     for l in [l_throat_inlet, l_out_int]:
-        gmsh.model.mesh.setTransfiniteCurve(l, NY_WALL, "Bump", 0.05)
+        gmsh.model.mesh.setTransfiniteCurve(l, NY_WALL, "Bump", g["throat_bump"])
 
     # 4. Cowl Top (External)
     for l in [l_v4, l_out_ext]:
-        gmsh.model.mesh.setTransfiniteCurve(l, NY_FAR, "Progression", 1.01)
+        gmsh.model.mesh.setTransfiniteCurve(l, NY_FAR, "Progression", g["cowl_progression"])
 
     # Corners
     gmsh.model.mesh.setTransfiniteSurface(s1_b, cornerTags=[p1, p5, p18, p17])
@@ -201,9 +241,14 @@ def main():
     gmsh.model.setPhysicalName(1, gmsh.model.addPhysicalGroup(1, wall_lines), "wall")
 
     gmsh.option.setNumber("Mesh.RecombineAll", 1)
+    # the curves are meshed once up front; the surfaces only share those nodes,
+    # so gmsh can mesh them on separate threads without changing the result
+    # (the speedup is unmeasured so far, see bench_parallel.py)
+    gmsh.option.setNumber("General.NumThreads", threads)
+    gmsh.option.setNumber("Mesh.MaxNumThreads2D", threads)
+    gmsh.model.mesh.generate(1)
     gmsh.model.mesh.generate(2)
-    gmsh.fltk.run()
-    gmsh.finalize()
+    return finish(gui, output)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(gui="-nopopup" not in sys.argv)
\ No newline at end of file
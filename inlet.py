@@ -1,5 +1,8 @@
+import sys
 import gmsh
 from math import radians, tan
+from pipeline import finish
+import sizefield
 
 L0 = 150
 
@@ -10,17 +13,33 @@ RAMP_HEIGHT = 21.0
 RAMP_ANGLE_ONE, RAMP_ANGLE_TWO = 10.0, 22.0
 COWL_ANGLE, COWL_HEIGHT = 30.0, 8.0
 
-KINK_LENGTH = (RAMP_HEIGHT - tan(radians(RAMP_ANGLE_TWO)) * RAMP_LENGTH) / (
-    tan(radians(RAMP_ANGLE_ONE)) - tan(radians(RAMP_ANGLE_TWO))
-)
-KINK_HEIGHT = tan(radians(RAMP_ANGLE_ONE)) * KINK_LENGTH
 
+def kink(ramp_angle_one, ramp_angle_two):
+    # where the two ramp segments meet
+    kink_length = (RAMP_HEIGHT - tan(radians(ramp_angle_two)) * RAMP_LENGTH) / (
+        tan(radians(ramp_angle_one)) - tan(radians(ramp_angle_two))
+    )
+    return kink_length, tan(radians(ramp_angle_one)) * kink_length
+
+
+KINK_LENGTH, KINK_HEIGHT = kink(RAMP_ANGLE_ONE, RAMP_ANGLE_TWO)
+
+
+def main(
+    lc_wall=0.05,
+    lc_far=2.0,
+    ramp_angle_one=RAMP_ANGLE_ONE,
+    ramp_angle_two=RAMP_ANGLE_TWO,
+    cowl_angle=COWL_ANGLE,
+    throat_height=THROAT_HEIGHT,
+    size_grid=None,
+    gui=True,
+    output=None,
+):
+    kink_length, kink_height = kink(ramp_angle_one, ramp_angle_two)
 
-def main():
     gmsh.initialize()
     gmsh.model.add("inlet")
-    lc_wall = 0.05
-    lc_far = 2.0
 
     # domain bounds
     p1 = gmsh.model.geo.addPoint(0, 0, 0, lc_wall)
@@ -31,7 +50,7 @@ def main():
     # ramp points
     p5 = gmsh.model.geo.addPoint(DOMAIN_LENGTH - INTAKE_LENGTH, 0, 0, lc_wall)
     p6 = gmsh.model.geo.addPoint(
-        DOMAIN_LENGTH - INTAKE_LENGTH + KINK_LENGTH, KINK_HEIGHT, 0, lc_wall
+        DOMAIN_LENGTH - INTAKE_LENGTH + kink_length, kink_height, 0, lc_wall
     )
     p7 = gmsh.model.geo.addPoint(
         DOMAIN_LENGTH - INTAKE_LENGTH + RAMP_LENGTH, RAMP_HEIGHT, 0, lc_wall
@@ -41,19 +60,19 @@ def main():
     # cowl points
     p9 = gmsh.model.geo.addPoint(
         DOMAIN_LENGTH - INTAKE_LENGTH + RAMP_LENGTH,
-        RAMP_HEIGHT + THROAT_HEIGHT,
+        RAMP_HEIGHT + throat_height,
         0,
         lc_wall,
     )
     p10 = gmsh.model.geo.addPoint(
-        DOMAIN_LENGTH, RAMP_HEIGHT + THROAT_HEIGHT, 0, lc_wall
+        DOMAIN_LENGTH, RAMP_HEIGHT + throat_height, 0, lc_wall
     )
     p11 = gmsh.model.geo.addPoint(DOMAIN_LENGTH, INTAKE_HEIGHT, 0, lc_wall)
     p12 = gmsh.model.geo.addPoint(
         DOMAIN_LENGTH
         - INTAKE_LENGTH
         + RAMP_LENGTH
-        + (COWL_HEIGHT / tan(radians(COWL_ANGLE))),
+        + (COWL_HEIGHT / tan(radians(cowl_angle))),
         INTAKE_HEIGHT,
         0,
         lc_wall,
@@ -81,18 +100,23 @@ def main():
 
     gmsh.model.geo.synchronize()
 
-    # distance field
-    distance: int = gmsh.model.mesh.field.add("Distance")
-    gmsh.model.mesh.field.setNumbers(distance, "CurvesList", walls)
-
-    # threshold field
-    threshold = gmsh.model.mesh.field.add("Threshold")
-    gmsh.model.mesh.field.setNumber(threshold, "InField", distance)
-    gmsh.model.mesh.field.setNumber(threshold, "SizeMin", lc_wall)
-    gmsh.model.mesh.field.setNumber(threshold, "DistMin", 6.0)
-    gmsh.model.mesh.field.setNumber(threshold, "SizeMax", lc_far)
-    gmsh.model.mesh.field.setNumber(threshold, "DistMax", 80.0)
-    gmsh.model.mesh.field.setAsBackgroundMesh(threshold)
+    if size_grid:
+        # the same threshold, sampled once onto a grid of spacing size_grid
+        threshold, _ = sizefield.threshold_field(walls, size_grid, lc_wall, lc_far, 6.0, 80.0)
+        gmsh.model.mesh.field.setAsBackgroundMesh(threshold)
+    else:
+        # distance field
+        distance: int = gmsh.model.mesh.field.add("Distance")
+        gmsh.model.mesh.field.setNumbers(distance, "CurvesList", walls)
+
+        # threshold field
+        threshold = gmsh.model.mesh.field.add("Threshold")
+        gmsh.model.mesh.field.setNumber(threshold, "InField", distance)
+        gmsh.model.mesh.field.setNumber(threshold, "SizeMin", lc_wall)
+        gmsh.model.mesh.field.setNumber(threshold, "DistMin", 6.0)
+        gmsh.model.mesh.field.setNumber(threshold, "SizeMax", lc_far)
+        gmsh.model.mesh.field.setNumber(threshold, "DistMax", 80.0)
+        gmsh.model.mesh.field.setAsBackgroundMesh(threshold)
 
     # meshing algorithm
     gmsh.option.setNumber("Mesh.Algorithm", 6)
@@ -106,15 +130,14 @@ def main():
 
     gmsh.model.setPhysicalName(2, fluid, "fluid")
     gmsh.model.setPhysicalName(1, inlet, "inlet")
-    gmsh.model.setPhysicalName(2, outlet, "outlet")
-    gmsh.model.setPhysicalName(2, top, "top")
-    gmsh.model.setPhysicalName(2, wall, "wall")
+    gmsh.model.setPhysicalName(1, outlet, "outlet")
+    gmsh.model.setPhysicalName(1, top, "top")
+    gmsh.model.setPhysicalName(1, wall, "wall")
 
     # generate and write out
     gmsh.model.mesh.generate(2)
-    gmsh.fltk.run()
-    gmsh.finalize()
+    return finish(gui, output)
 
 
 if __name__ == "__main__":
-    main()
+    main(gui="-nopopup" not in sys.argv)
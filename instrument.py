@@ -0,0 +1,225 @@
+# Per-phase instrumentation of the mesh generation scripts
+#
+# Recorder patches the gmsh calls the scripts go through (synchronize, field
+# setup, generate, recombine, optimize, write) so that every call becomes a
+# phase, and the Python time between two calls (building the geometry) a
+# "script" phase, without touching the scripts themselves. generate(dim) is
+# split into one call per dimension so 1D and 2D meshing are timed apart.
+# RecombineAll, Mesh.Smoothing and size fields act inside gmsh's per-surface
+# 2D meshing, so their cost lands in "mesh 2D"; the options in effect are
+# recorded with each mesh phase so runs with and without them can be compared.
+#
+# Each phase record holds wall and CPU time, the peak RSS reached during the
+# phase (the kernel high-water mark is reset at the start of every phase),
+# the entity/node/element counts after it and, with log=True, gmsh's own
+# "Done ... (Wall, CPU)" timings and log lines. Records are appended to a
+# JSON-lines report:
+#
+#   python run.py inlet -p lc_wall=0.2,0.1 --report phases.jsonl --gmsh-log
+#   python instrument.py phases.jsonl
+
+import json
+import os
+import re
+import resource
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+import gmsh
+from pipeline import mesh_stats
+
+# (namespace, function) pairs recorded as phases, named "<namespace>.<function>"
+CALLS = [("geo", "synchronize"), ("occ", "synchronize"),
+         ("mesh", "recombine"), ("mesh", "optimize"), ("mesh", "refine"),
+         ("mesh", "setOrder"), ("mesh", "removeDuplicateNodes"),
+         ("field", "setAsBackgroundMesh"), ("field", "setAsBoundaryLayer"),
+         ("gmsh", "write"), ("gmsh", "open"), ("gmsh", "merge")]
+
+# options recorded with every mesh phase
+MESH_OPTIONS = ["Mesh.Algorithm", "Mesh.RecombineAll", "Mesh.RecombinationAlgorithm",
+                "Mesh.Smoothing", "Mesh.MeshSizeMin", "Mesh.MeshSizeMax",
+                "Mesh.MeshSizeFromPoints", "Mesh.MeshSizeExtendFromBoundary",
+                "Mesh.MaxNumThreads2D"]
+
+DONE = re.compile(r"Done (.+?) \(Wall ([0-9.eE+-]+)s, CPU ([0-9.eE+-]+)s\)")
+
+
+def namespace(name):
+    return {"geo": gmsh.model.geo, "occ": gmsh.model.occ, "mesh": gmsh.model.mesh,
+            "field": gmsh.model.mesh.field, "gmsh": gmsh}[name]
+
+
+def rss_mb():
+    # current and peak resident set size since the last reset_peak
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS", "VmHWM")):
+                key, value = line.split(":")
+                status[key] = int(value.split()[0]) / 2**10
+    if not status:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+        return peak, peak
+    return status["VmRSS"], status["VmHWM"]
+
+
+def reset_peak():
+    # writing 5 to clear_refs resets the high-water mark (Linux >= 4.0);
+    # elsewhere the peak stays the process-wide ru_maxrss
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def mesh_dim():
+    # highest dimension that already has elements
+    for dim in (3, 2, 1):
+        if len(gmsh.model.mesh.getElementTypes(dim)):
+            return dim
+    return 0
+
+
+class Recorder:
+    """
+    Collects one record per phase; use as a context manager around a script's
+    main(). meta (script, params, ...) is copied into every record
+    """
+
+    def __init__(self, log=False, **meta):
+        self.log = log
+        self.meta = {"run": uuid.uuid4().hex[:12], **meta}
+        self.records = []
+        self._saved = []
+        self._seen = 0
+        self._depth = 0
+
+    def __enter__(self):
+        self._last = self._start = (time.perf_counter(), time.process_time())
+        reset_peak()
+        for ns, fn in CALLS:
+            self._patch(namespace(ns), fn, self._wrap(f"{ns}.{fn}", getattr(namespace(ns), fn)))
+        self._patch(gmsh.model.mesh, "generate", self._generate(gmsh.model.mesh.generate))
+        self._patch(gmsh, "initialize", self._initialize(gmsh.initialize))
+        self._patch(gmsh, "finalize", self._finalize(gmsh.finalize))
+        return self
+
+    def __exit__(self, *exc):
+        self._gap()
+        for obj, name, original in reversed(self._saved):
+            setattr(obj, name, original)
+        self._saved = []
+
+    def _patch(self, obj, name, wrapper):
+        self._saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, wrapper)
+
+    def _wrap(self, name, fn):
+        def call(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return call
+
+    def _generate(self, generate):
+        def call(dim=3):
+            start = mesh_dim() + 1 if gmsh.isInitialized() else 1
+            for d in range(start, dim + 1) if start <= dim else [dim]:
+                with self.phase(f"mesh {d}D", options=True):
+                    generate(d)
+        return call
+
+    def _initialize(self, initialize):
+        def call(*args, **kwargs):
+            initialize(*args, **kwargs)
+            if self.log:
+                gmsh.logger.start()
+                self._seen = 0
+        return call
+
+    def _finalize(self, finalize):
+        def call():
+            # the time since the last phase still belongs to the model
+            self._gap()
+            if self.log:
+                gmsh.logger.stop()
+            finalize()
+        return call
+
+    def _gap(self):
+        wall = time.perf_counter() - self._last[0]
+        if wall > 1e-3:
+            self._record("script", wall, time.process_time() - self._last[1])
+
+    @contextmanager
+    def phase(self, name, options=False):
+        # nested calls (write -> synchronize, ...) belong to the outer phase
+        if self._depth:
+            yield
+            return
+        self._gap()
+        reset_peak()
+        self._depth += 1
+        tic, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            wall, cpu = time.perf_counter() - tic, time.process_time() - cpu
+            self._record(name, wall, cpu, options)
+
+    def _record(self, name, wall, cpu, options=False):
+        current, peak = rss_mb()
+        record = {**self.meta, "seq": len(self.records), "phase": name,
+                  "wall": wall, "cpu": cpu, "rss_mb": current, "peak_rss_mb": peak}
+        if gmsh.isInitialized():
+            record["entities"] = [len(gmsh.model.getEntities(d)) for d in range(4)]
+            record.update(mesh_stats())
+            if options:
+                record["options"] = {k: gmsh.option.getNumber(k) for k in MESH_OPTIONS}
+                record["fields"] = len(gmsh.model.mesh.field.list())
+            if self.log:
+                lines = gmsh.logger.get()[self._seen:]
+                self._seen += len(lines)
+                record["gmsh"] = {m.group(1): {"wall": float(m.group(2)), "cpu": float(m.group(3))}
+                                  for m in map(DONE.search, lines) if m}
+                record["log"] = [l for l in lines if not l.startswith("Progress")]
+        self.records.append(record)
+        reset_peak()
+        self._last = (time.perf_counter(), time.process_time())
+
+    def total(self, **extra):
+        # whole run, with the process-wide peak RSS
+        self._record("total", time.perf_counter() - self._start[0],
+                     time.process_time() - self._start[1])
+        self.records[-1]["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+        self.records[-1].update(extra)
+
+    def write(self, path):
+        # one write per run, so parallel cases can append to the same report
+        text = "".join(json.dumps(r, default=str) + "\n" for r in self.records)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, text.encode())
+        finally:
+            os.close(fd)
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def table(records, keys=("script", "params", "phase", "wall", "cpu", "peak_rss_mb",
+                         "nodes", "elements")):
+    # per-phase table of a report, runs in the order they were written
+    from run import summary
+    rows = [{k: (json.dumps(r.get(k)) if k == "params" else r.get(k, "")) for k in keys}
+            for r in records]
+    return summary(rows)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(table(load(path)))
@@ -0,0 +1,385 @@
+# Streaming writers for StructuredGrid meshes (see transfinite.py)
+#
+# write_msh emits binary MSH 4.1 entity by entity, filling one preallocated
+# chunk buffer at a time, so the only full-size array is the grid itself.
+# write_raw emits a sidecar directory of .npy arrays plus a JSON header, which
+# numpy can memory-map back without copying.
+#
+# MshMesh and RawMesh open those files again as read-only np.memmap views:
+# only the section and block headers are parsed, the arrays stay on disk and
+# are paged in (and shared between processes) on first touch.
+
+import json
+import mmap
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+
+CHUNK = 1 << 16
+
+# gmsh element types
+LINE, QUAD = 1, 3
+
+# nodes per element for the gmsh element types these scripts produce
+NODES_PER_ELEMENT = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6,
+                     10: 9, 11: 10, 15: 1, 16: 8, 17: 20, 18: 15, 19: 13}
+
+NodeBlock = namedtuple("NodeBlock", "dim tag tags xyz")
+ElementBlock = namedtuple("ElementBlock", "dim tag type tags nodes")
+
+
+def physical_tags(physicals):
+    # tags in creation order, as gmsh.model.addPhysicalGroup assigns them: one
+    # counter shared by all dimensions
+    return {key: k + 1 for k, key in enumerate(physicals)}
+
+
+def entity_tags(grid):
+    points = {name: k + 1 for k, name in enumerate(grid.points)}
+    curves = {name: k + 1 for k, name in enumerate(grid.curves)}
+    surfaces = {name: k + 1 for k, name in enumerate(grid.surfaces)}
+    return points, curves, surfaces
+
+
+def element_offsets(grid):
+    # element tags as gmsh.write numbers them with Mesh.SaveAll=0: only the
+    # saved elements, lines of the physical curves first, then the quads
+    phys = entity_physicals(grid)
+    offsets, tag = {}, 1
+    for name, c in grid.curves.items():
+        if (1, name) in phys:
+            offsets[(1, name)] = tag
+            tag += c[2] - 1
+    for name in grid.surfaces:
+        ni, nj = grid.size(name)
+        offsets[(2, name)] = tag
+        tag += (ni - 1) * (nj - 1)
+    return offsets
+
+
+def entity_physicals(grid):
+    ptags = physical_tags(grid.physicals)
+    out = {}
+    for (dim, group), members in grid.physicals.items():
+        for name in members:
+            out.setdefault((dim, name), []).append(ptags[(dim, group)])
+    return out
+
+
+def _block_bounds(grid, name):
+    ids = np.concatenate([grid.side_ids(s) for s in grid.surfaces[name][:4]])
+    x = grid.xyz[ids]
+    return x.min(0), x.max(0)
+
+
+def write_msh(grid, path, chunk=CHUNK):
+    """
+    Write grid as binary MSH 4.1 with its physical groups; lines are written
+    for curves that belong to a physical group, quads for every block
+    """
+    ptags = physical_tags(grid.physicals)
+    phys = entity_physicals(grid)
+    point_tags, curve_tags, surface_tags = entity_tags(grid)
+    eoff = element_offsets(grid)
+    xyz = grid.xyz
+    f64, u64, i32 = np.dtype("<f8"), np.dtype("<u8"), np.dtype("<i4")
+
+    def ints(*v):
+        return np.array(v, dtype=i32).tobytes()
+
+    def sizes(*v):
+        return np.array(v, dtype=u64).tobytes()
+
+    def doubles(*v):
+        return np.array(v, dtype=f64).tobytes()
+
+    with open(path, "wb") as f:
+        f.write(b"$MeshFormat\n4.1 1 8\n" + ints(1) + b"\n$EndMeshFormat\n")
+
+        f.write(b"$PhysicalNames\n%d\n" % len(ptags))
+        for (dim, name), tag in ptags.items():
+            f.write(b'%d %d "%s"\n' % (dim, tag, name.encode()))
+        f.write(b"$EndPhysicalNames\n")
+
+        # entities
+        f.write(b"$Entities\n" + sizes(len(grid.points), len(grid.curves),
+                                         len(grid.surfaces), 0))
+        for name, (x, y) in grid.points.items():
+            p = phys.get((0, name), [])
+            f.write(ints(point_tags[name]) + doubles(x, y, 0.) + sizes(len(p)) + ints(*p))
+        for name, (a, b, *_ ) in grid.curves.items():
+            x = xyz[[grid.curve_ids[name][0], grid.curve_ids[name][-1]]]
+            p = phys.get((1, name), [])
+            f.write(ints(curve_tags[name]) + doubles(*x.min(0), *x.max(0))
+                    + sizes(len(p)) + ints(*p)
+                    + sizes(2) + ints(point_tags[a], -point_tags[b]))
+        for name, (bottom, right, top, left, _) in grid.surfaces.items():
+            lo, hi = _block_bounds(grid, name)
+            p = phys.get((2, name), [])
+            loop = [curve_tags[bottom[0]] * (-1 if bottom[1] else 1),
+                    curve_tags[right[0]] * (-1 if right[1] else 1),
+                    curve_tags[top[0]] * (1 if top[1] else -1),
+                    curve_tags[left[0]] * (1 if left[1] else -1)]
+            f.write(ints(surface_tags[name]) + doubles(*lo, *hi)
+                    + sizes(len(p)) + ints(*p) + sizes(4) + ints(*loop))
+        f.write(b"\n$EndEntities\n")
+
+        # nodes, one block per entity
+        num_nodes = xyz.shape[0]
+        blocks = len(grid.points) + len(grid.curves) + len(grid.surfaces)
+        f.write(b"$Nodes\n" + sizes(blocks, num_nodes, 1, num_nodes))
+        for name in grid.points:
+            k = point_tags[name] - 1
+            f.write(ints(0, point_tags[name], 0) + sizes(1) + sizes(k + 1)
+                    + xyz[k].astype(f64).tobytes())
+
+        def node_range(dim, tag, start, count):
+            # contiguous node indices [start, start + count)
+            f.write(ints(dim, tag, 0) + sizes(count))
+            for a in range(start, start + count, chunk):
+                b = min(a + chunk, start + count)
+                f.write(np.arange(a + 1, b + 1, dtype=u64).tobytes())
+            for a in range(start, start + count, chunk):
+                b = min(a + chunk, start + count)
+                f.write(xyz[a:b].astype(f64, copy=False).tobytes())
+
+        for name, c in grid.curves.items():
+            ids = grid.curve_ids[name]
+            node_range(1, curve_tags[name], int(ids[1]) if c[2] > 2 else 0, c[2] - 2)
+        for name in grid.surfaces:
+            ids = grid.block_ids[name]
+            ni, nj = ids.shape
+            start = int(ids[1, 1]) if ni > 2 and nj > 2 else 0
+            node_range(2, surface_tags[name], start, (ni - 2) * (nj - 2))
+        f.write(b"\n$EndNodes\n")
+
+        # elements: lines on physical curves, quads on every block
+        physical_curves = [n for n in grid.curves if (1, n) in phys]
+        num_lines = sum(grid.curves[n][2] - 1 for n in physical_curves)
+        num_quads = grid.num_cells()
+        f.write(b"$Elements\n" + sizes(len(physical_curves) + len(grid.surfaces),
+                                       num_lines + num_quads, 1, num_lines + num_quads))
+        buf = np.empty((chunk, 5), dtype=u64)
+        for name in physical_curves:
+            ids = grid.curve_ids[name]
+            n = ids.shape[0] - 1
+            f.write(ints(1, curve_tags[name], LINE) + sizes(n))
+            for a in range(0, n, chunk):
+                b = min(a + chunk, n)
+                out = buf[:b - a, :3]
+                out[:, 0] = np.arange(eoff[(1, name)] + a, eoff[(1, name)] + b)
+                out[:, 1] = ids[a:b] + 1
+                out[:, 2] = ids[a + 1:b + 1] + 1
+                f.write(out.tobytes())
+        for name in grid.surfaces:
+            ids = grid.block_ids[name]
+            ni, nj = ids.shape
+            f.write(ints(2, surface_tags[name], QUAD) + sizes((ni - 1) * (nj - 1)))
+            # a few rows of the block at a time, in the order of grid.quads
+            rows = max(1, chunk // (nj - 1))
+            tag = eoff[(2, name)]
+            for a in range(0, ni - 1, rows):
+                b = min(a + rows, ni - 1)
+                n = (b - a) * (nj - 1)
+                out = buf[:n].reshape(b - a, nj - 1, 5)
+                out[..., 0] = np.arange(tag, tag + n).reshape(b - a, nj - 1)
+                out[..., 1] = ids[a:b, :-1] + 1
+                out[..., 2] = ids[a + 1:b + 1, :-1] + 1
+                out[..., 3] = ids[a + 1:b + 1, 1:] + 1
+                out[..., 4] = ids[a:b, 1:] + 1
+                f.write(out.tobytes())
+                tag += n
+        f.write(b"\n$EndElements\n")
+
+
+def write_raw(grid, path, chunk=CHUNK, index_dtype=np.int64):
+    """
+    Write grid as a directory of .npy arrays plus header.json:
+    nodes.npy (N, 3), quads.npy (E, 4, 0-based), one (n, 2) line array per
+    1D physical group and the quad range of every block for 2D groups
+    """
+    os.makedirs(path, exist_ok=True)
+    xyz = grid.xyz
+    nodes = np.lib.format.open_memmap(os.path.join(path, "nodes.npy"), "w+",
+                                      np.float64, xyz.shape)
+    for a in range(0, xyz.shape[0], chunk):
+        nodes[a:a + chunk] = xyz[a:a + chunk]
+    nodes.flush()
+    del nodes
+
+    quads = np.lib.format.open_memmap(os.path.join(path, "quads.npy"), "w+",
+                                      index_dtype, (grid.num_cells(), 4))
+    ranges, start = {}, 0
+    for name in grid.surfaces:
+        ids = grid.block_ids[name]
+        ni, nj = ids.shape
+        ranges[name] = [start, start + (ni - 1) * (nj - 1)]
+        rows = max(1, chunk // (nj - 1))
+        for a in range(0, ni - 1, rows):
+            b = min(a + rows, ni - 1)
+            n = (b - a) * (nj - 1)
+            out = quads[start:start + n].reshape(b - a, nj - 1, 4)
+            out[..., 0] = ids[a:b, :-1]
+            out[..., 1] = ids[a + 1:b + 1, :-1]
+            out[..., 2] = ids[a + 1:b + 1, 1:]
+            out[..., 3] = ids[a:b, 1:]
+            start += n
+    quads.flush()
+    del quads
+
+    ptags = physical_tags(grid.physicals)
+    groups = []
+    for (dim, name), members in grid.physicals.items():
+        group = {"dim": dim, "tag": ptags[(dim, name)], "name": name, "entities": members}
+        if dim == 1:
+            lines = np.concatenate([grid.lines(m) for m in members]).astype(index_dtype)
+            np.save(os.path.join(path, f"group_{name}.npy"), lines)
+            group["file"] = f"group_{name}.npy"
+        else:
+            group["quad_ranges"] = [ranges[m] for m in members]
+        groups.append(group)
+
+    header = {"format": "structured-raw 1", "num_nodes": int(xyz.shape[0]),
+              "num_quads": int(grid.num_cells()), "nodes": "nodes.npy",
+              "quads": "quads.npy", "blocks": ranges,
+              "block_shapes": {n: list(grid.size(n)) for n in grid.surfaces},
+              "physical_groups": groups}
+    with open(os.path.join(path, "header.json"), "w") as f:
+        json.dump(header, f, indent=1)
+
+
+class MshMesh:
+    """
+    Read-only memory-mapped view of a binary MSH 4.1 file
+
+    node_blocks: NodeBlock(dim, tag, tags, xyz) per entity, tags (n,) and
+        xyz (n, 3) as np.memmap
+    element_blocks: ElementBlock(dim, tag, type, tags, nodes) per entity and
+        type, nodes (n, nodes per element); both are strided views of the
+        interleaved records, nothing is copied
+    physical_groups: {(dim, name): (tag, [entity tags])}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.node_blocks, self.element_blocks = [], []
+        self.physical_names, self.entity_physicals = {}, {}
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            pos = 0
+            while True:
+                start = m.find(b"$", pos)
+                if start < 0:
+                    break
+                eol = m.find(b"\n", start)
+                section = m[start + 1:eol].strip().decode()
+                # binary readers return where their data ends, so the search
+                # for the end marker never scans through binary payloads
+                read = getattr(self, "_" + section, None)
+                data_end = read(m, eol + 1) if read is not None else None
+                end = m.find(b"$End" + section.encode(), data_end or eol)
+                pos = m.find(b"\n", end) + 1
+        self.physical_groups = {}
+        for (dim, tag), name in self.physical_names.items():
+            entities = [t for (d, t), p in self.entity_physicals.items() if d == dim and tag in p]
+            self.physical_groups[(dim, name)] = (tag, entities)
+
+    def _MeshFormat(self, m, pos):
+        version, binary, size = m[pos:m.find(b"\n", pos)].split()
+        if version != b"4.1" or binary != b"1" or size != b"8":
+            raise ValueError(f"{self.path}: expected binary MSH 4.1 with 8-byte sizes")
+        if struct.unpack_from("<i", m, m.find(b"\n", pos) + 1)[0] != 1:
+            raise ValueError(f"{self.path}: not little-endian")
+
+    def _PhysicalNames(self, m, pos):
+        lines = m[pos:m.find(b"$End", pos)].decode().splitlines()
+        for line in lines[1:int(lines[0]) + 1]:
+            dim, tag, name = line.split(maxsplit=2)
+            self.physical_names[(int(dim), int(tag))] = name.strip('"')
+
+    def _Entities(self, m, pos):
+        counts = struct.unpack_from("<4Q", m, pos)
+        pos += 32
+        for dim, count in enumerate(counts):
+            for _ in range(count):
+                tag, = struct.unpack_from("<i", m, pos)
+                pos += 4 + (24 if dim == 0 else 48)
+                n, = struct.unpack_from("<Q", m, pos)
+                self.entity_physicals[(dim, tag)] = struct.unpack_from(f"<{n}i", m, pos + 8)
+                pos += 8 + 4 * n
+                if dim > 0:
+                    n, = struct.unpack_from("<Q", m, pos)
+                    pos += 8 + 4 * n
+        return pos
+
+    def _Nodes(self, m, pos):
+        blocks, = struct.unpack_from("<Q", m, pos)
+        pos += 32
+        for _ in range(blocks):
+            dim, tag, parametric, n = struct.unpack_from("<3iQ", m, pos)
+            pos += 20
+            tags = np.memmap(self.path, "<u8", "r", pos, (n,)) if n else np.empty(0, "<u8")
+            pos += 8 * n
+            width = 3 + dim if parametric else 3
+            xyz = (np.memmap(self.path, "<f8", "r", pos, (n, width))[:, :3] if n
+                   else np.empty((0, 3)))
+            pos += 8 * width * n
+            self.node_blocks.append(NodeBlock(dim, tag, tags, xyz))
+        return pos
+
+    def _Elements(self, m, pos):
+        blocks, = struct.unpack_from("<Q", m, pos)
+        pos += 32
+        for _ in range(blocks):
+            dim, tag, etype, n = struct.unpack_from("<3iQ", m, pos)
+            pos += 20
+            if etype not in NODES_PER_ELEMENT:
+                raise ValueError(f"{self.path}: unsupported element type {etype}")
+            width = 1 + NODES_PER_ELEMENT[etype]
+            records = np.memmap(self.path, "<u8", "r", pos, (n, width))
+            self.element_blocks.append(ElementBlock(dim, tag, etype, records[:, 0], records[:, 1:]))
+            pos += 8 * width * n
+        return pos
+
+    def num_nodes(self):
+        return sum(b.tags.shape[0] for b in self.node_blocks)
+
+    def group(self, dim, name):
+        """element blocks of the physical group (dim, name)"""
+        _, entities = self.physical_groups[(dim, name)]
+        return [b for b in self.element_blocks if b.dim == dim and b.tag in entities]
+
+
+class RawMesh:
+    """
+    Read-only memory-mapped view of a write_raw directory
+
+    nodes (N, 3) and quads (E, 4, 0-based) are np.memmap; blocks maps each
+    surface to its quad range; group(name) returns the (n, 2) line array of a
+    1D group or the quad slices of a 2D group
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        self.nodes = np.load(os.path.join(path, self.header["nodes"]), mmap_mode="r")
+        self.quads = np.load(os.path.join(path, self.header["quads"]), mmap_mode="r")
+        self.blocks = {name: slice(a, b) for name, (a, b) in self.header["blocks"].items()}
+        self.physical_groups = {(g["dim"], g["name"]): g for g in self.header["physical_groups"]}
+
+    def block(self, name):
+        """(ni - 1, nj - 1, 4) quads of one surface"""
+        ni, nj = self.header["block_shapes"][name]
+        return self.quads[self.blocks[name]].reshape(ni - 1, nj - 1, 4)
+
+    def group(self, name):
+        g = next(g for (_, n), g in self.physical_groups.items() if n == name)
+        if "file" in g:
+            return np.load(os.path.join(self.path, g["file"]), mmap_mode="r")
+        return [self.quads[a:b] for a, b in g["quad_ranges"]]
+
+
+def load(path):
+    """MshMesh for a .msh file, RawMesh for a write_raw directory"""
+    return RawMesh(path) if os.path.isdir(path) else MshMesh(path)
@@ -0,0 +1,144 @@
+# Geometry morphing of a structured inlet grid for design sweeps
+#
+#   python morph.py inlet-structured meshes/inlet-structured.msh -p ramp_angle_one=8,9,10
+#   python morph.py inlet-structured-two base.msh scale_factor=2 -p cowl_angle=28,32 -o sweep
+#   python bench_morph.py
+#
+# Sweeps over ramp_angle_one, ramp_angle_two, cowl_angle and throat_height
+# keep the nine blocks; only the streamwise counts would follow the kink and
+# the cowl tip, and here they stay at the baseline's. Instead of remeshing,
+# the baseline grid is moved:
+#   the block corners go to their positions in the new layout
+#   the nodes of every (straight) curve slide onto the new curve, each at its
+#   fraction of the baseline arc length
+#   every block interior moves by the transfinite interpolation of the
+#   displacement of its four sides (transfinite.coons, with u and v taken
+#   from the baseline sides)
+# Connectivity and node numbering are those of the baseline, and whatever
+# the baseline interior holds (gmsh's smoothing, say) is carried along
+# rather than recomputed. On a plain transfinite baseline the result is the
+# transfinite grid of the new layout at the baseline counts.
+
+import os
+import sys
+import time
+import numpy as np
+from transfinite import StructuredGrid, arc_fraction, coons, inlet_topology
+
+# layout keys that fix the topology and the node distribution
+COUNTS = ("nx_", "ny_")
+
+
+def fixed_layout(module, baseline, **params):
+    # the script's layout for params, with the node counts of the baseline layout
+    g = module.layout(**params)
+    g.update({k: v for k, v in baseline.items() if k.startswith(COUNTS)})
+    return g
+
+
+def baseline_grid(g, xyz):
+    """
+    StructuredGrid of the layout g holding the nodes of a mesh of it, e.g.
+    read back with quality.load (row k is node tag k + 1)
+    """
+    grid = StructuredGrid.__new__(StructuredGrid)
+    grid.points, grid.curves, grid.surfaces, grid.physicals = inlet_topology(g)
+    num_nodes, _ = grid._number()
+    if xyz.shape[0] != num_nodes:
+        raise ValueError(f"the mesh has {xyz.shape[0]} nodes, the layout {num_nodes}")
+    grid.xyz = np.asarray(xyz, dtype=np.float64)
+    return grid
+
+
+class Morph:
+    """
+    Moves a baseline StructuredGrid to new layouts of the same topology
+
+    The curve fractions and the block parameters only depend on the
+    baseline, so they are computed once; each layout then costs the curve
+    placement and one interpolation per block.
+    """
+
+    def __init__(self, grid):
+        self.base = grid
+        xy = grid.xyz[:, :2]
+        self.t = {name: arc_fraction(xy[ids])[:, None] for name, ids in grid.curve_ids.items()}
+        self.uv = {name: (arc_fraction(xy[grid.side_ids(s[0])]), arc_fraction(xy[grid.side_ids(s[1])]))
+                   for name, s in grid.surfaces.items()}
+
+    def apply(self, g, out=None):
+        """
+        (num_nodes, 3) nodes of the baseline moved to the layout g, written
+        into out when given
+        """
+        base = self.base
+        points, curves, _, _ = inlet_topology(g)
+        for name, (a, b, n, _, _) in curves.items():
+            if n != base.curves[name][2]:
+                raise ValueError(f"{name}: {n} nodes, the baseline has {base.curves[name][2]}")
+        # every node is a curve node or a block interior node, all rewritten
+        xyz = np.empty_like(base.xyz) if out is None else out
+        xyz[:, 2] = base.xyz[:, 2]
+        for name, ids in base.curve_ids.items():
+            a, b = (np.asarray(points[p]) for p in curves[name][:2])
+            xyz[ids, :2] = (1. - self.t[name]) * a + self.t[name] * b
+        for name, (bottom, right, top, left, _) in base.surfaces.items():
+            ni, nj = base.size(name)
+            if ni < 3 or nj < 3:
+                continue
+            sides = [xyz[base.side_ids(s), :2] - base.xyz[base.side_ids(s), :2]
+                     for s in (bottom, right, top, left)]
+            d = coons(*self.uv[name], *sides, rows=slice(1, -1))[:, 1:-1]
+            start = base.block_ids[name][1, 1]
+            interior = slice(start, start + (ni - 2) * (nj - 2))
+            xyz[interior, :2] = base.xyz[interior, :2] + d.reshape(-1, 2)
+        return xyz
+
+    def grid(self, g, out=None):
+        # StructuredGrid of the layout g sharing the baseline's numbering
+        grid = StructuredGrid.__new__(StructuredGrid)
+        grid.__dict__.update(self.base.__dict__)
+        grid.points = inlet_topology(g)[0]
+        grid.xyz = self.apply(g, out)
+        return grid
+
+
+def main(argv):
+    import quality
+    from meshfile import write_msh
+    from pipeline import load_script
+    from run import parse_sweep, parse_value, summary
+
+    args = argv[1:]
+    outdir = "meshes"
+    if "-o" in args:
+        i = args.index("-o")
+        outdir = args[i + 1]
+        del args[i:i + 2]
+    sweeps = []
+    while "-p" in args:
+        i = args.index("-p")
+        sweeps.append(args[i + 1])
+        del args[i:i + 2]
+    script, path = args[:2]
+    params = {name: parse_value(value) for name, _, value in (a.partition("=") for a in args[2:])}
+
+    module = load_script(script)
+    g0 = module.layout(**params)
+    morph = Morph(baseline_grid(g0, quality.load(path)[0]))
+    os.makedirs(outdir, exist_ok=True)
+    rows = []
+    for variant in parse_sweep(sweeps):
+        tic = time.perf_counter()
+        grid = morph.grid(fixed_layout(module, g0, **{**params, **variant}))
+        moved = time.perf_counter() - tic
+        output = os.path.join(outdir, "_".join([script] + [f"{k}-{v}" for k, v in variant.items()]) + ".msh")
+        tic = time.perf_counter()
+        write_msh(grid, output)
+        rows.append({**variant, "morph": moved, "write": time.perf_counter() - tic,
+                     "output": output})
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,323 @@
+# Partitioning of a generated mesh into per-rank pieces with ghost layers
+#
+#   python partition.py meshes/inlet.msh parts/inlet -k 16 [-ghosts 2]
+#   python partition.py inlet-structured-two parts/inlet2 -k 64 scale_factor=5
+#   python run.py inlet -p lc_wall=0.1 --partition 16
+#   python bench_partition.py                  # Metis on the tri + quad meshes, checked
+#
+# Unstructured meshes are split by gmsh's bundled Metis (multilevel k-way on
+# the dual graph). The structured inlet is split along its blocks, either
+# its gmsh mesh or the grid transfinite.py builds from the layout without
+# gmsh (partition_grid): blocks are cut into px x py grids of sub-blocks
+# close to square, either one per part (every block gets parts in
+# proportion to its cells) or in pieces of at most num_cells / k cells (or
+# a half or quarter of that) packed largest first onto the parts, whichever
+# balances better. Every part boundary lies on a grid line. Global indices
+# are positions in tag order, i.e. tag - 1 for gmsh's compact numbering.
+# Cells come as blocks of one element type each (triangles and quads of a
+# hybrid mesh), numbered globally one block after the other.
+#
+# Part k is written to part<k>.npz in outdir, so every rank reads only its
+# own piece:
+#   cells        (m, v) local node indices: owned cells first (ascending
+#                global index), then ghost layer 1, then layer 2; v is the
+#                largest node count, cells with fewer (the triangles of a
+#                mixed mesh) are padded with -1
+#   nodes        (n, 3) coordinates: nodes of owned cells first, then ghosts
+#   cell_global  (m,) global cell index of every local cell (local -> global)
+#   node_global  (n,) global node index of every local node
+#   cell_g2l     (m, 2) (global, local) pairs sorted by global index, the
+#   node_g2l     (n, 2) global -> local map for a searchsorted lookup
+#   cell_owner   (m,) part owning every local cell
+#   node_owner   (n,) part owning every local node (lowest part touching it)
+#   bfaces       (b, 4) local cell, local nodes a, b, physical group tag
+# Ghosts are face neighbours: layer l holds the cells sharing an edge with
+# layer l - 1 that are not already present. header.json records the part
+# sizes and the physical group names.
+
+import json
+import os
+import sys
+import numpy as np
+import gmsh
+from adaptive import tag_index
+from renumber import cell_graph
+
+GHOSTS = 2
+
+
+def cell_types():
+    # highest dimension holding elements and its element types
+    dim = max(d for d in (1, 2, 3) if len(gmsh.model.mesh.getElementTypes(d)))
+    return dim, gmsh.model.mesh.getElementTypes(dim)
+
+
+def from_gmsh():
+    """
+    Cell blocks [(n, v)] of node indices, one per element type of the
+    highest dimension, coordinates and boundary groups {tag: (name, lines)}
+    of the current gmsh model
+    """
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    # nodes come per entity; a renumbered mesh has them out of tag order
+    order = np.argsort(tags, kind="stable")
+    tags, coords = tags[order], coords.reshape(-1, 3)[order]
+    dim, types = cell_types()
+    cells = []
+    for t in types:
+        v = gmsh.model.mesh.getElementProperties(t)[3]
+        _, nodes = gmsh.model.mesh.getElementsByType(t)
+        cells.append(tag_index(tags, nodes).reshape(-1, v))
+    groups = {}
+    for d, tag in gmsh.model.getPhysicalGroups(dim - 1):
+        lines = []
+        for entity in gmsh.model.getEntitiesForPhysicalGroup(d, tag):
+            etypes, _, enodes = gmsh.model.mesh.getElements(d, entity)
+            lines += [n for t, n in zip(etypes, enodes) if t == 1]
+        groups[tag] = (gmsh.model.getPhysicalName(d, tag),
+                       tag_index(tags, np.concatenate(lines)).reshape(-1, 2))
+    return cells, coords, groups
+
+
+def metis_parts(k):
+    # Metis part of every cell of the current gmsh model, in from_gmsh order
+    dim, types = cell_types()
+    cell_tags = np.concatenate([gmsh.model.mesh.getElementsByType(t)[0] for t in types])
+    cell_part = np.zeros(cell_tags.shape[0], dtype=np.int32)
+    if k < 2:
+        return cell_part
+    gmsh.option.setNumber("Mesh.PartitionCreateTopology", 0)
+    gmsh.model.mesh.partition(k)
+    # the elements keep their tags but move to one entity per partition
+    for d, entity in gmsh.model.getEntities(dim):
+        parts = gmsh.model.getPartitions(d, entity)
+        if not len(parts):
+            continue
+        for t, etags in zip(*gmsh.model.mesh.getElements(d, entity)[:2]):
+            if t in types:
+                cell_part[tag_index(cell_tags, etags)] = parts[0] - 1
+    return cell_part
+
+
+def allocate(sizes, k):
+    # k parts over blocks of the given sizes, at least one each, largest
+    # remaining load per part first
+    sizes = np.asarray(sizes, dtype=float)
+    parts = np.maximum(1, np.floor(sizes * k / sizes.sum())).astype(int)
+    while parts.sum() < k:
+        parts[np.argmax(sizes / parts)] += 1
+    return parts
+
+
+def grid_split(ni, nj, p):
+    # px x py factorization of p whose sub-blocks are closest to square
+    pairs = [(px, p // px) for px in range(1, p + 1) if p % px == 0]
+    return min(pairs, key=lambda f: abs(np.log((ni / f[0]) / (nj / f[1]))))
+
+
+def sub_blocks(shapes, parts):
+    # cell -> sub-block index when block b is cut into parts[b] sub-blocks
+    ids, first = [], 0
+    for (ni, nj), p in zip(shapes, parts):
+        px, py = grid_split(ni, nj, p)
+        # cells are i-major within a block; sub-block (a, b) is a * py + b
+        bi = np.arange(ni) * px // ni
+        bj = np.arange(nj) * py // nj
+        ids.append((first + bi[:, None] * py + bj[None, :]).ravel())
+        first += p
+    return np.concatenate(ids).astype(np.int32)
+
+
+def pack(sizes, k):
+    # sizes onto k parts, largest first onto the least loaded part
+    load = np.zeros(k)
+    owner = np.empty(len(sizes), dtype=np.int32)
+    for b in np.argsort(sizes, kind="stable")[::-1]:
+        owner[b] = np.argmin(load)
+        load[owner[b]] += sizes[b]
+    return owner
+
+
+def block_parts(grid, k):
+    """
+    Part of every cell of a StructuredGrid (all_quads order), block-aligned:
+    either one sub-block per part (blocks get parts in proportion to their
+    cells) or blocks cut into pieces of at most num_cells / k cells (or a
+    half or quarter of that) packed onto the parts, whichever has the
+    smallest largest part; the fewest pieces win ties
+    """
+    shapes = [(ni - 1, nj - 1) for ni, nj in map(grid.size, grid.surfaces)]
+    sizes = np.array([ni * nj for ni, nj in shapes])
+    candidates = []
+    if k >= len(shapes):
+        candidates.append(sub_blocks(shapes, allocate(sizes, k)))
+    for split in (1, 2, 4):
+        pieces = sub_blocks(shapes, np.ceil(sizes * k * split / sizes.sum()).astype(int))
+        candidates.append(pack(np.bincount(pieces), k)[pieces])
+    return min(candidates, key=lambda p: np.bincount(p, minlength=k).max())
+
+
+def grid_mesh(grid):
+    # cells, coordinates and boundary groups of a StructuredGrid, with the
+    # physical tags gmsh would give them
+    from meshfile import physical_tags
+    tags = physical_tags(grid.physicals)
+    groups = {tags[key]: (key[1], np.concatenate([grid.lines(c) for c in curves]))
+              for key, curves in grid.physicals.items() if key[0] == 1}
+    return [grid.all_quads()], grid.xyz, groups
+
+
+def padded(cells):
+    # cell blocks stacked into one (n, v) array, -1 past the nodes of a cell
+    v = max(c.shape[1] for c in cells)
+    out = np.full((sum(c.shape[0] for c in cells), v), -1, dtype=np.int64)
+    start = 0
+    for c in cells:
+        out[start:start + c.shape[0], :c.shape[1]] = c
+        start += c.shape[0]
+    return out
+
+
+def boundary_cells(cells, lines):
+    # global cell of every boundary line, matched through the sorted edge
+    # node pairs of every cell block
+    edges, owner, start = [], [], 0
+    for c in cells:
+        v = c.shape[1]
+        local = np.stack([np.arange(v), np.roll(np.arange(v), -1)], axis=1)
+        edges.append(np.sort(c[:, local].reshape(-1, 2), axis=1))
+        owner.append(np.repeat(np.arange(start, start + c.shape[0]), v))
+        start += c.shape[0]
+    edges, owner = np.concatenate(edges), np.concatenate(owner)
+    n = int(max(edges.max(), lines.max())) + 1
+    key = edges[:, 0] * n + edges[:, 1]
+    order = np.argsort(key)
+    lines = np.sort(lines, axis=1)
+    return owner[order[np.searchsorted(key, lines[:, 0] * n + lines[:, 1], sorter=order)]]
+
+
+def split(cells, xyz, groups, cell_part, outdir, ghosts=GHOSTS):
+    """
+    Write one part<k>.npz per part (see the top of the file) and header.json
+    for the cell blocks cells; returns the per-part counts
+    """
+    os.makedirs(outdir, exist_ok=True)
+    k = int(cell_part.max()) + 1
+    graph = cell_graph(cells)
+    tag = np.concatenate([np.full(len(lines), t) for t, (_, lines) in groups.items()])
+    lines = np.concatenate([lines for _, lines in groups.values()])
+    line_cell = boundary_cells(cells, lines)
+
+    cells = padded(cells)
+    present = cells >= 0
+    num_cells, num_nodes = cells.shape[0], xyz.shape[0]
+    node_owner = np.full(num_nodes, k, dtype=np.int32)
+    np.minimum.at(node_owner, cells[present],
+                  np.broadcast_to(cell_part[:, None], cells.shape)[present])
+
+    seen = np.zeros(num_cells, dtype=bool)
+    local_cell = np.full(num_cells, -1, dtype=np.int64)
+    local_node = np.full(num_nodes, -1, dtype=np.int64)
+    counts = []
+    for part in range(k):
+        layers = [np.flatnonzero(cell_part == part)]
+        seen[layers[0]] = True
+        for _ in range(ghosts):
+            nb = np.unique(graph[layers[-1]].indices)
+            nb = nb[~seen[nb]]
+            seen[nb] = True
+            layers.append(nb)
+        cell_global = np.concatenate(layers)
+        seen[cell_global] = False
+
+        flat = cells[cell_global][present[cell_global]]
+        _, first = np.unique(flat, return_index=True)
+        node_global = flat[np.sort(first)]
+        local_cell[cell_global] = np.arange(cell_global.shape[0])
+        local_node[node_global] = np.arange(node_global.shape[0])
+
+        mine = local_cell[line_cell] >= 0
+        bfaces = np.stack([local_cell[line_cell[mine]], local_node[lines[mine, 0]],
+                           local_node[lines[mine, 1]], tag[mine]], axis=1)
+        np.savez(os.path.join(outdir, f"part{part}.npz"),
+                 cells=np.where(present[cell_global], local_node[cells[cell_global]],
+                                -1).astype(np.int32),
+                 nodes=xyz[node_global],
+                 cell_global=cell_global, node_global=node_global,
+                 cell_g2l=g2l(cell_global), node_g2l=g2l(node_global),
+                 cell_owner=cell_part[cell_global], node_owner=node_owner[node_global],
+                 bfaces=bfaces)
+        local_cell[cell_global] = -1
+        local_node[node_global] = -1
+        counts.append({"cells": [int(l.shape[0]) for l in layers],
+                       "nodes": int(node_global.shape[0]), "bfaces": int(bfaces.shape[0])})
+
+    header = {"parts": k, "ghosts": ghosts, "num_cells": num_cells, "num_nodes": num_nodes,
+              "groups": {str(t): name for t, (name, _) in groups.items()},
+              "counts": counts}
+    with open(os.path.join(outdir, "header.json"), "w") as f:
+        json.dump(header, f, indent=1)
+    return counts
+
+
+def g2l(global_ids):
+    # (global, local) pairs sorted by global index
+    order = np.argsort(global_ids, kind="stable")
+    return np.stack([global_ids[order], order], axis=1)
+
+
+def lookup(g2l_map, global_ids):
+    # local indices of global_ids in a part, -1 where the part does not have them
+    pos = np.minimum(np.searchsorted(g2l_map[:, 0], global_ids), g2l_map.shape[0] - 1)
+    return np.where(g2l_map[pos, 0] == global_ids, g2l_map[pos, 1], -1)
+
+
+def partition_file(path, outdir, k, ghosts=GHOSTS, grid=None):
+    """
+    Partition a mesh file with Metis or, given the StructuredGrid it was
+    meshed from, along its blocks (gmsh numbers the quads the same way)
+    """
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(path)
+    cells, xyz, groups = from_gmsh()
+    cell_part = metis_parts(k) if grid is None else block_parts(grid, k)
+    gmsh.finalize()
+    return split(cells, xyz, groups, cell_part, outdir, ghosts)
+
+
+def partition_grid(grid, outdir, k, ghosts=GHOSTS):
+    # block-aligned partition of a StructuredGrid, without gmsh
+    cells, xyz, groups = grid_mesh(grid)
+    return split(cells, xyz, groups, block_parts(grid, k), outdir, ghosts)
+
+
+def load(outdir, part):
+    # one rank's piece
+    with np.load(os.path.join(outdir, f"part{part}.npz")) as f:
+        return dict(f)
+
+
+def main(argv):
+    from pipeline import load_script
+    from run import parse_value
+    from transfinite import inlet_grid
+    k = int(argv[argv.index("-k") + 1]) if "-k" in argv else 2
+    ghosts = int(argv[argv.index("-ghosts") + 1]) if "-ghosts" in argv else GHOSTS
+    source, outdir = argv[1], argv[2]
+    params = {name: parse_value(value) for name, _, value in
+              (a.partition("=") for a in argv[3:] if "=" in a)}
+    if source.endswith(".msh"):
+        counts = partition_file(source, outdir, k, ghosts)
+    else:
+        counts = partition_grid(inlet_grid(load_script(source).layout(**params)), outdir, k, ghosts)
+    owned = np.array([c["cells"][0] for c in counts])
+    print(f"{'part':>5} {'owned':>10} {'ghosts':>16} {'nodes':>10} {'bfaces':>8}")
+    for part, c in enumerate(counts):
+        print(f"{part:>5} {c['cells'][0]:>10} {str(c['cells'][1:]):>16} {c['nodes']:>10} "
+              f"{c['bfaces']:>8}")
+    print(f"imbalance {owned.max() / owned.mean():.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,53 @@
+# Shared plumbing for the mesh generation scripts: every script's main() ends
+# with finish(), so it can run in the GUI or headless from run.py
+
+import importlib.util
+import os
+import sys
+import gmsh
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def mesh_stats():
+    # node and element counts of the current mesh, read from gmsh's statistics
+    # instead of copying the mesh arrays out
+    elements = sum(int(gmsh.option.getNumber(f"Mesh.Nb{kind}"))
+                   for kind in ("Triangles", "Quadrangles", "Tetrahedra",
+                                "Hexahedra", "Prisms", "Pyramids"))
+    return {"nodes": int(gmsh.option.getNumber("Mesh.NbNodes")),
+            "elements": elements}
+
+
+def write(output):
+    # gmsh.write, with .msh as binary MSH 4.1 so meshfile.MshMesh can map it
+    if output.endswith(".msh"):
+        gmsh.option.setNumber("Mesh.Binary", 1)
+    gmsh.write(output)
+
+
+def finish(gui=True, output=None):
+    """
+    Write the current mesh to output (format from the extension, .msh as
+    binary), optionally show the GUI, then finalize gmsh. Returns the mesh
+    statistics
+    """
+    stats = mesh_stats()
+    if output:
+        write(output)
+    if gui:
+        gmsh.fltk.run()
+    gmsh.finalize()
+    return stats
+
+
+def load_script(name):
+    # the scripts are not importable by name (hyphens), so load them by path
+    name = name[:-3] if name.endswith(".py") else name
+    path = os.path.join(HERE, name + ".py")
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,355 @@
+# Vectorized mesh quality and wall spacing report, without the GUI
+#
+#   python quality.py meshes/inlet.msh [-worst 10] [-json quality.json]
+#   python quality.py inlet-structured-two scale_factor=5
+#   python run.py flatplate -p lc=0.01 --quality
+#
+# Per triangle and quad, computed block by block from the node and
+# connectivity arrays:
+#   skewness   equiangle skewness, 0 for the ideal shape, 1 when degenerate
+#   aspect     longest over shortest edge
+#   growth     largest area ratio to an edge neighbour, >= 1
+#   jacobian   smallest corner sine, scaled to 1 for the ideal shape; <= 0
+#              means a folded or inverted element (orientation is that of
+#              the element block's total area)
+# and per 1D physical group the first-cell height on that boundary: the area
+# of the adjacent cell over the boundary edge length (twice that for a
+# triangle, its apex height). The report holds min/mean/max, a histogram and
+# the worst elements of every metric.
+#
+# The mesh comes from a binary MSH 4.1 file (memory-mapped through
+# meshfile.MshMesh), a write_raw directory, any other file gmsh reads, or
+# straight from a structured inlet layout through transfinite.py.
+
+import json
+import os
+import sys
+from collections import namedtuple
+import numpy as np
+import gmsh
+from adaptive import tag_index
+
+BLOCK = 1 << 16
+WORST = 10
+
+# histogram bin edges of every metric, the last bin is open-ended
+BINS = {"skewness": np.linspace(0., 1., 11),
+        "aspect": np.array([1., 1.5, 2., 5., 10., 100., 1e3, 1e4, np.inf]),
+        "growth": np.array([1., 1.1, 1.2, 1.3, 1.5, 2., 3., 5., np.inf]),
+        "jacobian": np.linspace(-1., 1., 11)}
+# metrics where small values are bad
+LOW = ("jacobian",)
+
+# elements of one type; tags are the gmsh element tags when known
+Cells = namedtuple("Cells", "type tags nodes")
+CORNERS = {2: 3, 3: 4}
+
+
+def from_gmsh():
+    """
+    Coordinates (N, 3), triangle and quad blocks (0-based node indices) and
+    1D physical groups {name: (l, 2) lines} of the current gmsh model
+    """
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    order = np.argsort(tags, kind="stable")
+    tags, xyz = tags[order], coords.reshape(-1, 3)[order]
+    blocks = []
+    for t in gmsh.model.mesh.getElementTypes(2):
+        if t in CORNERS:
+            etags, nodes = gmsh.model.mesh.getElementsByType(t)
+            blocks.append(Cells(t, etags, tag_index(tags, nodes).reshape(-1, CORNERS[t])))
+    groups = {}
+    for dim, tag in gmsh.model.getPhysicalGroups(1):
+        lines = []
+        for entity in gmsh.model.getEntitiesForPhysicalGroup(dim, tag):
+            types, _, nodes = gmsh.model.mesh.getElements(dim, entity)
+            lines += [n for t, n in zip(types, nodes) if t == 1]
+        groups[gmsh.model.getPhysicalName(dim, tag)] = \
+            tag_index(tags, np.concatenate(lines)).reshape(-1, 2)
+    return xyz, blocks, groups
+
+
+def from_msh(path):
+    # binary MSH 4.1 through the memory-mapped reader
+    from meshfile import MshMesh
+    m = MshMesh(path)
+    tags = np.concatenate([b.tags for b in m.node_blocks])
+    order = np.argsort(tags, kind="stable")
+    tags, xyz = tags[order], np.concatenate([b.xyz for b in m.node_blocks])[order]
+    blocks = {}
+    for b in m.element_blocks:
+        if b.dim == 2 and b.type in CORNERS:
+            blocks.setdefault(b.type, []).append(b)
+    blocks = [Cells(t, np.concatenate([b.tags for b in bs]),
+                    tag_index(tags, np.concatenate([b.nodes for b in bs])))
+              for t, bs in blocks.items()]
+    groups = {name: tag_index(tags, np.concatenate([b.nodes for b in m.group(1, name)]))
+              for dim, name in m.physical_groups if dim == 1}
+    return xyz, blocks, groups
+
+
+def from_raw(path):
+    from meshfile import RawMesh
+    r = RawMesh(path)
+    groups = {name: np.asarray(r.group(name)) for dim, name in r.physical_groups if dim == 1}
+    return r.nodes, [Cells(3, None, r.quads)], groups
+
+
+def from_grid(grid):
+    groups = {name: np.concatenate([grid.lines(c) for c in curves])
+              for (dim, name), curves in grid.physicals.items() if dim == 1}
+    return grid.xyz, [Cells(3, None, grid.all_quads())], groups
+
+
+def load(source, **params):
+    """
+    (xyz, blocks, groups) from a mesh file, a write_raw directory or the
+    name of a structured inlet script and its layout parameters
+    """
+    if os.path.isdir(source):
+        return from_raw(source)
+    if not os.path.exists(source):
+        from pipeline import load_script
+        from transfinite import inlet_grid
+        return from_grid(inlet_grid(load_script(source).layout(**params)))
+    if source.endswith(".msh"):
+        try:
+            return from_msh(source)
+        except ValueError:
+            pass  # ASCII or older MSH, let gmsh read it
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(source)
+    mesh = from_gmsh()
+    gmsh.finalize()
+    return mesh
+
+
+def shape(xs, ys, nodes):
+    """
+    Skewness, aspect ratio, smallest and largest scaled corner Jacobian and
+    signed area of the (n, k) elements nodes; the Jacobian is taken for
+    counter-clockwise elements, the largest one serves clockwise blocks
+    """
+    k = nodes.shape[1]
+    nxt, prv = np.roll(np.arange(k), -1), np.roll(np.arange(k), 1)
+    # corner-major (k, n) arrays, so the reductions run over whole rows
+    x, y = xs[nodes.T], ys[nodes.T]
+    # edge i runs from corner i to corner i + 1
+    ax, ay = x[nxt] - x, y[nxt] - y
+    la = np.hypot(ax, ay)
+    lb = la[prv]
+    cross = ay * ax[prv] - ax * ay[prv]
+    dot = -(ax * ax[prv] + ay * ay[prv])
+    angle = np.degrees(np.arctan2(np.abs(cross), dot))
+    ideal = 180. * (k - 2) / k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        skew = np.maximum((angle.max(axis=0) - ideal) / (180. - ideal),
+                          (ideal - angle.min(axis=0)) / ideal)
+        aspect = la.max(axis=0) / la.min(axis=0)
+        sine = np.nan_to_num(cross / (la * lb)) / np.sin(np.radians(ideal))
+    area = 0.5 * np.sum(x * ay - ax * y, axis=0)
+    return skew, aspect, sine.min(axis=0), sine.max(axis=0), area
+
+
+def chunks(blocks, block_size=BLOCK):
+    # (block index, global offset of the chunk, node array of the chunk)
+    start = 0
+    for b, cells in enumerate(blocks):
+        n = cells.nodes.shape[0]
+        for i in range(0, n, block_size):
+            yield b, start + i, np.asarray(cells.nodes[i:i + block_size])
+        start += n
+
+
+def edges(blocks, num_nodes):
+    """
+    Sorted keys of every cell edge (smaller node * num_nodes + larger) and
+    the cell of each key
+    """
+    keys = []
+    for cells in blocks:
+        nodes = np.asarray(cells.nodes)
+        nxt = np.roll(nodes, -1, axis=1)
+        keys.append((np.minimum(nodes, nxt) * num_nodes + np.maximum(nodes, nxt)).ravel())
+    keys = np.concatenate(keys) if len(keys) > 1 else keys[0]
+    order = np.argsort(keys)
+    keys = keys[order]
+    corners = [c.nodes.shape[1] for c in blocks]
+    if len(blocks) == 1:
+        return keys, order // corners[0]
+    # position in the concatenated edges -> cell, block by block
+    sizes = [c.nodes.shape[0] for c in blocks]
+    edge_start = np.cumsum([0] + [n * k for n, k in zip(sizes, corners)])
+    cell_start = np.cumsum([0] + sizes)
+    b = np.searchsorted(edge_start, order, side="right") - 1
+    return keys, cell_start[b] + (order - edge_start[b]) // np.asarray(corners)[b]
+
+
+def growth_ratio(keys, cell, area):
+    # largest area ratio of every cell to one of its edge neighbours
+    pair = np.flatnonzero(keys[1:] == keys[:-1])
+    a, b = cell[pair], cell[pair + 1]
+    ratio = np.maximum(area[a], area[b]) / np.minimum(area[a], area[b])
+    growth = np.ones(area.shape[0])
+    np.maximum.at(growth, a, ratio)
+    np.maximum.at(growth, b, ratio)
+    return growth
+
+
+def wall_heights(xy, keys, cell, area, corners, lines):
+    # first-cell height above every boundary edge of a group
+    lines = np.sort(np.asarray(lines), axis=1)
+    query = lines[:, 0] * xy.shape[0] + lines[:, 1]
+    pos = np.minimum(np.searchsorted(keys, query), keys.shape[0] - 1)
+    found = keys[pos] == query
+    c = cell[pos[found]]
+    length = np.linalg.norm(xy[lines[found, 1]] - xy[lines[found, 0]], axis=1)
+    return np.where(corners[c] == 3, 2., 1.) * area[c] / length
+
+
+class Stats:
+    """Running min/mean/max, histogram and worst elements of one metric"""
+
+    def __init__(self, name, bins, worst=WORST):
+        self.name, self.bins, self.worst = name, bins, worst
+        self.low = name in LOW
+        self.count, self.total = 0, 0.
+        self.min, self.max = np.inf, -np.inf
+        self.hist = np.zeros(len(bins) - 1, dtype=np.int64)
+        self.worst_values = np.empty(0)
+        self.worst_index = np.empty(0, dtype=np.int64)
+
+    def add(self, values, start=0):
+        self.count += values.shape[0]
+        self.total += float(np.sum(values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        # values outside the edges land in the first or last bin
+        bins = np.clip(np.searchsorted(self.bins, values, side="right") - 1,
+                       0, len(self.bins) - 2)
+        self.hist += np.bincount(bins, minlength=len(self.hist))
+        if not self.worst:
+            return
+        key = values if self.low else -values
+        if key.shape[0] > self.worst:
+            top = np.argpartition(key, self.worst)[:self.worst]
+        else:
+            top = np.arange(key.shape[0])
+        v = np.concatenate([self.worst_values, values[top]])
+        i = np.concatenate([self.worst_index, start + top])
+        keep = np.argsort(v if self.low else -v, kind="stable")[:self.worst]
+        self.worst_values, self.worst_index = v[keep], i[keep]
+
+    def report(self, describe=None):
+        return {"min": self.min, "mean": self.total / max(self.count, 1), "max": self.max,
+                "bins": self.bins.tolist(), "histogram": self.hist.tolist(),
+                "worst": [{"value": float(v), **(describe(i) if describe else {"index": int(i)})}
+                          for v, i in zip(self.worst_values, self.worst_index)]}
+
+
+def analyze(xyz, blocks, groups, worst=WORST, block_size=BLOCK):
+    """
+    Quality report of the triangle and quad blocks: {metric: statistics}
+    for the element metrics and {"walls": {group: statistics}} for the
+    first-cell heights (see the top of the file)
+    """
+    xy = np.asarray(xyz)[:, :2]
+    xs, ys = np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1])
+    sizes = [c.nodes.shape[0] for c in blocks]
+    num_cells = sum(sizes)
+    starts = np.cumsum([0] + sizes)
+    stats = {name: Stats(name, bins, worst) for name, bins in BINS.items()}
+    area = np.empty(num_cells)
+    jac_min, jac_max = np.empty(num_cells), np.empty(num_cells)
+    for b, start, nodes in chunks(blocks, block_size):
+        end = start + nodes.shape[0]
+        skew, aspect, jac_min[start:end], jac_max[start:end], area[start:end] = \
+            shape(xs, ys, nodes)
+        stats["skewness"].add(skew, start)
+        stats["aspect"].add(aspect, start)
+    # a block meshed clockwise has all its elements clockwise
+    jac = jac_min
+    for a, e in zip(starts, starts[1:]):
+        if area[a:e].sum() < 0:
+            jac[a:e] = -jac_max[a:e]
+    del jac_max
+    np.abs(area, out=area)
+
+    keys, cell = edges(blocks, xy.shape[0])
+    growth = growth_ratio(keys, cell, area)
+    for start in range(0, num_cells, block_size):
+        stats["jacobian"].add(jac[start:start + block_size], start)
+        stats["growth"].add(growth[start:start + block_size], start)
+
+    def describe(i):
+        # gmsh tag (when known), type and centroid of a global cell index
+        b = np.searchsorted(starts, i, side="right") - 1
+        cells = blocks[b]
+        nodes = np.asarray(cells.nodes[i - starts[b]])
+        out = {"index": int(i), "type": int(cells.type),
+               "centroid": xy[nodes].mean(axis=0).tolist()}
+        if cells.tags is not None:
+            out["tag"] = int(cells.tags[i - starts[b]])
+        return out
+
+    report = {"cells": num_cells, "nodes": int(xy.shape[0]),
+              **{name: s.report(describe) for name, s in stats.items()}, "walls": {}}
+    corners = np.repeat([c.nodes.shape[1] for c in blocks], sizes)
+    for name, lines in groups.items():
+        h = wall_heights(xy, keys, cell, area, corners, lines)
+        if not h.size:
+            continue
+        bins = np.geomspace(h.min(), h.max(), 9) if h.max() > h.min() else np.array([h.min(), np.inf])
+        s = Stats(name, bins, 0)
+        s.add(h)
+        report["walls"][name] = {"edges": int(h.size), **s.report()}
+        del report["walls"][name]["worst"]
+    return report
+
+
+def fields(report):
+    # a few headline numbers for the run.py summary table
+    out = {"skew_max": report["skewness"]["max"], "aspect_max": report["aspect"]["max"],
+           "growth_max": report["growth"]["max"], "jac_min": report["jacobian"]["min"]}
+    if "wall" in report["walls"]:
+        out["wall_h_min"] = report["walls"]["wall"]["min"]
+        out["wall_h_max"] = report["walls"]["wall"]["max"]
+    return out
+
+
+def text(report):
+    lines = [f"{report['cells']} cells, {report['nodes']} nodes",
+             f"{'metric':>10} {'min':>11} {'mean':>11} {'max':>11}"]
+    for name in BINS:
+        r = report[name]
+        lines.append(f"{name:>10} {r['min']:>11.4g} {r['mean']:>11.4g} {r['max']:>11.4g}")
+    for name in BINS:
+        r = report[name]
+        lines.append(f"\n{name}")
+        for lo, hi, n in zip(r["bins"], r["bins"][1:], r["histogram"]):
+            lines.append(f"  [{lo:>9.4g}, {hi:>9.4g}) {n:>10} {n / report['cells']:>7.2%}")
+        lines.append("  worst: " + ", ".join(
+            f"{w['value']:.4g} @ {w.get('tag', w['index'])} "
+            f"({w['centroid'][0]:.4g}, {w['centroid'][1]:.4g})" for w in r["worst"][:5]))
+    lines.append(f"\n{'wall':>10} {'edges':>8} {'min h':>11} {'mean h':>11} {'max h':>11}")
+    for name, r in report["walls"].items():
+        lines.append(f"{name:>10} {r['edges']:>8} {r['min']:>11.4g} {r['mean']:>11.4g} "
+                     f"{r['max']:>11.4g}")
+    return "\n".join(lines)
+
+
+def main(argv):
+    from run import parse_value
+    worst = int(argv[argv.index("-worst") + 1]) if "-worst" in argv else WORST
+    params = {name: parse_value(value) for name, _, value in
+              (a.partition("=") for a in argv[2:] if "=" in a)}
+    report = analyze(*load(argv[1], **params), worst=worst)
+    print(text(report))
+    if "-json" in argv:
+        with open(argv[argv.index("-json") + 1], "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,412 @@
+# Locality-improving renumbering of a generated mesh before export
+#
+#   python renumber.py meshes/inlet.msh meshes/inlet_rcm.msh -method rcm
+#   python run.py inlet-structured -p total_divisions=1024 --renumber block
+#
+# Methods:
+#   rcm      reverse Cuthill-McKee on the node graph and on the cell graph
+#   hilbert  nodes and cell centroids sorted along a Hilbert curve
+#   morton   the same along a Morton (Z-order) curve, cheaper but with jumps
+#   block    a structured block (the blocks of the structured inlet) runs row
+#            by row or column by column, any other surface is RCM-ordered;
+#            nodes are numbered in the order the cells first touch them
+#
+# MSH stores the elements of an entity together, so the cell orders are
+# per entity: RCM on the entity's cell graph, the curves over its
+# centroids, or its rows. The entities are then sequenced so that adjacent
+# ones sit close, and each one walked in the direction (and, for a
+# structured block, from the corner) that narrows the cell graph, starting
+# from gmsh's own order and never widening it. Entities are retagged in the
+# new sequence, which is the order gmsh writes them in. A node or cell
+# order that comes out wider than the input, max or mean, is dropped for it.
+#
+# Bandwidth is reported for both graphs: the node graph (nodes sharing an
+# element, the pattern of a vertex-based matrix) and the cell graph (cells
+# sharing an edge, the pattern of a cell-centred one). The renumbering is
+# applied to the gmsh model itself: node tags are reassigned and the
+# elements of every entity reordered, so gmsh.write keeps the physical
+# groups. MSH stores nodes per entity, so the new node order is carried by
+# the tags, which is how solvers index them.
+#
+#   python bench_renumber.py               # every method, checked against the input
+
+import sys
+from collections import namedtuple
+import numpy as np
+import gmsh
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+import pipeline
+from adaptive import tag_index
+
+METHODS = ("rcm", "hilbert", "morton", "block")
+BITS = 16
+# entity_sequence leaves the entity order of larger meshes as it is
+MAX_ENTITIES = 64
+
+# elements of one type on one entity; nodes are indices into the node arrays
+Block = namedtuple("Block", "tag type nodes")
+
+
+def from_gmsh():
+    """
+    Node tags, coordinates (N, 3) and the blocks of the highest-dimensional
+    elements of the current gmsh model
+    """
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    dim = max(d for d in (1, 2, 3) if len(gmsh.model.mesh.getElementTypes(d)))
+    blocks = []
+    for _, tag in gmsh.model.getEntities(dim):
+        types, _, nodes = gmsh.model.mesh.getElements(dim, tag)
+        for t, n in zip(types, nodes):
+            k = gmsh.model.mesh.getElementProperties(t)[3]
+            blocks.append(Block(tag, t, tag_index(tags, n).reshape(-1, k)))
+    return tags, coords.reshape(-1, 3), blocks
+
+
+def graph(rows, cols, n):
+    return coo_matrix((np.ones(rows.shape[0], dtype=np.int32), (rows, cols)),
+                      shape=(n, n)).tocsr()
+
+
+def node_graph(num_nodes, cells):
+    # every pair of nodes of an element
+    rows, cols = [], []
+    for c in cells:
+        i, j = np.nonzero(~np.eye(c.shape[1], dtype=bool))
+        rows.append(c[:, i].ravel())
+        cols.append(c[:, j].ravel())
+    return graph(np.concatenate(rows), np.concatenate(cols), num_nodes)
+
+
+def cell_graph(cells):
+    # edges of every cell, matched up through their sorted node pairs
+    edges, owner, start = [], [], 0
+    for c in cells:
+        k = c.shape[1]
+        local = np.stack([np.arange(k), np.roll(np.arange(k), -1)], axis=1)
+        edges.append(np.sort(c[:, local].reshape(-1, 2), axis=1))
+        owner.append(np.repeat(np.arange(start, start + c.shape[0]), k))
+        start += c.shape[0]
+    edges, owner = np.concatenate(edges), np.concatenate(owner)
+    order = np.lexsort((edges[:, 1], edges[:, 0]))
+    edges, owner = edges[order], owner[order]
+    pair = np.flatnonzero((edges[1:] == edges[:-1]).all(axis=1))
+    a, b = owner[pair], owner[pair + 1]
+    return graph(np.concatenate([a, b]), np.concatenate([b, a]), start)
+
+
+def bandwidth(g, order=None):
+    """
+    Maximum and mean |i - j| over the nonzeros of g once row/column
+    order[k] is moved to position k (the current numbering by default)
+    """
+    g = g.tocoo()
+    rank = np.arange(g.shape[0])
+    if order is not None:
+        rank[order] = np.arange(g.shape[0])
+    d = np.abs(rank[g.row] - rank[g.col])
+    return (int(d.max()), float(d.mean())) if d.size else (0, 0.)
+
+
+def rcm(g):
+    return reverse_cuthill_mckee(g, symmetric_mode=True).astype(np.int64)
+
+
+def morton_key(ij):
+    # interleave the bits of the two integer coordinates
+    key = np.zeros(ij.shape[0], dtype=np.int64)
+    for b in range(BITS):
+        key |= ((ij[:, 0] >> b) & 1) << (2 * b)
+        key |= ((ij[:, 1] >> b) & 1) << (2 * b + 1)
+    return key
+
+
+def hilbert_key(ij):
+    # distance along the Hilbert curve filling the 2^BITS square
+    x, y = ij[:, 0].copy(), ij[:, 1].copy()
+    key = np.zeros(ij.shape[0], dtype=np.int64)
+    n = 1 << BITS
+    s = n >> 1
+    while s:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        key += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve inside it starts at its origin
+        flip = ~ry & rx
+        x[flip], y[flip] = n - 1 - x[flip], n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return key
+
+
+def row_length(g):
+    # row length m when the current order of a block walks an m-wide
+    # structured grid row by row (neighbours only at offsets 1 and m)
+    g = g.tocoo()
+    d = np.abs(g.row - g.col)
+    m = int(d.max()) if d.size else 1
+    if g.shape[0] % m or not np.isin(d, (1, m)).all():
+        return None
+    return m
+
+
+def block_orders(g):
+    """
+    The eight orders of a structured block, row by row or column by column
+    from each of its corners; None when g is not a structured block
+    """
+    m = row_length(g)
+    if m is None:
+        return None
+    grid = np.arange(g.shape[0]).reshape(-1, m)
+    return [o.ravel() for t in (grid, grid.T) for o in (t, t[::-1], t[:, ::-1], t[::-1, ::-1])]
+
+
+def curve(xy, method="hilbert"):
+    # sort points along a space-filling curve over their bounding square
+    lo = xy.min(axis=0)
+    size = max(float((xy.max(axis=0) - lo).max()), np.finfo(float).tiny)
+    ij = ((xy - lo) * ((2**BITS - 1) / size)).astype(np.int64)
+    key = hilbert_key(ij) if method == "hilbert" else morton_key(ij)
+    return np.argsort(key, kind="stable")
+
+
+def first_touch(blocks, cell_order, num_nodes):
+    # nodes in the order the cells, visited in cell_order, first reference them
+    rank = np.empty(cell_order.shape[0], dtype=np.int64)
+    rank[cell_order] = np.arange(cell_order.shape[0])
+    keys, nodes, start = [], [], 0
+    for b in blocks:
+        n, k = b.nodes.shape
+        keys.append(np.repeat(rank[start:start + n], k) * k + np.tile(np.arange(k), n))
+        nodes.append(b.nodes.ravel())
+        start += n
+    flat = np.concatenate(nodes)[np.argsort(np.concatenate(keys), kind="stable")]
+    _, first = np.unique(flat, return_index=True)
+    order = flat[np.sort(first)]
+    # nodes outside every cell go last
+    rest = np.setdiff1d(np.arange(num_nodes), order)
+    return np.concatenate([order, rest])
+
+
+def entity_sequence(sizes, pairs):
+    """
+    Order of the entities that keeps adjacent ones close: starting from the
+    input order, single entities are moved to wherever the largest (then the
+    total) number of cells between adjacent entities drops
+    """
+    sizes = np.asarray(sizes)
+
+    def gaps(seq):
+        end = np.cumsum(sizes[seq])
+        pos = np.empty(len(seq), dtype=np.int64)
+        pos[seq] = np.arange(len(seq))
+        a, b = pos[pairs[:, 0]], pos[pairs[:, 1]]
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        between = end[hi] - sizes[seq][hi] - end[lo]
+        return (int(between.max()), int(between.sum())) if between.size else (0, 0)
+
+    seq = list(range(len(sizes)))
+    best = gaps(seq)
+    improved = len(seq) <= MAX_ENTITIES
+    while improved:
+        improved = False
+        for e in list(seq):
+            rest = [k for k in seq if k != e]
+            for i in range(len(seq)):
+                cost = gaps(rest[:i] + [e] + rest[i:])
+                if cost < best:
+                    seq, best, improved = rest[:i] + [e] + rest[i:], cost, True
+                    rest = [k for k in seq if k != e]
+    return np.array(seq, dtype=np.int64)
+
+
+def orderings(xyz, blocks, method="rcm"):
+    """
+    New node and cell order (new position -> old index) for one of METHODS;
+    cells are numbered through the blocks in sequence. The cells of an
+    entity stay together (MSH stores elements per entity), so every entity
+    is ordered on its own and walk() arranges the entities
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown ordering {method!r}, expected one of {', '.join(METHODS)}")
+    cells = [b.nodes for b in blocks]
+    tags = list(dict.fromkeys(b.tag for b in blocks))
+    owner = np.repeat([tags.index(b.tag) for b in blocks], [c.shape[0] for c in cells])
+    candidates = []
+    for tag in tags:
+        entity = [b.nodes for b in blocks if b.tag == tag]
+        local = cell_graph(entity)
+        if method in ("hilbert", "morton"):
+            centroids = np.concatenate([xyz[c].mean(axis=1) for c in entity])
+            orders = [curve(centroids[:, :2], method)]
+        else:
+            orders = (method == "block" and block_orders(local)) or [rcm(local)]
+        if len(orders) == 1:
+            orders.append(orders[0][::-1])
+        candidates.append([np.arange(local.shape[0])] + orders)
+    cell_order = walk(cell_graph(cells), owner, candidates)
+
+    if method == "rcm":
+        node_order = rcm(node_graph(xyz.shape[0], cells))
+    elif method == "block":
+        node_order = first_touch(blocks, cell_order, xyz.shape[0])
+    else:
+        node_order = curve(xyz[:, :2], method)
+    return node_order, cell_order
+
+
+def walk(g, owner, candidates):
+    """
+    Cell order of the cell graph g that keeps the cells of every entity
+    (owner) together, each in one of its candidate orders, the first being
+    its input order. From a start, every entity in turn takes the candidate
+    that lowers the (max, total) bandwidth without raising either, until
+    none does. The input order is one start, so the result is never wider;
+    the entities in entity_sequence are the other, kept when it ends up no
+    wider than the first. Bandwidths inside an entity are computed once per
+    candidate, so a step only recounts the edges between entities
+    """
+    g = g.tocoo()
+    sizes = np.bincount(owner, minlength=len(candidates))
+    ids = [np.flatnonzero(owner == e) for e in range(len(sizes))]
+    local = np.empty(owner.shape[0], dtype=np.int64)
+    for e in range(len(sizes)):
+        local[ids[e]] = np.arange(sizes[e])
+    same = owner[g.row] == owner[g.col]
+    # (max, total) |i - j| inside every entity, per candidate
+    inside = []
+    for e, orders in enumerate(candidates):
+        mine = same & (owner[g.row] == e)
+        r, c = local[g.row[mine]], local[g.col[mine]]
+        inside.append([])
+        for o in orders:
+            rank = np.empty(sizes[e], dtype=np.int64)
+            rank[o] = np.arange(sizes[e])
+            d = np.abs(rank[r] - rank[c])
+            inside[-1].append((int(d.max()), int(d.sum())) if d.size else (0, 0))
+    row, col = g.row[~same], g.col[~same]
+    pairs = np.unique(np.stack([owner[row], owner[col]], axis=1), axis=0)
+
+    def descend(seq):
+        offset = np.zeros(len(sizes), dtype=np.int64)
+        offset[seq] = np.cumsum(sizes[seq]) - sizes[seq]
+        rank = np.empty(owner.shape[0], dtype=np.int64)
+        choice = [0] * len(sizes)
+
+        def place(e):
+            rank[ids[e][candidates[e][choice[e]]]] = offset[e] + np.arange(sizes[e])
+
+        def cost():
+            d = np.abs(rank[row] - rank[col])
+            chosen = [inside[e][k] for e, k in enumerate(choice)]
+            top = max([b[0] for b in chosen] + [int(d.max()) if d.size else 0])
+            return top, sum(b[1] for b in chosen) + int(d.sum())
+
+        for e in range(len(sizes)):
+            place(e)
+        best, changed = cost(), True
+        while changed:
+            changed = False
+            for e in seq:
+                for k in range(len(candidates[e])):
+                    previous, choice[e] = choice[e], k
+                    place(e)
+                    c = cost()
+                    if c[0] <= best[0] and c[1] <= best[1] and c != best:
+                        best, changed = c, True
+                    else:
+                        choice[e] = previous
+                        place(e)
+        return best, rank
+
+    best, rank = descend(np.arange(len(sizes)))
+    other, other_rank = descend(entity_sequence(sizes, pairs))
+    if other[0] <= best[0] and other[1] <= best[1]:
+        rank = other_rank
+    return np.argsort(rank)
+
+
+def apply(tags, blocks, node_order, cell_order):
+    """
+    Relabel the nodes, reorder the elements of every entity and retag the
+    entities in the order their cells come in cell_order, which is the order
+    gmsh writes and numbers them in
+    """
+    new = np.empty(tags.shape[0], dtype=np.uint64)
+    new[node_order] = np.arange(1, tags.shape[0] + 1)
+    gmsh.model.mesh.renumberNodes(tags, new)
+    rank = np.empty(cell_order.shape[0], dtype=np.int64)
+    rank[cell_order] = np.arange(cell_order.shape[0])
+    start, first = 0, {}
+    for b in blocks:
+        n = b.nodes.shape[0]
+        gmsh.model.mesh.reorderElements(b.type, b.tag, np.argsort(rank[start:start + n]))
+        first[b.tag] = min(first.get(b.tag, rank.shape[0]), int(rank[start:start + n].min()))
+        start += n
+    dim = gmsh.model.getDimension()
+    entities = sorted(first)
+    if sorted(first, key=first.get) != entities:
+        # through tags above every existing one, so no two entities collide
+        free = max(t for _, t in gmsh.model.getEntities(dim)) + 1
+        for k, tag in enumerate(sorted(first, key=first.get)):
+            gmsh.model.setTag(dim, tag, free + k)
+        for k, tag in enumerate(entities):
+            gmsh.model.setTag(dim, free + k, tag)
+    gmsh.model.mesh.renumberElements()
+
+
+def worse(new, old):
+    # (max, mean) bandwidth new is larger than old in either
+    return new[0] > old[0] or new[1] > old[1]
+
+
+def renumber(method="rcm"):
+    """
+    Renumber the mesh of the current gmsh model; returns the node and cell
+    graph bandwidths (max, mean) before and after
+    """
+    tags, xyz, blocks = from_gmsh()
+    # gmsh's own numbering: nodes by tag, cells by entity then storage order
+    node_order = np.argsort(tags, kind="stable")
+    cells = [b.nodes for b in blocks]
+    nodes, cell = node_graph(xyz.shape[0], cells), cell_graph(cells)
+    new_nodes, new_cells = orderings(xyz, blocks, method)
+    report = {"method": method,
+              "node_bandwidth": bandwidth(nodes, node_order),
+              "cell_bandwidth": bandwidth(cell)}
+    # an order that widens either graph is dropped for the input one
+    report["node_bandwidth_new"] = bandwidth(nodes, new_nodes)
+    if worse(report["node_bandwidth_new"], report["node_bandwidth"]):
+        new_nodes, report["node_bandwidth_new"] = node_order, report["node_bandwidth"]
+    report["cell_bandwidth_new"] = bandwidth(cell, new_cells)
+    if worse(report["cell_bandwidth_new"], report["cell_bandwidth"]):
+        new_cells, report["cell_bandwidth_new"] = np.arange(cell.shape[0]), report["cell_bandwidth"]
+    apply(tags, blocks, new_nodes, new_cells)
+    return report
+
+
+def renumber_file(path, output, method="rcm"):
+    # open, renumber and write a mesh; output may be path itself
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    gmsh.open(path)
+    report = renumber(method)
+    pipeline.write(output)
+    gmsh.finalize()
+    return report
+
+
+def main(argv):
+    method = argv[argv.index("-method") + 1] if "-method" in argv else "rcm"
+    report = renumber_file(argv[1], argv[2], method)
+    print(f"{'graph':>5} {'bandwidth':>10} {'mean':>10} {method + ' bw':>10} {'mean':>10}")
+    for name in ("node", "cell"):
+        (b0, m0), (b1, m1) = report[f"{name}_bandwidth"], report[f"{name}_bandwidth_new"]
+        print(f"{name:>5} {b0:>10} {m0:>10.1f} {b1:>10} {m1:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
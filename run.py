@@ -0,0 +1,234 @@
+# Headless batch runner for the mesh generation scripts
+#
+#   python run.py inlet -p lc_wall=0.2,0.1 -p ramp_angle_one=8,10 -j 4
+#   python run.py inlet-structured-two -p scale_factor=1,2 --format su2
+#   python run.py flatplate -p lc=0.02,0.01 --report phases.jsonl --gmsh-log
+#   python run.py inlet -p lc_wall=0.1 --renumber rcm
+#   python run.py inlet-structured-two -p scale_factor=5 --partition 64
+#   python run.py flatplate -p lc=0.02,0.01 --quality
+#   python run.py inlet-hybrid -p first_height=0.01,0.001
+#   python run.py flatplate -p extrude=True -p bl_thickness=0.05
+#
+# Every combination of the swept parameters is one case; cases run in a
+# process pool with a fresh interpreter (and so a fresh gmsh) per case. A
+# case that raises gets a row with its error in the summary table, the
+# others still run, and the exit status is 1.
+
+import argparse
+import ast
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cache
+import instrument
+import partition
+import quality
+import renumber
+from pipeline import load_script
+
+SCRIPTS = ["inlet", "inlet-structured", "inlet-structured-two", "inlet-hybrid",
+           "flatplate", "something", "test"]
+
+# scripts whose mesh transfinite.py rebuilds, partitioned along their blocks
+STRUCTURED = ["inlet-structured", "inlet-structured-two"]
+
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def parse_sweep(items):
+    # ["a=1,2", "b=x"] -> [{"a": 1, "b": "x"}, {"a": 2, "b": "x"}]
+    names, values = [], []
+    for item in items:
+        name, _, text = item.partition("=")
+        names.append(name)
+        values.append([parse_value(v) for v in text.split(",")])
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def case_name(script, params):
+    parts = [script] + [f"{k}-{v}" for k, v in params.items()]
+    return "_".join(parts)
+
+
+def generate(script, params, output, cache_dir=None, cache_bytes=None, refresh=False):
+    if not cache_dir:
+        # output may still be a link into the cache from an earlier run
+        if output and os.path.lexists(output):
+            os.remove(output)
+        return load_script(script).main(gui=False, output=output, **params)
+    fmt = os.path.splitext(output)[1][1:]
+    path, stats, hit = cache.fetch(script, params, fmt, cache_dir, cache_bytes, refresh)
+    if os.path.exists(output):
+        os.remove(output)
+    try:
+        os.link(path, output)
+    except OSError:
+        shutil.copyfile(path, output)
+    return {**stats, "cached": hit}
+
+
+def reorder(output, method):
+    # renumber into a new file and move it over output, which may be a link
+    # into the cache
+    root, ext = os.path.splitext(output)
+    tmp = f"{root}.renumber{ext}"
+    bw = renumber.renumber_file(output, tmp, method)
+    os.replace(tmp, output)
+    return {"renumber": method,
+            "node_bw": f"{bw['node_bandwidth'][0]}->{bw['node_bandwidth_new'][0]}",
+            "cell_bw": f"{bw['cell_bandwidth'][0]}->{bw['cell_bandwidth_new'][0]}"}
+
+
+def split(script, params, output, parts, order=None):
+    # part files go to <output>_parts; a renumbered mesh no longer has the
+    # numbering of the structured grid, so it goes through Metis as well
+    outdir = os.path.splitext(output)[0] + "_parts"
+    grid = None
+    if script in STRUCTURED and not order:
+        from transfinite import inlet_grid
+        layout = {k: v for k, v in params.items() if k not in cache.RUNTIME_PARAMS}
+        grid = inlet_grid(load_script(script).layout(**layout))
+    counts = partition.partition_file(output, outdir, parts, grid=grid)
+    owned = [c["cells"][0] for c in counts]
+    return {"parts": parts, "imbalance": max(owned) * len(owned) / sum(owned)}
+
+
+def check(output):
+    # quality report next to the mesh, headline numbers for the summary
+    report = quality.analyze(*quality.load(output))
+    with open(os.path.splitext(output)[0] + ".quality.json", "w") as f:
+        json.dump(report, f, indent=1)
+    return quality.fields(report)
+
+
+def run_case(script, params, output, log=None, cache_dir=None,
+             cache_bytes=None, refresh=False, report=None, gmsh_log=False,
+             order=None, parts=None, check_quality=False):
+    """
+    Generate one mesh headlessly; gmsh's terminal output goes to log. With a
+    cache_dir the mesh comes from the content-addressed cache (regenerated
+    first with refresh) and output is linked to the cached file. With a
+    report, per-phase records (see instrument.py) are appended to it. With an order (see renumber.py) the
+    written mesh is renumbered, with parts it is also split into that many
+    pieces (see partition.py), with check_quality its quality report is
+    written next to it (see quality.py). Returns the case record for the
+    summary table
+    """
+    if log:
+        # gmsh prints from C, so redirect the file descriptors themselves
+        sys.stdout.flush()
+        fd = os.open(log, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+    tic = time.perf_counter()
+    if report:
+        with instrument.Recorder(gmsh_log, script=script, params=params) as recorder:
+            stats = generate(script, params, output, cache_dir, cache_bytes, refresh)
+            if order:
+                stats.update(reorder(output, order))
+            if parts:
+                stats.update(split(script, params, output, parts, order))
+            if check_quality:
+                stats.update(check(output))
+        recorder.total(cached=stats.get("cached", False))
+        recorder.write(report)
+    else:
+        stats = generate(script, params, output, cache_dir, cache_bytes, refresh)
+        if order:
+            stats.update(reorder(output, order))
+        if parts:
+            stats.update(split(script, params, output, parts, order))
+        if check_quality:
+            stats.update(check(output))
+    wall = time.perf_counter() - tic
+    size = os.path.getsize(output) if output and os.path.exists(output) else 0
+    return {"script": script, **params, "wall": wall, **stats,
+            "output": output, "bytes": size}
+
+
+def summary(records):
+    keys = []
+    for r in records:
+        keys += [k for k in r if k not in keys]
+    rows = [[str(r.get(k, "")) if not isinstance(r.get(k), float)
+             else f"{r[k]:.3f}" for k in keys] for r in records]
+    widths = [max(len(k), *(len(row[i]) for row in rows)) for i, k in enumerate(keys)]
+    lines = ["  ".join(k.rjust(w) for k, w in zip(keys, widths))]
+    lines += ["  ".join(c.rjust(w) for c, w in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch runner for the mesh scripts")
+    parser.add_argument("script", choices=SCRIPTS + [s + ".py" for s in SCRIPTS])
+    parser.add_argument("-p", "--param", action="append", default=[],
+                        help="name=v1,v2,... (repeat to sweep several parameters)")
+    parser.add_argument("-f", "--format", default="msh",
+                        help="output extension understood by gmsh.write (msh, vtk, su2, ...)")
+    parser.add_argument("-o", "--outdir", default="meshes")
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--summary", help="also write the summary table to this file")
+    parser.add_argument("--cache-dir", default=cache.CACHE_DIR)
+    parser.add_argument("--cache-size", type=float, default=cache.MAX_BYTES,
+                        help="cache budget in bytes, least recently used meshes are evicted")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="generate every case straight to its output, leaving the cache alone")
+    parser.add_argument("--refresh", action="store_true",
+                        help="regenerate every case and replace its cache entry")
+    parser.add_argument("--report", help="append per-phase timing and memory records "
+                                         "(JSON lines) to this file")
+    parser.add_argument("--gmsh-log", action="store_true",
+                        help="capture gmsh's logger output in the report records")
+    parser.add_argument("--renumber", choices=renumber.METHODS,
+                        help="renumber nodes and cells of the written mesh for locality")
+    parser.add_argument("--partition", type=int, metavar="K",
+                        help="also write K per-rank parts with ghost layers to <case>_parts")
+    parser.add_argument("--quality", action="store_true",
+                        help="write a quality report to <case>.quality.json")
+    args = parser.parse_args(argv)
+
+    script = args.script[:-3] if args.script.endswith(".py") else args.script
+    cases = parse_sweep(args.param)
+    os.makedirs(args.outdir, exist_ok=True)
+
+    with ProcessPoolExecutor(args.jobs, max_tasks_per_child=1) as pool:
+        futures = []
+        for params in cases:
+            base = os.path.join(args.outdir, case_name(script, params))
+            futures.append(pool.submit(run_case, script, params,
+                                       f"{base}.{args.format}", f"{base}.log",
+                                       None if args.no_cache else args.cache_dir,
+                                       int(args.cache_size), args.refresh,
+                                       args.report, args.gmsh_log,
+                                       args.renumber, args.partition,
+                                       args.quality))
+        records = []
+        for params, future in zip(cases, futures):
+            try:
+                records.append(future.result())
+            except Exception as e:
+                # one failing case must not cost the table of the others
+                text = str(e).strip().splitlines()
+                records.append({"script": script, **params,
+                                "error": f"{type(e).__name__}: {text[-1] if text else ''}"})
+
+    table = summary(records)
+    print(table)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(table + "\n")
+    return records
+
+
+if __name__ == "__main__":
+    sys.exit(1 if any("error" in r for r in main()) else 0)
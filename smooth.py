@@ -0,0 +1,157 @@
+# Elliptic smoothing of the structured inlet blocks, in place of gmsh's
+# Mesh.Smoothing on transfinite surfaces
+#
+#   python bench_smooth.py                    # per-iteration time and quality against gmsh
+#   inlet-structured-two.family(source="numpy")
+#
+# Every block is smoothed on its own (ni, nj, 2) node array with the block
+# sides fixed, so block interfaces do not move. The interior follows the
+# Winslow equations
+#   alpha (x_ii + phi x_i) - 2 beta x_ij + gamma (x_jj + psi x_j) = 0
+#   alpha = |x_j|^2, beta = x_i . x_j, gamma = |x_i|^2
+# in central differences, swept as red-black Gauss-Seidel: the four
+# interleaved sub-lattices of the block are each updated in one vectorized
+# step. Plain Winslow (phi = psi = 0) spreads the nodes evenly and pulls the
+# clustering off the walls; here phi and psi are the Thomas-Middlecoff
+# control functions, the 1D spacing terms of the block sides interpolated
+# across the block, so the distribution of the sides carries into the
+# interior. The nodes of the first fixed_rows rows off a wall do not move
+# either, which keeps the wall spacing exact.
+#
+# With below, only the nodes of cells whose scaled Jacobian (as in quality.py)
+# is below that value, plus ring nodes around them, are moved, and each block
+# is swept only over the rows that hold them.
+
+import time
+import numpy as np
+from scipy.ndimage import binary_dilation
+from transfinite import arc_fraction
+
+# node rows next to a wall that keep their position
+FIXED_ROWS = 1
+# nodes around the cells below the threshold that move with them
+RING = 2
+
+
+def spacing_term(side):
+    # Thomas-Middlecoff control function along one side: -x_s . x_ss / |x_s|^2
+    d1 = 0.5 * (side[2:] - side[:-2])
+    d2 = side[2:] - 2. * side[1:-1] + side[:-2]
+    out = np.zeros(side.shape[0])
+    out[1:-1] = -np.sum(d1 * d2, axis=1) / np.sum(d1 * d1, axis=1)
+    return out
+
+
+def control(x):
+    """
+    phi (interpolated between the bottom and top sides) and psi (between the
+    left and right sides) of a block x (ni, nj, 2)
+    """
+    u = arc_fraction(x[:, 0])[:, None]
+    v = arc_fraction(x[-1])[None, :]
+    phi = (1. - v) * spacing_term(x[:, 0])[:, None] + v * spacing_term(x[:, -1])[:, None]
+    psi = (1. - u) * spacing_term(x[0])[None, :] + u * spacing_term(x[-1])[None, :]
+    return phi, psi
+
+
+def jacobian(x, y):
+    """
+    Smallest corner sine of every quad of a block, (ni - 1, nj - 1): the
+    scaled Jacobian of quality.py for counter-clockwise quads
+    """
+    cx = [x[:-1, :-1], x[1:, :-1], x[1:, 1:], x[:-1, 1:]]
+    cy = [y[:-1, :-1], y[1:, :-1], y[1:, 1:], y[:-1, 1:]]
+    ex = [cx[(k + 1) % 4] - cx[k] for k in range(4)]
+    ey = [cy[(k + 1) % 4] - cy[k] for k in range(4)]
+    out = None
+    for k in range(4):
+        # corner k between the edge into it and the edge out of it
+        cross = ex[k - 1] * ey[k] - ey[k - 1] * ex[k]
+        sine = cross / np.sqrt((ex[k - 1]**2 + ey[k - 1]**2) * (ex[k]**2 + ey[k]**2))
+        out = sine if out is None else np.minimum(out, sine)
+    return out
+
+
+def sweep(x, y, phi, psi, free):
+    """
+    One red-black Gauss-Seidel sweep over the interior of the block node
+    coordinates x, y (ni, nj), moving only the nodes where free is set
+    """
+    ni, nj = free.shape
+    for i0, j0 in ((1, 1), (2, 2), (1, 2), (2, 1)):
+        I, J = slice(i0, ni - 1, 2), slice(j0, nj - 1, 2)
+        Im, Ip = slice(i0 - 1, ni - 2, 2), slice(i0 + 1, ni, 2)
+        Jm, Jp = slice(j0 - 1, nj - 2, 2), slice(j0 + 1, nj, 2)
+        xi, yi = 0.5 * (x[Ip, J] - x[Im, J]), 0.5 * (y[Ip, J] - y[Im, J])
+        xj, yj = 0.5 * (x[I, Jp] - x[I, Jm]), 0.5 * (y[I, Jp] - y[I, Jm])
+        alpha = xj * xj + yj * yj
+        gamma = xi * xi + yi * yi
+        beta = 0.5 * (xi * xj + yi * yj)
+        scale = 0.5 / (alpha + gamma)
+        p, q = phi[I, J], psi[I, J]
+        for c, ci, cj in ((x, xi, xj), (y, yi, yj)):
+            cross = c[Ip, Jp] - c[Ip, Jm] - c[Im, Jp] + c[Im, Jm]
+            new = (alpha * (c[Ip, J] + c[Im, J] + p * ci)
+                   + gamma * (c[I, Jp] + c[I, Jm] + q * cj) - beta * cross) * scale
+            np.copyto(c[I, J], new, where=free[I, J])
+
+
+class Smoother:
+    """
+    Elliptic smoother for the blocks of a StructuredGrid, moving grid.xyz
+
+    The control functions and the movable nodes are set up once from the
+    grid as given; run() then sweeps every block and writes the interior
+    nodes back.
+    """
+
+    def __init__(self, grid, fixed_rows=FIXED_ROWS, below=None, ring=RING):
+        self.grid = grid
+        walls = set(grid.physicals.get((1, "wall"), []))
+        self.blocks = {}
+        for name, sides in grid.surfaces.items():
+            x = grid.xyz[grid.block_ids[name], :2]
+            ni, nj = x.shape[:2]
+            if ni < 3 or nj < 3:
+                continue
+            free = np.zeros((ni, nj), dtype=bool)
+            free[1:-1, 1:-1] = True
+            # bottom, right, top, left
+            k = fixed_rows + 1
+            for side, rows in zip(sides[:4], (np.s_[:, :k], np.s_[-k:, :], np.s_[:, -k:], np.s_[:k, :])):
+                if side[0] in walls:
+                    free[rows] = False
+            if below is not None:
+                cells = jacobian(x[..., 0], x[..., 1]) < below
+                # the four nodes of every such cell, grown by ring nodes
+                bad = np.zeros((ni, nj), dtype=bool)
+                for di in (0, 1):
+                    for dj in (0, 1):
+                        bad[di:di + ni - 1, dj:dj + nj - 1] |= cells
+                if ring and bad.any():
+                    bad = binary_dilation(bad, np.ones((3, 3), dtype=bool), ring)
+                free &= bad
+            rows = np.flatnonzero(free.any(axis=1))
+            if not rows.size:
+                continue
+            window = slice(rows[0] - 1, rows[-1] + 2)
+            phi, psi = control(x)
+            self.blocks[name] = (x[..., 0].copy(), x[..., 1].copy(), phi, psi, free, window)
+
+    def moving(self):
+        # number of nodes the smoother moves
+        return sum(int(b[4].sum()) for b in self.blocks.values())
+
+    def run(self, iterations=1):
+        # sweep every block iterations times; returns the time taken
+        tic = time.perf_counter()
+        xyz = self.grid.xyz
+        for name, (x, y, phi, psi, free, w) in self.blocks.items():
+            for _ in range(iterations):
+                sweep(x[w], y[w], phi[w], psi[w], free[w])
+            ni, nj = free.shape
+            start = self.grid.block_ids[name][1, 1]
+            interior = slice(start, start + (ni - 2) * (nj - 2))
+            xyz[interior, 0] = x[1:-1, 1:-1].ravel()
+            xyz[interior, 1] = y[1:-1, 1:-1].ravel()
+        return time.perf_counter() - tic
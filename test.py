@@ -1,10 +1,11 @@
+import sys
 import gmsh
+from pipeline import finish
 
 
-def main():
+def main(lc=0.1, bl_size=0.005, bl_ratio=1.1, bl_thickness=0.2, gui=True, output=None):
     gmsh.initialize()
 
-    lc = 0.1
     l_domain = 2.0
     h_domain = 1.0
     w_start = 0.5
@@ -37,9 +38,9 @@ def main():
     bl = gmsh.model.mesh.field.add("BoundaryLayer")
     gmsh.model.mesh.field.setNumbers(bl, "CurvesList", walls)
     gmsh.model.mesh.field.setNumbers(bl, "PointsList", [p1, p5])
-    gmsh.model.mesh.field.setNumber(bl, "Size", 0.005)
-    gmsh.model.mesh.field.setNumber(bl, "Ratio", 1.1)
-    gmsh.model.mesh.field.setNumber(bl, "Thickness", 0.2)
+    gmsh.model.mesh.field.setNumber(bl, "Size", bl_size)
+    gmsh.model.mesh.field.setNumber(bl, "Ratio", bl_ratio)
+    gmsh.model.mesh.field.setNumber(bl, "Thickness", bl_thickness)
     gmsh.model.mesh.field.setNumber(bl, "Quads", 1)
     gmsh.model.mesh.field.setNumbers(bl, "FanPointsList", [p3])
     gmsh.model.mesh.field.setAsBoundaryLayer(bl)
@@ -47,9 +48,8 @@ def main():
     gmsh.option.setNumber("Mesh.Algorithm", 6)
 
     gmsh.model.mesh.generate(2)
-    gmsh.fltk.run()
-    gmsh.finalize()
+    return finish(gui, output)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(gui="-nopopup" not in sys.argv)
\ No newline at end of file
@@ -0,0 +1,413 @@
+# Vectorized transfinite grid generator for the nine-block structured inlet
+#
+# Reproduces what gmsh does for inlet-structured.py / inlet-structured-two.py
+# (Progression and Bump node distributions on straight curves, transfinite
+# interpolation of the four-sided blocks) directly into NumPy arrays. Nodes
+# are numbered the way a fresh gmsh mesh numbers them: points first, then the
+# interior nodes of each curve, then the interior nodes of each surface, all
+# in creation order, so node tags match the gmsh output one for one.
+
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+
+# gmsh's Mesh.LcIntegrationPrecision and the depth limits of its recursive
+# integration of the 1D mesh density (meshGEdge.cpp)
+PRECISION = 1e-9
+MIN_DEPTH = 6
+MAX_DEPTH = 25
+
+
+def progression_params(n, coef):
+    """
+    Positions of a gmsh Progression curve the way gmsh places them: its
+    piecewise constant density 1 / (a r^i) is integrated by recursive
+    trapezoid bisection, stopped at PRECISION, and the nodes interpolated
+    at equal steps of the integral. For strong progressions (1.05 over 400
+    nodes) this differs visibly from the closed form (r^k - 1) / (r^(n-1) - 1);
+    here the bisection runs one depth level at a time over all intervals
+    """
+    r = coef if coef > 0 else -1. / coef
+    a = (r - 1.) / (r**(n - 1.) - 1.)
+
+    def density(t):
+        return 1. / (a * r**np.floor(np.log(t / a * (r - 1.) + 1.) / np.log(r)))
+
+    lo, hi = np.array([0.]), np.array([1.])
+    f_lo, f_hi = density(lo), density(hi)
+    done, depth = [], 0
+    while lo.size:
+        depth += 1
+        mid = 0.5 * (lo + hi)
+        f_mid = density(mid)
+        whole = 0.5 * (f_lo + f_hi) * (hi - lo)
+        left = 0.5 * (f_lo + f_mid) * (mid - lo)
+        right = 0.5 * (f_mid + f_hi) * (hi - mid)
+        stop = ((np.abs(whole - left - right) < PRECISION) & (depth > MIN_DEPTH)) | (depth > MAX_DEPTH)
+        done.append(np.stack([lo, mid, hi, left, right], axis=1)[stop])
+        go = ~stop
+        lo, hi = np.concatenate([lo[go], mid[go]]), np.concatenate([mid[go], hi[go]])
+        f_lo, f_hi = np.concatenate([f_lo[go], f_mid[go]]), np.concatenate([f_mid[go], f_hi[go]])
+    done = np.concatenate(done)
+    done = done[np.argsort(done[:, 0])]
+    t = np.concatenate([[0.], done[:, 1:3].ravel()])
+    # running sum in t order, as gmsh accumulates it
+    p = np.cumsum(np.concatenate([[0.], done[:, 3:5].ravel()]))
+    d = np.arange(1, n - 1) * (p[-1] / (n - 1))
+    k = np.searchsorted(p, d, side="left")
+    s = t[k - 1] + (t[k] - t[k - 1]) / (p[k] - p[k - 1]) * (d - p[k - 1])
+    return np.concatenate([[0.], s, [1.]])
+
+
+def curve_params(n, kind="Progression", coef=1.0):
+    """
+    Normalized positions in [0, 1] of the n nodes of a transfinite curve
+    """
+    if kind == "Progression":
+        if abs(coef) == 1.0 or n < 3:
+            return np.arange(n, dtype=float) / (n - 1)
+        return progression_params(n, coef)
+    if kind == "Bump":
+        # gmsh bump density 1 / (1 + 4 (coef - 1) u^2), u in [-1/2, 1/2],
+        # integrated analytically and inverted at equally spaced values
+        s = np.linspace(-1., 1., n)
+        if coef < 1.:
+            a = 2. * np.sqrt(1. - coef)
+            t = np.tanh(s * np.arctanh(a / 2.)) / a
+        elif coef > 1.:
+            a = 2. * np.sqrt(coef - 1.)
+            t = np.tan(s * np.arctan(a / 2.)) / a
+        else:
+            t = s / 2.
+        t = t + 0.5
+        t[0], t[-1] = 0., 1.
+        return t
+    raise ValueError(f"unsupported transfinite distribution {kind}")
+
+
+def curve_nodes(a, b, n, kind="Progression", coef=1.0):
+    # nodes of the straight curve a -> b
+    t = curve_params(n, kind, coef)[:, None]
+    return (1. - t) * np.asarray(a, dtype=float) + t * np.asarray(b, dtype=float)
+
+
+def arc_fraction(x):
+    # normalized cumulative length along a polyline, like gmsh's lengths_i
+    d = np.sqrt(np.sum(np.diff(x, axis=0)**2, axis=1))
+    s = np.concatenate([[0.], np.cumsum(d)])
+    return s / s[-1]
+
+
+def block_grid(bottom, right, top, left, rows=slice(None)):
+    """
+    Transfinite interpolation of a four-sided block, as in gmsh's
+    meshGFaceTransfinite: bottom/top run left to right (ni nodes), left/right
+    bottom to top (nj nodes). u comes from the bottom side, v from the right
+    side. Returns (ni, nj, dim) with the boundary copied from the sides, or
+    only the rows i selected by the slice rows
+    """
+    return coons(arc_fraction(bottom), arc_fraction(right), bottom, right, top, left, rows)
+
+
+def coons(u, v, bottom, right, top, left, rows=slice(None)):
+    # the interpolation of block_grid at given parameters u (ni,) and v (nj,)
+    u = u[rows, None, None]
+    v = v[None, :, None]
+    p00, p10, p11, p01 = bottom[0], bottom[-1], top[-1], top[0]
+    b, t = bottom[rows], top[rows]
+    x = ((1. - u) * left[None] + u * right[None]
+         + (1. - v) * b[:, None] + v * t[:, None]
+         - ((1. - u) * (1. - v) * p00 + u * (1. - v) * p10
+            + u * v * p11 + (1. - u) * v * p01))
+    x[:, 0], x[:, -1] = b, t
+    i = np.arange(bottom.shape[0])[rows]
+    x[i == 0, :], x[i == bottom.shape[0] - 1, :] = left, right
+    return x
+
+
+def fill_block(xyz, offset, sides, a, b):
+    # interior rows a..b-1 of a block whose interior nodes start at offset,
+    # j fastest, written straight into xyz
+    nj = sides[1].shape[0]
+    x = block_grid(*sides, rows=slice(a, b))
+    start = offset + (a - 1) * (nj - 2)
+    xyz[start:start + (b - a) * (nj - 2), :2] = x[:, 1:-1].reshape(-1, 2)
+
+
+# node array shared with forked workers, see StructuredGrid
+_shared = None
+
+
+def _fill_shared(offset, sides, a, b):
+    fill_block(_shared, offset, sides, a, b)
+
+
+def inlet_topology(g):
+    """
+    Points, curves, surfaces and physical groups of the structured inlet for
+    a layout dict of inlet-structured.py or inlet-structured-two.py, listed in
+    the order the scripts create them (entity tag = position + 1).
+
+    curves: name -> (start point, end point, nodes, kind, coef)
+    surfaces: name -> (bottom, right, top, left, corners); each side is
+    (curve, reversed) oriented left to right / bottom to top
+    """
+    two = "ny_bottom" in g
+    ny_b = g["ny_bottom"] if two else g["ny_wall"]
+    ny_t = g["ny_top"] if two else g["ny_far"]
+    wall = ("Progression", g["bottom_progression"] if two else g["wall_progression"])
+    far = ("Progression", g["top_progression"] if two else g["far_progression"])
+    cowl = far if two else ("Progression", g["cowl_progression"])
+    bump = ("Bump", g["throat_bump"])
+    flat = ("Progression", 1.0)
+    xs, xr, xk = g["x_start"], g["x_ramp_start"], g["x_kink"]
+    xt, xc, xe = g["x_throat_start"], g["x_cowl_tip"], g["x_end"]
+    ys, h = g["y_split"], g["domain_height"]
+
+    points = {
+        "p1": (xs, 0.), "p5": (xr, 0.), "p6": (xk, g["kink_height"]),
+        "p7": (xt, g["ramp_height"]), "p8": (xe, g["ramp_height"]),
+        "p17": (xs, ys), "p18": (xr, ys), "p19": (xk, ys), "p9": (xt, ys),
+        "p12": (xc, g["intake_height"]), "p11": (xe, g["intake_height"]),
+        "p10": (xe, ys),
+        "p4": (xs, h), "p13": (xr, h), "p14": (xk, h), "p15": (xt, h),
+        "p16": (xc, h), "p3": (xe, h),
+    }
+    nx = {"1": g["nx_1"], "2": g["nx_2"], "3": g["nx_3"],
+          "throat": g["nx_throat"], "cowl": g["nx_cowl"], "wake": g["nx_wake"]}
+    curves = {
+        "l_bottom": ("p1", "p5", nx["1"]) + flat,
+        "l_wall_1": ("p5", "p6", nx["2"]) + flat,
+        "l_wall_2": ("p6", "p7", nx["3"]) + flat,
+        "l_throat_bot": ("p7", "p8", nx["throat"]) + flat,
+        "l_mid_1": ("p17", "p18", nx["1"]) + flat,
+        "l_mid_2": ("p18", "p19", nx["2"]) + flat,
+        "l_mid_3": ("p19", "p9", nx["3"]) + flat,
+        "l_throat_top": ("p10", "p9", nx["throat"]) + flat,
+        "l_cowl_top": ("p9", "p12", nx["cowl"]) + flat,
+        "l_cowl_back": ("p12", "p11", nx["wake"]) + flat,
+        "l_top_1": ("p4", "p13", nx["1"]) + flat,
+        "l_top_2": ("p13", "p14", nx["2"]) + flat,
+        "l_top_3": ("p14", "p15", nx["3"]) + flat,
+        "l_top_4": ("p15", "p16", nx["cowl"]) + flat,
+        "l_top_5": ("p16", "p3", nx["wake"]) + flat,
+        "l_inlet_bot": ("p1", "p17", ny_b) + wall,
+        "l_inlet_top": ("p17", "p4", ny_t) + far,
+        "l_v1_bot": ("p5", "p18", ny_b) + wall,
+        "l_v1_top": ("p18", "p13", ny_t) + far,
+        "l_v2_bot": ("p6", "p19", ny_b) + wall,
+        "l_v2_top": ("p19", "p14", ny_t) + far,
+        "l_throat_inlet": ("p7", "p9", ny_b) + bump,
+        "l_v3": ("p9", "p15", ny_t) + far,
+        "l_v4": ("p12", "p16", ny_t) + cowl,
+        "l_out_int": ("p8", "p10", ny_b) + bump,
+        "l_out_ext": ("p11", "p3", ny_t) + cowl,
+    }
+
+    def side(name, rev=False):
+        return (name, rev)
+
+    blocks = {
+        "s1_b": (side("l_bottom"), side("l_v1_bot"), side("l_mid_1"), side("l_inlet_bot"),
+                 ("p1", "p5", "p18", "p17")),
+        "s2_b": (side("l_wall_1"), side("l_v2_bot"), side("l_mid_2"), side("l_v1_bot"),
+                 ("p5", "p6", "p19", "p18")),
+        "s3_b": (side("l_wall_2"), side("l_throat_inlet"), side("l_mid_3"), side("l_v2_bot"),
+                 ("p6", "p7", "p9", "p19")),
+        "s4": (side("l_throat_bot"), side("l_out_int"), side("l_throat_top", True),
+               side("l_throat_inlet"), ("p7", "p8", "p10", "p9")),
+        "s1_t": (side("l_mid_1"), side("l_v1_top"), side("l_top_1"), side("l_inlet_top"),
+                 ("p17", "p18", "p13", "p4")),
+        "s2_t": (side("l_mid_2"), side("l_v2_top"), side("l_top_2"), side("l_v1_top"),
+                 ("p18", "p19", "p14", "p13")),
+        "s3_t": (side("l_mid_3"), side("l_v3"), side("l_top_3"), side("l_v2_top"),
+                 ("p19", "p9", "p15", "p14")),
+        "s5": (side("l_cowl_top"), side("l_v4"), side("l_top_4"), side("l_v3"),
+               ("p9", "p12", "p16", "p15")),
+        "s6": (side("l_cowl_back"), side("l_out_ext"), side("l_top_5"), side("l_v4"),
+               ("p12", "p11", "p3", "p16")),
+    }
+    order = (["s1_b", "s2_b", "s3_b", "s4", "s1_t", "s2_t", "s3_t", "s5", "s6"] if two
+             else ["s1_b", "s1_t", "s2_b", "s2_t", "s3_b", "s3_t", "s4", "s5", "s6"])
+    surfaces = {name: blocks[name] for name in order}
+
+    physicals = {
+        (2, "fluid"): list(surfaces),
+        (1, "inlet"): ["l_inlet_bot", "l_inlet_top"],
+        (1, "outlet"): ["l_out_int", "l_out_ext"],
+        (1, "top"): ["l_top_1", "l_top_2", "l_top_3", "l_top_4", "l_top_5"],
+    }
+    walls = ["l_wall_1", "l_wall_2", "l_throat_bot", "l_throat_top", "l_cowl_top",
+             "l_cowl_back"]
+    if two:
+        physicals[(1, "bottom")] = ["l_bottom"]
+    else:
+        walls = ["l_bottom"] + walls
+    physicals[(1, "wall")] = walls
+    return points, curves, surfaces, physicals
+
+
+class StructuredGrid:
+    """
+    Node coordinates and per-entity numbering of a multi-block grid
+
+    xyz: (num_nodes, 3) coordinates, row k holds node tag k + 1
+    curve_ids[name]: (n,) node indices along the curve from start to end
+    block_ids[name]: (ni, nj) node indices of the block
+
+    With workers > 1 the curves are still discretized once in this process;
+    the block interiors are then cut into row ranges and interpolated by
+    forked workers writing into a shared anonymous mapping that backs xyz.
+    Blocks only read the curve nodes and write disjoint rows, so interface
+    nodes are shared by index and the result is identical to workers=1.
+    The speedup over workers is unmeasured: only identical output has been
+    checked so far, on a single core (see bench_parallel.py).
+    """
+
+    def __init__(self, points, curves, surfaces, physicals, dtype=np.float64,
+                 workers=1):
+        self.points, self.curves = points, curves
+        self.surfaces, self.physicals = surfaces, physicals
+
+        num_nodes, offsets = self._number()
+        if workers > 1:
+            size = num_nodes * 3 * np.dtype(dtype).itemsize
+            self.xyz = np.frombuffer(mmap.mmap(-1, max(size, 1)), dtype=dtype,
+                                     count=num_nodes * 3).reshape(num_nodes, 3)
+        else:
+            self.xyz = np.zeros((num_nodes, 3), dtype=dtype)
+
+        for k, xy in enumerate(points.values()):
+            self.xyz[k, :2] = xy
+        for name, (a, b, n, kind, coef) in curves.items():
+            x = curve_nodes(points[a], points[b], n, kind, coef)
+            self.xyz[self.curve_ids[name][1:-1], :2] = x[1:-1]
+
+        tasks = []
+        for name, (bottom, right, top, left, _) in surfaces.items():
+            sides = [self.xyz[self.side_ids(s), :2] for s in (bottom, right, top, left)]
+            tasks.append((offsets[name], sides, 1, self.size(name)[0] - 1))
+
+        if workers > 1:
+            self._fill_parallel(tasks, workers)
+        else:
+            for task in tasks:
+                fill_block(self.xyz, *task)
+
+    def _number(self):
+        # gmsh numbering: points, curve interiors, block interiors (j fastest),
+        # all in creation order; returns the node count and the first interior
+        # node of every block
+        point_ids = {name: k for k, name in enumerate(self.points)}
+        offset = len(self.points)
+        self.curve_ids = {}
+        for name, (a, b, n, _, _) in self.curves.items():
+            ids = np.empty(n, dtype=np.int64)
+            ids[0], ids[-1] = point_ids[a], point_ids[b]
+            ids[1:-1] = np.arange(offset, offset + n - 2)
+            self.curve_ids[name] = ids
+            offset += n - 2
+
+        self.block_ids, offsets = {}, {}
+        for name, (bottom, right, top, left, _) in self.surfaces.items():
+            ni, nj = self.size(name)
+            ids = np.empty((ni, nj), dtype=np.int64)
+            ids[:, 0] = self.side_ids(bottom)
+            ids[:, -1] = self.side_ids(top)
+            ids[0, :] = self.side_ids(left)
+            ids[-1, :] = self.side_ids(right)
+            count = (ni - 2) * (nj - 2)
+            ids[1:-1, 1:-1] = np.arange(offset, offset + count).reshape(ni - 2, nj - 2)
+            self.block_ids[name], offsets[name] = ids, offset
+            offset += count
+        return offset, offsets
+
+    def coarsen(self, stride=2):
+        """
+        Grid made of every stride-th node of every curve and block, numbered
+        like a fresh gmsh mesh of the coarse counts. Every curve must have a
+        multiple of stride segments. Returns (grid, node_map, cell_map):
+        node_map[k] is the node of self at coarse node k, cell_map[e] the
+        stride**2 quads of self (indices into all_quads) covering coarse quad e
+        """
+        curves = {}
+        for name, (a, b, n, kind, coef) in self.curves.items():
+            if (n - 1) % stride:
+                raise ValueError(f"{name}: {n - 1} segments are not divisible by {stride}")
+            curves[name] = (a, b, (n - 1) // stride + 1, kind, coef)
+
+        coarse = StructuredGrid.__new__(StructuredGrid)
+        # the curves keep their distribution parameters for reference only:
+        # coarse node positions are the subsample, not a redistribution
+        coarse.points, coarse.curves = self.points, curves
+        coarse.surfaces, coarse.physicals = self.surfaces, self.physicals
+        num_nodes, _ = coarse._number()
+        node_map = np.empty(num_nodes, dtype=np.int64)
+        for name, ids in coarse.curve_ids.items():
+            node_map[ids] = self.curve_ids[name][::stride]
+        for name, ids in coarse.block_ids.items():
+            node_map[ids] = self.block_ids[name][::stride, ::stride]
+        coarse.xyz = self.xyz[node_map]
+
+        cell_map, offset = [], 0
+        for name in self.surfaces:
+            ni, nj = self.size(name)
+            cells = offset + np.arange((ni - 1) * (nj - 1)).reshape(ni - 1, nj - 1)
+            ci, cj = (ni - 1) // stride, (nj - 1) // stride
+            # (ci, stride, cj, stride) -> (ci, cj, stride * stride)
+            cells = cells.reshape(ci, stride, cj, stride).transpose(0, 2, 1, 3)
+            cell_map.append(cells.reshape(ci * cj, stride * stride))
+            offset += (ni - 1) * (nj - 1)
+        return coarse, node_map, np.concatenate(cell_map)
+
+    def _fill_parallel(self, tasks, workers):
+        global _shared
+        # a few row ranges per worker so the large blocks are split up too
+        total = sum((b - a) * (s[1].shape[0] - 2) for _, s, a, b in tasks)
+        target = max(1, total // (4 * workers))
+        chunks = []
+        for offset, sides, a, b in tasks:
+            rows = max(1, target // max(1, sides[1].shape[0] - 2))
+            chunks += [(offset, sides, i, min(i + rows, b)) for i in range(a, b, rows)]
+        _shared = self.xyz
+        try:
+            with ProcessPoolExecutor(workers, mp_context=get_context("fork")) as pool:
+                for f in [pool.submit(_fill_shared, *c) for c in chunks]:
+                    f.result()
+        finally:
+            _shared = None
+
+    def size(self, surface):
+        bottom, right = self.surfaces[surface][:2]
+        return self.curves[bottom[0]][2], self.curves[right[0]][2]
+
+    def side_ids(self, side):
+        name, rev = side
+        ids = self.curve_ids[name]
+        return ids[::-1] if rev else ids
+
+    def block(self, name):
+        # (ni, nj, 3) coordinates of one block
+        return self.xyz[self.block_ids[name]]
+
+    def quads(self, name):
+        # (ni - 1) * (nj - 1) quads of one block, counter-clockwise, 0-based
+        ids = self.block_ids[name]
+        return np.stack([ids[:-1, :-1], ids[1:, :-1], ids[1:, 1:], ids[:-1, 1:]],
+                        axis=-1).reshape(-1, 4)
+
+    def lines(self, name):
+        ids = self.curve_ids[name]
+        return np.stack([ids[:-1], ids[1:]], axis=-1)
+
+    def all_quads(self):
+        return np.concatenate([self.quads(s) for s in self.surfaces])
+
+    def num_cells(self):
+        return sum((ni - 1) * (nj - 1) for ni, nj in map(self.size, self.surfaces))
+
+
+def inlet_grid(g, dtype=np.float64, workers=1):
+    """StructuredGrid of the structured inlet for a layout dict"""
+    return StructuredGrid(*inlet_topology(g), dtype=dtype, workers=workers)